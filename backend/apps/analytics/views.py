@@ -4,14 +4,13 @@ from django.utils import timezone
 from datetime import datetime, timedelta
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
-from pymongo import MongoClient
-from django.conf import settings
+
+from apps.logs.cache import cached_view
+from apps.logs.mongo import get_db
+from apps.logs.repository import logs_collection
 
 def get_mongo_client():
-    db_config = settings.DATABASES['default']['CLIENT']
-    client = MongoClient(db_config['host'])
-    db = client[settings.DATABASES['default']['NAME']]
-    return db
+    return get_db()
 
 @swagger_auto_schema(
     method='get',
@@ -36,13 +35,14 @@ def get_mongo_client():
     }
 )
 @api_view(['GET'])
+@cached_view(60)
 def get_security_trends(request):
     """
     Get security trends and analytics data
     """
     try:
-        db = get_mongo_client()
-        db_table = db['logs']
+        # The logs collection, or the router over its time partitions with LOG_PARTITIONING
+        db_table = logs_collection()
         
         days = int(request.GET.get('days', 7))
         start_date = timezone.now() - timedelta(days=days)
@@ -147,31 +147,27 @@ def get_security_trends(request):
     }
 )
 @api_view(['GET'])
+@cached_view(60)
 def get_geographic_data(request):
     """
     Get geographic distribution of attacks
     """
     try:
-        db = get_mongo_client()
-        db_table = db['logs']
-        
-        # Get attacks by country with coordinates (simplified mapping)
-        country_coords = {
-            'China': {'lat': 35.0, 'lng': 105.0},
-            'United States': {'lat': 39.8, 'lng': -98.5},
-            'Russia': {'lat': 61.5, 'lng': 105.3},
-            'India': {'lat': 20.6, 'lng': 78.9},
-            'Germany': {'lat': 51.2, 'lng': 10.4},
-            'United Kingdom': {'lat': 55.4, 'lng': -3.4},
-            'France': {'lat': 46.6, 'lng': 2.2},
-            'Brazil': {'lat': -14.2, 'lng': -51.9},
-            'Canada': {'lat': 56.1, 'lng': -106.3},
-            'Australia': {'lat': -25.3, 'lng': 133.8},
-        }
+        # The logs collection, or the router over its time partitions with LOG_PARTITIONING
+        db_table = logs_collection()
         
+        # country and coordinates are stored at ingest by GeoIPEnricher. Only fields of
+        # the {country, latitude, longitude} index are read, so the scan is index-only
         pipeline = [
-            {'$match': {'country': {'$ne': None}}},
-            {'$group': {'_id': '$country', 'count': {'$sum': 1}}},
+            {'$match': {'country': {'$type': 'string'}}},
+            {'$project': {'_id': 0, 'country': 1, 'latitude': 1, 'longitude': 1}},
+            {'$group': {
+                '_id': '$country',
+                'count': {'$sum': 1},
+                # Centre of the located sources in the country
+                'lat': {'$avg': '$latitude'},
+                'lng': {'$avg': '$longitude'},
+            }},
             {'$sort': {'count': -1}},
             {'$limit': 20}
         ]
@@ -180,12 +176,10 @@ def get_geographic_data(request):
         
         attacks_by_country = []
         for item in country_data:
-            country = item['_id']
-            coords = country_coords.get(country, {'lat': 0, 'lng': 0})
             attacks_by_country.append({
-                'country': country,
-                'lat': coords['lat'],
-                'lng': coords['lng'],
+                'country': item['_id'],
+                'lat': round(item['lat'], 1) if item['lat'] is not None else 0,
+                'lng': round(item['lng'], 1) if item['lng'] is not None else 0,
                 'count': item['count']
             })
         
@@ -216,13 +210,14 @@ def get_geographic_data(request):
     }
 )
 @api_view(['GET'])
+@cached_view(5, stale=5)
 def get_realtime_activity(request):
     """
     Get real-time security activity
     """
     try:
         db = get_mongo_client()
-        db_table = db['logs']
+        db_table = logs_collection()
         alerts_db_table = db['alerts']
         
         # Logs in the last minute
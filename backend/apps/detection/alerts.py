@@ -0,0 +1,45 @@
+from datetime import datetime
+
+
+def build_alert(rule_name, title, description, severity, related_logs=None,
+                source_ips=None, affected_hosts=None, tags=None,
+                first_seen=None, last_seen=None, log_count=None):
+    """
+    Build an alert document matching the `alerts` collection (see logs.models.Alert).
+
+    Detectors return these dicts; the caller decides where and how to insert them.
+    """
+    now = datetime.now()
+    related_logs = [str(log_id) for log_id in (related_logs or [])]
+    return {
+        'rule_name': rule_name,
+        'title': title,
+        'description': description,
+        'severity': severity,
+        'status': 'open',
+        'related_logs': related_logs,
+        'log_count': log_count or max(len(related_logs), 1),
+        'source_ips': list(source_ips or []),
+        'affected_hosts': list(affected_hosts or []),
+        'tags': list(tags or []),
+        'first_seen': first_seen or now,
+        'last_seen': last_seen or first_seen or now,
+        'created_at': now,
+        'resolved_at': None,
+        'assigned_to': None,
+        'notes': '',
+    }
+
+
+def save_alerts(collection, alerts, dedupe_fields=('rule_name', 'title', 'first_seen')):
+    """
+    Upsert alerts keyed on `dedupe_fields` so re-running a detector over the
+    same window does not raise the same alert twice. Returns the number inserted.
+    """
+    inserted = 0
+    for alert in alerts:
+        key = {field: alert[field] for field in dedupe_fields}
+        result = collection.update_one(key, {'$setOnInsert': alert}, upsert=True)
+        if result.upserted_id is not None:
+            inserted += 1
+    return inserted
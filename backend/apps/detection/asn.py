@@ -0,0 +1,227 @@
+"""
+ASN / ISP lookups for the ingest path.
+
+The range table (GeoLite2-ASN .mmdb, or a CSV of networks or start/end
+addresses) is loaded into NumPy arrays of range starts and ends sorted by start,
+with the ASN and an index into the organisation names alongside. Ranges are
+disjoint, as in GeoLite2-ASN, so the range holding an address is the last one
+starting at or before it, and a whole batch of IPv4 addresses is resolved with
+one `searchsorted` call. IPv6 ranges need 128-bit keys, which NumPy lacks, and
+are searched with `bisect` over Python ints instead.
+
+Reloads build a new immutable table and swap the reference in one assignment.
+"""
+import bisect
+import csv
+import ipaddress
+import logging
+import os
+import socket
+import threading
+from collections import namedtuple
+
+import numpy as np
+
+from .events import present
+
+logger = logging.getLogger(__name__)
+
+Provider = namedtuple('Provider', ['asn', 'isp'])
+
+CSV_NETWORK_COLUMNS = ('network', 'cidr', 'prefix')
+CSV_START_COLUMNS = ('start_ip', 'range_start', 'start')
+CSV_END_COLUMNS = ('end_ip', 'range_end', 'end')
+CSV_ASN_COLUMNS = ('autonomous_system_number', 'asn')
+CSV_ISP_COLUMNS = ('autonomous_system_organization', 'isp', 'organization', 'org', 'provider')
+
+
+def _column(header, names):
+    return next((header.index(name) for name in names if name in header), None)
+
+
+def _asn(value):
+    value = str(value or '').strip().upper()
+    if value.startswith('AS'):
+        value = value[2:]
+    return int(value) if value.isdigit() else 0
+
+
+def read_csv_ranges(path):
+    """Yield (start, end, version, asn, isp) from a CSV with a header row."""
+    with open(path, newline='', encoding='utf-8') as f:
+        rows = [row for row in csv.reader(f) if row and not row[0].lstrip().startswith('#')]
+    if not rows:
+        return
+    header = [column.strip().lower() for column in rows[0]]
+    network_col = _column(header, CSV_NETWORK_COLUMNS)
+    start_col, end_col = _column(header, CSV_START_COLUMNS), _column(header, CSV_END_COLUMNS)
+    asn_col, isp_col = _column(header, CSV_ASN_COLUMNS), _column(header, CSV_ISP_COLUMNS)
+    if network_col is None and (start_col is None or end_col is None):
+        raise ValueError(f'{path} needs a network column or start_ip/end_ip columns')
+
+    def cell(row, col):
+        return row[col].strip() if col is not None and col < len(row) else ''
+
+    for row in rows[1:]:
+        try:
+            if network_col is not None:
+                network = ipaddress.ip_network(cell(row, network_col), strict=False)
+                start, end = network.network_address, network.broadcast_address
+            else:
+                start, end = ipaddress.ip_address(cell(row, start_col)), ipaddress.ip_address(cell(row, end_col))
+        except ValueError:
+            continue
+        if start.version != end.version or start > end:
+            continue
+        yield int(start), int(end), start.version, _asn(cell(row, asn_col)), cell(row, isp_col)
+
+
+def read_mmdb_ranges(path):
+    """Yield (start, end, version, asn, isp) for every network in a GeoLite2-ASN database."""
+    import maxminddb  # installed with geoip2
+
+    with maxminddb.open_database(path) as reader:
+        for network, record in reader:
+            if not record:
+                continue
+            yield (
+                int(network.network_address), int(network.broadcast_address), network.version,
+                record.get('autonomous_system_number') or 0, record.get('autonomous_system_organization') or '',
+            )
+
+
+def read_ranges(path):
+    if path.endswith('.mmdb'):
+        return read_mmdb_ranges(path)
+    return read_csv_ranges(path)
+
+
+class _V4Ranges:
+    def __init__(self, ranges):
+        ranges.sort()
+        self.starts = np.array([r[0] for r in ranges], dtype=np.uint32)
+        self.ends = np.array([r[1] for r in ranges], dtype=np.uint32)
+        self.providers = np.array([r[2] for r in ranges], dtype=np.int32)
+
+    def lookup_many(self, addresses):
+        """Provider index per address (a uint32 array), -1 where no range holds it."""
+        if not len(self.starts):
+            return np.full(len(addresses), -1, dtype=np.int32)
+        i = np.searchsorted(self.starts, addresses, side='right') - 1
+        safe = np.maximum(i, 0)
+        found = (i >= 0) & (self.ends[safe] >= addresses)
+        return np.where(found, self.providers[safe], -1)
+
+
+class _V6Ranges:
+    def __init__(self, ranges):
+        ranges.sort()
+        self.starts = [r[0] for r in ranges]
+        self.ends = [r[1] for r in ranges]
+        self.providers = [r[2] for r in ranges]
+
+    def lookup(self, address):
+        i = bisect.bisect_right(self.starts, address) - 1
+        return self.providers[i] if i >= 0 and self.ends[i] >= address else -1
+
+
+class ASNTable:
+    """Immutable table over one load of the range file."""
+
+    def __init__(self, entries=()):
+        providers = {}
+        v4, v6 = [], []
+        for start, end, version, asn, isp in entries:
+            # Organisation names repeat across thousands of ranges; store each once
+            provider = providers.setdefault((asn, isp), len(providers))
+            (v4 if version == 4 else v6).append((start, end, provider))
+        self.providers = [Provider(asn or None, isp or None) for asn, isp in providers]
+        self.v4 = _V4Ranges(v4)
+        self.v6 = _V6Ranges(v6)
+
+    def __len__(self):
+        return len(self.v4.starts) + len(self.v6.starts)
+
+    @classmethod
+    def from_file(cls, path):
+        return cls(read_ranges(path))
+
+    def lookup_many(self, ips):
+        """Resolve a list of IP strings to Providers (None where unknown or invalid), in order."""
+        found = [None] * len(ips)
+        v4_positions, v4_packed = [], []
+        for position, ip in enumerate(ips):
+            if not isinstance(ip, str):
+                continue
+            if ':' in ip:
+                try:
+                    address = int.from_bytes(socket.inet_pton(socket.AF_INET6, ip), 'big')
+                except OSError:
+                    continue
+                provider = self.v6.lookup(address)
+                if provider >= 0:
+                    found[position] = self.providers[provider]
+                continue
+            try:
+                v4_packed.append(socket.inet_pton(socket.AF_INET, ip))
+            except OSError:
+                continue
+            v4_positions.append(position)
+        if v4_packed:
+            addresses = np.frombuffer(b''.join(v4_packed), dtype='>u4').astype(np.uint32)
+            for position, provider in zip(v4_positions, self.v4.lookup_many(addresses).tolist()):
+                if provider >= 0:
+                    found[position] = self.providers[provider]
+        return found
+
+    def lookup(self, ip):
+        return self.lookup_many([ip])[0]
+
+
+class ASNEnricher:
+    """
+    Stores the autonomous system and ISP of each log's SourceIP as SourceASN
+    and SourceISP. `enrich_many` resolves a whole ingest batch at once.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.table = ASNTable()
+        self._signature = None
+        self._reload_lock = threading.Lock()
+        if path:
+            self.reload()
+
+    def _file_signature(self):
+        if not self.path or not os.path.isfile(self.path):
+            return None
+        return os.path.getmtime(self.path), os.path.getsize(self.path)
+
+    def reload(self, force=True):
+        """Rebuild the table from the range file and swap it in. Safe to call from a worker thread."""
+        with self._reload_lock:
+            signature = self._file_signature()
+            if not force and signature == self._signature:
+                return False
+            table = ASNTable.from_file(self.path) if signature else ASNTable()
+            self.table = table
+            self._signature = signature
+        logger.info(f"Loaded {len(table)} ASN ranges from {self.path}")
+        return True
+
+    def reload_if_changed(self):
+        return self.reload(force=False)
+
+    def enrich_many(self, logs):
+        table = self.table
+        ips = [log.get('SourceIP') for log in logs]
+        for log, provider in zip(logs, table.lookup_many(ips)):
+            if provider is None:
+                continue
+            if provider.asn is not None:
+                log['SourceASN'] = provider.asn
+            if present(provider.isp):
+                log['SourceISP'] = provider.isp
+
+    def enrich(self, log):
+        self.enrich_many([log])
@@ -0,0 +1,155 @@
+"""
+Seasonal per-entity baselines for hourly event counts.
+
+An entity is a (ComputerName, AccountName, EventType) triple. The hour being
+scored is compared with the same hour-of-week in each of the previous `weeks`
+weeks (28 days by default), so Mongo only has to aggregate `weeks + 1` one-hour
+windows and all scoring is done with NumPy over every entity at once.
+"""
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from .alerts import build_alert
+
+RULE_NAME = 'baseline_hourly_volume'
+DEFAULT_WEEKS = 4
+DEFAULT_THRESHOLD = 4.0
+DEFAULT_MIN_COUNT = 10
+
+# TimeGenerated is stored either as a date or as 'YYYY-MM-DD HH:MM:SS +0300'
+TIME_STRING_FORMAT = '%Y-%m-%d %H:%M:%S +0300'
+HOUR_KEY_FORMAT = '%Y-%m-%d %H'
+# The receiver stores 'N/A' for logs without an account; older logs have no AccountName at all
+NO_ACCOUNT = 'N/A'
+
+
+def last_complete_hour(now=None):
+    now = now or datetime.now()
+    return now.replace(minute=0, second=0, microsecond=0) - timedelta(hours=1)
+
+
+def hour_windows(scored_hour, weeks=DEFAULT_WEEKS):
+    """
+    Return the start of each one-hour window, oldest first. The first `weeks`
+    windows are the history for this hour-of-week; the last one is scored.
+    """
+    scored_hour = scored_hour.replace(minute=0, second=0, microsecond=0)
+    return [scored_hour - timedelta(weeks=back) for back in range(weeks, -1, -1)]
+
+
+def build_pipeline(windows):
+    """Aggregation returning one count per entity per window, using the TimeGenerated index."""
+    ranges = []
+    for start in windows:
+        end = start + timedelta(hours=1)
+        ranges.append({'TimeGenerated': {'$gte': start, '$lt': end}})
+        ranges.append({'TimeGenerated': {
+            '$gte': start.strftime(TIME_STRING_FORMAT),
+            '$lt': end.strftime(TIME_STRING_FORMAT),
+        }})
+    return [
+        {'$match': {'$or': ranges}},
+        {'$group': {
+            '_id': {
+                'host': '$ComputerName',
+                'account': {'$ifNull': ['$AccountName', NO_ACCOUNT]},
+                'event_type': '$EventType',
+                'hour': {
+                    '$cond': {
+                        'if': {'$eq': [{'$type': '$TimeGenerated'}, 'date']},
+                        'then': {'$dateToString': {'format': HOUR_KEY_FORMAT, 'date': '$TimeGenerated'}},
+                        'else': {'$substr': ['$TimeGenerated', 0, 13]},
+                    }
+                },
+            },
+            'count': {'$sum': 1},
+        }},
+    ]
+
+
+def load_counts(collection, windows):
+    """
+    Run the hourly aggregation and return (entities, entity_idx, window_idx, counts),
+    where `entities` lists (host, account, event_type) keys in index order.
+    """
+    window_by_hour = {start.strftime(HOUR_KEY_FORMAT): i for i, start in enumerate(windows)}
+    entity_index = {}
+    entity_idx, window_idx, counts = [], [], []
+
+    for row in collection.aggregate(build_pipeline(windows), allowDiskUse=True):
+        key = row['_id']
+        window = window_by_hour.get(key.get('hour'))
+        if window is None:
+            continue
+        account = key.get('account')
+        entity = (key.get('host'), None if account == NO_ACCOUNT else account, key.get('event_type'))
+        entity_idx.append(entity_index.setdefault(entity, len(entity_index)))
+        window_idx.append(window)
+        counts.append(row['count'])
+
+    entities = list(entity_index)
+    return (
+        entities,
+        np.asarray(entity_idx, dtype=np.int64),
+        np.asarray(window_idx, dtype=np.int64),
+        np.asarray(counts, dtype=np.float64),
+    )
+
+
+def score(entity_idx, window_idx, counts, n_entities, weeks=DEFAULT_WEEKS):
+    """
+    Score the last window against the seasonal mean/variance of the previous `weeks`.
+
+    Hours with no events are absent from the sparse input and count as zero.
+    Variance is floored at the mean (and at 1) as a Poisson prior, so entities with
+    a flat history do not produce huge z-scores on a single extra event.
+    Returns (z, mean, std, current), each of length `n_entities`.
+    """
+    history = window_idx < weeks
+    scored = ~history
+
+    sums = np.bincount(entity_idx[history], weights=counts[history], minlength=n_entities)
+    sumsq = np.bincount(entity_idx[history], weights=counts[history] ** 2, minlength=n_entities)
+    current = np.bincount(entity_idx[scored], weights=counts[scored], minlength=n_entities)
+
+    mean = sums / weeks
+    var = np.maximum(sumsq / weeks - mean ** 2, 0.0)
+    std = np.sqrt(np.maximum(var, np.maximum(mean, 1.0)))
+    z = (current - mean) / std
+    return z, mean, std, current
+
+
+def detect(collection, scored_hour=None, weeks=DEFAULT_WEEKS,
+           threshold=DEFAULT_THRESHOLD, min_count=DEFAULT_MIN_COUNT):
+    """Return alert documents for every entity whose scored-hour count is an outlier."""
+    scored_hour = scored_hour or last_complete_hour()
+    windows = hour_windows(scored_hour, weeks)
+    entities, entity_idx, window_idx, counts = load_counts(collection, windows)
+    if not entities:
+        return []
+
+    z, mean, std, current = score(entity_idx, window_idx, counts, len(entities), weeks)
+    flagged = np.flatnonzero((z >= threshold) & (current >= min_count))
+
+    alerts = []
+    hour_start = windows[-1]
+    hour_end = hour_start + timedelta(hours=1)
+    for i in flagged[np.argsort(-z[flagged])]:
+        host, account, event_type = entities[i]
+        alerts.append(build_alert(
+            rule_name=RULE_NAME,
+            title=f"Unusual {event_type} volume for {account or 'unknown account'} on {host}",
+            description=(
+                f"{int(current[i])} {event_type} events between {hour_start:%Y-%m-%d %H:%M} and "
+                f"{hour_end:%H:%M}; baseline for this hour of week is {mean[i]:.1f} "
+                f"± {std[i]:.1f} over the last {weeks} weeks (z={z[i]:.1f})."
+            ),
+            severity='high' if z[i] >= 2 * threshold else 'medium',
+            affected_hosts=[host] if host else [],
+            tags=['anomaly', 'baseline', event_type] if event_type else ['anomaly', 'baseline'],
+            first_seen=hour_start,
+            last_seen=hour_end,
+            log_count=int(current[i]),
+        ))
+    return alerts
@@ -0,0 +1,79 @@
+"""
+Bloom filters for first-seen detection.
+
+ScalableBloomFilter follows Almeida et al. (2007): when a filter slice fills up
+a new one is added with twice the capacity and a tighter error rate, so the
+overall false-positive rate stays below the configured target however many
+values are added.
+"""
+import hashlib
+import math
+
+
+class BloomFilter:
+    def __init__(self, capacity, error_rate):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.num_bits = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self.count = 0
+        self.bits = bytearray((self.num_bits + 7) // 8)
+
+    def _positions(self, h1, h2):
+        # Enhanced double hashing (Dillinger & Manolios): k probes from two hashes
+        m = self.num_bits
+        return [(h1 + i * h2 + i * i) % m for i in range(self.num_hashes)]
+
+    def contains(self, h1, h2):
+        bits = self.bits
+        for pos in self._positions(h1, h2):
+            if not bits[pos >> 3] & (1 << (pos & 7)):
+                return False
+        return True
+
+    def add(self, h1, h2):
+        bits = self.bits
+        for pos in self._positions(h1, h2):
+            bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    @property
+    def is_full(self):
+        return self.count >= self.capacity
+
+
+class ScalableBloomFilter:
+    GROWTH = 2
+    TIGHTENING = 0.5
+
+    def __init__(self, initial_capacity=1024, error_rate=0.001):
+        self.initial_capacity = initial_capacity
+        self.error_rate = error_rate
+        self.filters = []
+
+    @staticmethod
+    def hashes(value):
+        digest = hashlib.blake2b(str(value).encode('utf-8'), digest_size=16).digest()
+        return int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little')
+
+    def __contains__(self, value):
+        h1, h2 = self.hashes(value)
+        return any(f.contains(h1, h2) for f in self.filters)
+
+    def __len__(self):
+        return sum(f.count for f in self.filters)
+
+    def add(self, value):
+        """Add `value`; return True if it was (probably) not seen before."""
+        h1, h2 = self.hashes(value)
+        if any(f.contains(h1, h2) for f in self.filters):
+            return False
+        if not self.filters or self.filters[-1].is_full:
+            index = len(self.filters)
+            # Slice error rates sum to at most `error_rate` (geometric series)
+            self.filters.append(BloomFilter(
+                self.initial_capacity * self.GROWTH ** index,
+                self.error_rate * (1 - self.TIGHTENING) * self.TIGHTENING ** index,
+            ))
+        self.filters[-1].add(h1, h2)
+        return True
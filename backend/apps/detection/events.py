@@ -0,0 +1,45 @@
+"""
+Helpers for reading fields off raw log documents as they arrive at ingest.
+
+Kept free of Django imports so the Fluent Bit receiver can use them directly.
+"""
+from datetime import datetime
+
+TIME_FORMATS = ('%Y-%m-%d %H:%M:%S %z', '%Y-%m-%d %H:%M:%S')
+
+LOGON_SUCCESS_EVENT_ID = 4624
+SERVICE_INSTALL_EVENT_ID = 7045
+
+
+def event_id(log):
+    """Return the EventID as an int, or None when it is missing or not numeric."""
+    try:
+        return int(log.get('EventID'))
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_time(value):
+    """Parse a TimeGenerated value (datetime or string) into an epoch timestamp in seconds."""
+    if isinstance(value, datetime):
+        return value.timestamp()
+    if not isinstance(value, str):
+        return None
+    for fmt in TIME_FORMATS:
+        try:
+            return datetime.strptime(value, fmt).timestamp()
+        except ValueError:
+            continue
+    try:
+        return datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp()
+    except ValueError:
+        return None
+
+
+def is_successful_logon(log):
+    return event_id(log) == LOGON_SUCCESS_EVENT_ID and log.get('EventType') != 'FailureAudit'
+
+
+def present(value):
+    """True for real field values; the receiver fills missing fields with 'N/A'."""
+    return value not in (None, '', 'N/A', '-')
@@ -0,0 +1,155 @@
+"""
+Process-wide GeoLite2 City lookups.
+
+The .mmdb file is opened once in MODE_MMAP and recent results are kept in an
+LRU cache, so a lookup on the ingest path costs a dict hit in the common case.
+When the file is replaced on disk (e.g. by a weekly GeoLite2 update), the next
+lookup after RELOAD_CHECK_SECONDS notices, opens the new file and drops the
+cached results. Without a readable file, get_reader fails fast until the next
+check instead of stat()ing the path on every lookup.
+
+The file is GEOIP_CITY_DB when set, else GeoLite2-City.mmdb in the GEOIP_PATH
+directory, read from Django settings when they are configured (the Fluent Bit
+receiver runs without them and reads the environment).
+"""
+import functools
+import ipaddress
+import logging
+import os
+import threading
+import time
+from collections import namedtuple
+
+import geoip2.database
+import geoip2.errors
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+DEFAULT_GEOIP_PATH = os.path.join(BACKEND_DIR, 'GeoLite2-City_20250528')
+DB_FILE = 'GeoLite2-City.mmdb'
+CACHE_SIZE = 65536
+# How often, at most, the .mmdb file is stat()ed for changes
+RELOAD_CHECK_SECONDS = 30
+
+Location = namedtuple('Location', ['country', 'city', 'latitude', 'longitude'])
+
+logger = logging.getLogger(__name__)
+
+_reader = None
+_reader_version = None
+_reader_error = None
+_next_check = 0.0
+_reader_lock = threading.Lock()
+
+
+def db_path():
+    if os.getenv('GEOIP_CITY_DB'):
+        return os.getenv('GEOIP_CITY_DB')
+    if os.getenv('GEOIP_PATH'):
+        return os.path.join(os.getenv('GEOIP_PATH'), DB_FILE)
+    directory = DEFAULT_GEOIP_PATH
+    try:
+        from django.conf import settings
+        if settings.configured:
+            directory = getattr(settings, 'GEOIP_PATH', directory)
+    except ImportError:
+        pass
+    return os.path.join(directory, DB_FILE)
+
+
+def _file_version(path):
+    stat = os.stat(path)
+    return stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+
+def get_reader():
+    """
+    Return the shared memory-mapped reader, opening it on first use and reopening it
+    when the file changes. Raises OSError while no file could be opened; the
+    failure is logged and re-raised without touching the disk until the next check.
+    """
+    global _reader, _reader_version, _reader_error, _next_check
+    if time.monotonic() < _next_check:
+        if _reader is not None:
+            return _reader
+        if _reader_error is not None:
+            raise _reader_error
+    with _reader_lock:
+        if time.monotonic() < _next_check:
+            if _reader is not None:
+                return _reader
+            if _reader_error is not None:
+                raise _reader_error
+        _next_check = time.monotonic() + RELOAD_CHECK_SECONDS
+        path = db_path()
+        try:
+            version = _file_version(path)
+        except OSError as e:
+            # Mid-replace, or removed: keep serving from the mapping we have
+            if _reader is not None:
+                return _reader
+            _reader_error = e
+            logger.warning(f"GeoIP database unavailable, retrying in {RELOAD_CHECK_SECONDS}s: {e}")
+            raise
+        _reader_error = None
+        if _reader is None or version != _reader_version:
+            reloading = _reader is not None
+            # The old reader is not closed: lookups in other threads may still be using it
+            _reader = geoip2.database.Reader(path, mode=geoip2.database.MODE_MMAP)
+            _reader_version = version
+            if reloading:
+                lookup.cache_clear()
+    return _reader
+
+
+@functools.lru_cache(maxsize=CACHE_SIZE)
+def lookup(ip):
+    """
+    Resolve an IP to a Location, or None for invalid, private/reserved or unknown
+    addresses. Results are cached, so callers must treat them as read-only.
+    """
+    try:
+        address = ipaddress.ip_address(ip)
+    except ValueError:
+        return None
+    if not address.is_global:
+        return None
+    try:
+        response = get_reader().city(ip)
+    except geoip2.errors.AddressNotFoundError:
+        return None
+    return Location(
+        country=response.country.name,
+        city=response.city.name,
+        latitude=response.location.latitude,
+        longitude=response.location.longitude,
+    )
+
+
+def lookup_many(ips):
+    """Resolve several IPs, each once; returns {ip: Location or None}."""
+    return {ip: lookup(ip) for ip in dict.fromkeys(ips)}
+
+
+class GeoIPEnricher:
+    """
+    Enricher storing the location of each log's SourceIP as country, city,
+    latitude and longitude, so the map aggregates stored fields.
+
+    Private and invalid addresses are rejected by `lookup` before the reader is
+    touched. Without a readable .mmdb file logs are stored without a location;
+    get_reader logs that once per RELOAD_CHECK_SECONDS.
+    """
+
+    def __init__(self, locate=lookup):
+        self.locate = locate
+
+    def enrich(self, log):
+        ip = log.get('SourceIP')
+        if not isinstance(ip, str):
+            return
+        try:
+            location = self.locate(ip)
+        except OSError:
+            return
+        if location is not None:
+            log.update((field, value) for field, value in location._asdict().items() if value is not None)
@@ -0,0 +1,246 @@
+"""
+Threat-intel IP/CIDR matching for the ingest path.
+
+Indicators are single addresses or CIDR blocks, so any two of them are either
+disjoint or nested. Each address family is stored as packed arrays of range starts
+and ends sorted by (start, -end), plus a parent pointer to the innermost enclosing
+range. A lookup is one binary search followed by at most a few parent hops.
+
+Feeds are read from CSV or STIX 2.x JSON files in a directory. Reloads build a
+new immutable index and swap the reference in one assignment, so ingest keeps
+matching against the previous index while a reload runs.
+"""
+import bisect
+import csv
+import ipaddress
+import json
+import logging
+import os
+import re
+import socket
+import threading
+from array import array
+from collections import namedtuple
+
+from .alerts import build_alert
+from .events import present
+
+logger = logging.getLogger(__name__)
+
+Indicator = namedtuple('Indicator', ['value', 'source', 'description'])
+
+CSV_VALUE_COLUMNS = ('indicator', 'ip', 'ip_address', 'value', 'network', 'cidr')
+CSV_DESCRIPTION_COLUMNS = ('description', 'threat', 'threat_type', 'tags', 'comment')
+STIX_PATTERN_RE = re.compile(r"(?:ipv4-addr|ipv6-addr):value\s*=\s*'([^']+)'")
+
+
+def _parse_network(value):
+    try:
+        return ipaddress.ip_network(value.strip(), strict=False)
+    except ValueError:
+        return None
+
+
+def read_csv_feed(path):
+    """Yield (network, Indicator) from a CSV with a header row or bare one-value-per-line."""
+    source = os.path.basename(path)
+    with open(path, newline='', encoding='utf-8') as f:
+        rows = [row for row in csv.reader(f) if row and not row[0].lstrip().startswith('#')]
+    if not rows:
+        return
+    header = [column.strip().lower() for column in rows[0]]
+    value_col = next((header.index(c) for c in CSV_VALUE_COLUMNS if c in header), None)
+    if value_col is None:
+        value_col, description_col = 0, None
+    else:
+        description_col = next((header.index(c) for c in CSV_DESCRIPTION_COLUMNS if c in header), None)
+        rows = rows[1:]
+    for row in rows:
+        network = _parse_network(row[value_col]) if value_col < len(row) else None
+        if network is None:
+            continue
+        description = row[description_col] if description_col is not None and description_col < len(row) else ''
+        yield network, Indicator(str(network), source, description)
+
+
+def read_stix_feed(path):
+    """Yield (network, Indicator) from the IP indicators and observables in a STIX 2.x bundle."""
+    source = os.path.basename(path)
+    with open(path, encoding='utf-8') as f:
+        bundle = json.load(f)
+    objects = bundle.get('objects', []) if isinstance(bundle, dict) else bundle
+    for obj in objects:
+        if obj.get('type') == 'indicator':
+            values = STIX_PATTERN_RE.findall(obj.get('pattern', ''))
+            description = obj.get('name') or obj.get('description') or ''
+        elif obj.get('type') in ('ipv4-addr', 'ipv6-addr'):
+            values = [obj.get('value', '')]
+            description = ''
+        else:
+            continue
+        for value in values:
+            network = _parse_network(value)
+            if network is not None:
+                yield network, Indicator(str(network), source, description)
+
+
+def read_feed(path):
+    if path.endswith('.json'):
+        return read_stix_feed(path)
+    return read_csv_feed(path)
+
+
+class _RangeTable:
+    """Sorted laminar ranges for one address family."""
+
+    def __init__(self, ranges, typecode=None):
+        # Outer ranges sort before the ranges they contain
+        ranges.sort(key=lambda r: (r[0], -r[1]))
+        self.indicators = [indicator for _, _, indicator in ranges]
+        starts = [start for start, _, _ in ranges]
+        ends = [end for _, end, _ in ranges]
+        parents = []
+        stack = []
+        for i, (start, end, _) in enumerate(ranges):
+            while stack and ends[stack[-1]] < start:
+                stack.pop()
+            parents.append(stack[-1] if stack else -1)
+            stack.append(i)
+
+        # IPv4 fits in packed unsigned 32-bit arrays; IPv6 needs Python ints
+        if typecode:
+            self.starts = array(typecode, starts)
+            self.ends = array(typecode, ends)
+        else:
+            self.starts = starts
+            self.ends = ends
+        self.parents = array('i', parents)
+
+    def __len__(self):
+        return len(self.indicators)
+
+    def lookup(self, ip):
+        """Return the innermost range containing `ip` as an index, or -1."""
+        i = bisect.bisect_right(self.starts, ip) - 1
+        while i >= 0 and self.ends[i] < ip:
+            i = self.parents[i]
+        return i
+
+    def matches(self, ip):
+        """Return every Indicator containing `ip`, innermost first."""
+        found = []
+        i = self.lookup(ip)
+        while i >= 0:
+            found.append(self.indicators[i])
+            i = self.parents[i]
+        return found
+
+
+class IOCIndex:
+    """Immutable index over one load of every feed."""
+
+    def __init__(self, entries=()):
+        v4, v6 = {}, {}
+        for network, indicator in entries:
+            table = v4 if network.version == 4 else v6
+            key = (int(network.network_address), int(network.broadcast_address))
+            # First feed to list a range wins; duplicates would break the laminar ordering
+            table.setdefault(key, indicator)
+        self.v4 = _RangeTable([(s, e, ind) for (s, e), ind in v4.items()], typecode='I')
+        self.v6 = _RangeTable([(s, e, ind) for (s, e), ind in v6.items()])
+
+    def __len__(self):
+        return len(self.v4) + len(self.v6)
+
+    @classmethod
+    def from_files(cls, paths):
+        def entries():
+            for path in paths:
+                try:
+                    yield from read_feed(path)
+                except Exception as e:
+                    logger.error(f"Could not read threat intel feed {path}: {e}")
+        return cls(entries())
+
+    def match(self, ip):
+        # inet_pton is several times faster than ipaddress.ip_address on the hot path
+        if not isinstance(ip, str):
+            return []
+        family, table = (socket.AF_INET6, self.v6) if ':' in ip else (socket.AF_INET, self.v4)
+        try:
+            packed = socket.inet_pton(family, ip)
+        except OSError:
+            return []
+        return table.matches(int.from_bytes(packed, 'big'))
+
+
+class ThreatIntelMatcher:
+    """
+    Tags logs whose SourceIP is in a loaded feed (as an enricher, before insert)
+    and raises an alert for them (as a detector, after insert).
+    """
+    rule_name = 'threat_intel_match'
+    FEED_EXTENSIONS = ('.csv', '.txt', '.json')
+
+    def __init__(self, feed_dir=None):
+        self.feed_dir = feed_dir
+        self.index = IOCIndex()
+        self._signature = None
+        self._reload_lock = threading.Lock()
+        if feed_dir:
+            self.reload()
+
+    def _feed_files(self):
+        if not self.feed_dir or not os.path.isdir(self.feed_dir):
+            return []
+        return sorted(
+            os.path.join(self.feed_dir, name) for name in os.listdir(self.feed_dir)
+            if name.lower().endswith(self.FEED_EXTENSIONS)
+        )
+
+    def _feed_signature(self, paths):
+        return tuple((path, os.path.getmtime(path), os.path.getsize(path)) for path in paths)
+
+    def reload(self, force=True):
+        """Rebuild the index from the feed directory and swap it in. Safe to call from a worker thread."""
+        with self._reload_lock:
+            paths = self._feed_files()
+            signature = self._feed_signature(paths)
+            if not force and signature == self._signature:
+                return False
+            index = IOCIndex.from_files(paths)
+            self.index = index
+            self._signature = signature
+        logger.info(f"Loaded {len(index)} threat intel indicators from {len(paths)} feeds")
+        return True
+
+    def reload_if_changed(self):
+        return self.reload(force=False)
+
+    def enrich(self, log):
+        ip = log.get('SourceIP')
+        if not present(ip):
+            return
+        matches = self.index.match(ip)
+        if matches:
+            log['ThreatIntel'] = [indicator._asdict() for indicator in matches]
+
+    def observe(self, log):
+        matches = log.get('ThreatIntel')
+        if not matches:
+            return []
+        innermost = matches[0]
+        host = log.get('ComputerName')
+        return [build_alert(
+            rule_name=self.rule_name,
+            title=f"Threat intel match for {log['SourceIP']}",
+            description=(
+                f"{log['SourceIP']} matches indicator {innermost['value']} from {innermost['source']}"
+                + (f": {innermost['description']}" if innermost['description'] else '.')
+            ),
+            severity='high',
+            related_logs=[log['_id']] if log.get('_id') else [],
+            source_ips=[log['SourceIP']],
+            affected_hosts=[host] if present(host) else [],
+            tags=['threat_intel'] + sorted({m['source'] for m in matches}),
+        )]
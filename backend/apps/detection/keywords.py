@@ -0,0 +1,114 @@
+"""
+Ingest-time keyword tagging of `Message` with an Aho-Corasick automaton.
+
+Analysts manage (keyword, tag) pairs in the `keyword_tags` collection. The
+automaton is compiled from all of them and scans each lowercased message once,
+however many keywords there are. Matched tag ids are stored on the log as
+`KeywordTags`, so searches query an indexed array field instead of `$regex`.
+"""
+import logging
+import threading
+from collections import deque
+
+from .events import present
+
+logger = logging.getLogger(__name__)
+
+KEYWORDS_COLLECTION = 'keyword_tags'
+
+
+class AhoCorasick:
+    """Case-insensitive multi-pattern matcher mapping each keyword to a tag id."""
+
+    def __init__(self, entries):
+        # Node i: goto[i] maps a character to a child node, fail[i] is the longest proper
+        # suffix that is also a trie path, output[i] holds the tags ending at i (fail chain included)
+        self.goto = [{}]
+        self.fail = [0]
+        self.output = [()]
+        for keyword, tag in entries:
+            self._insert(keyword.lower(), tag)
+        self._link()
+
+    def _insert(self, keyword, tag):
+        if not keyword:
+            return
+        node = 0
+        for char in keyword:
+            child = self.goto[node].get(char)
+            if child is None:
+                child = len(self.goto)
+                self.goto[node][char] = child
+                self.goto.append({})
+                self.fail.append(0)
+                self.output.append(())
+            node = child
+        if tag not in self.output[node]:
+            self.output[node] = self.output[node] + (tag,)
+
+    def _link(self):
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self.goto[node].items():
+                queue.append(child)
+                state = self.fail[node]
+                while state and char not in self.goto[state]:
+                    state = self.fail[state]
+                target = self.goto[state].get(char, 0)
+                self.fail[child] = target if target != child else 0
+                inherited = self.output[self.fail[child]]
+                if inherited:
+                    self.output[child] = self.output[child] + tuple(t for t in inherited if t not in self.output[child])
+
+    def __len__(self):
+        return len(self.goto)
+
+    def search(self, text):
+        """Return the set of tags whose keyword occurs anywhere in `text`."""
+        goto, fail, output = self.goto, self.fail, self.output
+        found = set()
+        node = 0
+        for char in text.lower():
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            if output[node]:
+                found.update(output[node])
+        return found
+
+
+class KeywordTagger:
+    """Enricher that tags each log's Message with the ids of matching keywords."""
+
+    def __init__(self, entries=()):
+        self._entries = frozenset()
+        self._lock = threading.Lock()
+        self.automaton = AhoCorasick(())
+        self.load(entries)
+
+    def load(self, entries):
+        """Compile a new automaton if the keyword list changed, then swap it in."""
+        entries = frozenset((keyword, tag) for keyword, tag in entries if keyword and tag)
+        with self._lock:
+            if entries == self._entries:
+                return False
+            automaton = AhoCorasick(sorted(entries))
+            self.automaton = automaton
+            self._entries = entries
+        logger.info(f"Compiled {len(entries)} keywords into {len(automaton)} automaton states")
+        return True
+
+    def load_from_collection(self, collection):
+        return self.load(
+            (doc.get('keyword'), doc.get('tag'))
+            for doc in collection.find({'enabled': {'$ne': False}}, {'keyword': 1, 'tag': 1})
+        )
+
+    def enrich(self, log):
+        message = log.get('Message')
+        if not present(message):
+            return
+        tags = self.automaton.search(message)
+        if tags:
+            log['KeywordTags'] = sorted(tags)
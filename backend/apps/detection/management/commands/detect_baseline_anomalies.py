@@ -0,0 +1,57 @@
+import time
+
+from dateutil.parser import parse as parse_date
+from django.core.management.base import BaseCommand
+
+from apps.detection import baseline
+from apps.detection.alerts import save_alerts
+from apps.logs.mongo import get_db
+from apps.logs.repository import logs_collection
+
+
+class Command(BaseCommand):
+    help = 'Flags hourly event-count outliers per ComputerName/AccountName/EventType against a seasonal baseline'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hour', help='Hour to score (ISO format); defaults to the last complete hour')
+        parser.add_argument('--weeks', type=int, default=baseline.DEFAULT_WEEKS,
+                            help='Weeks of history for the hour-of-week baseline')
+        parser.add_argument('--threshold', type=float, default=baseline.DEFAULT_THRESHOLD,
+                            help='z-score above which an entity is flagged')
+        parser.add_argument('--min-count', type=int, default=baseline.DEFAULT_MIN_COUNT,
+                            help='Ignore entities with fewer events than this in the scored hour')
+        parser.add_argument('--interval', type=int, default=0,
+                            help='Re-run every N seconds instead of exiting after one pass')
+        parser.add_argument('--dry-run', action='store_true', help='Print alerts without saving them')
+
+    def handle(self, *args, **options):
+        db = get_db()
+
+        while True:
+            self.run_once(db, options)
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
+
+    def run_once(self, db, options):
+        scored_hour = parse_date(options['hour']) if options['hour'] else None
+        started = time.perf_counter()
+        alerts = baseline.detect(
+            logs_collection(),
+            scored_hour=scored_hour,
+            weeks=options['weeks'],
+            threshold=options['threshold'],
+            min_count=options['min_count'],
+        )
+        elapsed = time.perf_counter() - started
+
+        if options['dry_run']:
+            for alert in alerts:
+                self.stdout.write(f"[{alert['severity']}] {alert['title']}: {alert['description']}")
+            inserted = 0
+        else:
+            inserted = save_alerts(db['alerts'], alerts)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Scored baseline in {elapsed:.2f}s: {len(alerts)} outliers, {inserted} new alerts'
+        ))
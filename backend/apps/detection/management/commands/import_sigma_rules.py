@@ -0,0 +1,80 @@
+import os
+from datetime import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.detection.sigma import SIGMA_CONDITION_TYPE, SigmaCache, SigmaError
+from apps.logs.mongo import get_collection
+from apps.logs.repository import ALERT_RULES
+
+SIGMA_EXTENSIONS = ('.yml', '.yaml')
+
+
+class Command(BaseCommand):
+    help = 'Imports Sigma YAML rules as alert rules evaluated at ingest and usable for hunting'
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='+', help='Sigma rule files or directories to scan recursively')
+        parser.add_argument('--inactive', action='store_true', help='Import rules disabled')
+        parser.add_argument('--dry-run', action='store_true', help='Compile rules without saving them')
+
+    def rule_files(self, paths):
+        for path in paths:
+            if os.path.isdir(path):
+                for root, _, names in os.walk(path):
+                    for name in sorted(names):
+                        if name.lower().endswith(SIGMA_EXTENSIONS):
+                            yield os.path.join(root, name)
+            elif os.path.isfile(path):
+                yield path
+            else:
+                raise CommandError(f'No such file or directory: {path}')
+
+    def handle(self, *args, **options):
+        rules_collection = get_collection(ALERT_RULES)
+        # Shared with the receiver, so it loads the imported rules without parsing their YAML again
+        cache = SigmaCache(settings.SIGMA_CACHE_PATH)
+
+        imported, failed = 0, 0
+        for path in self.rule_files(options['paths']):
+            with open(path, encoding='utf-8') as f:
+                text = f.read()
+            try:
+                rule = cache.compile(text)
+                # Compile the hunting query too so unsupported constructs are reported now
+                rule.mongo_query()
+            except SigmaError as e:
+                failed += 1
+                self.stdout.write(self.style.WARNING(f'Skipped {path}: {e}'))
+                continue
+
+            imported += 1
+            if options['dry_run']:
+                continue
+            now = datetime.now()
+            key = {'conditions.sigma_id': rule.id} if rule.id else {'conditions.hash': rule.hash}
+            rules_collection.update_one(key, {
+                '$set': {
+                    'name': rule.title,
+                    'description': rule.ir['description'],
+                    'conditions': {
+                        'type': SIGMA_CONDITION_TYPE,
+                        'sigma_id': rule.id,
+                        'hash': rule.hash,
+                        'yaml': text,
+                    },
+                    'severity_threshold': rule.severity,
+                    'is_active': not options['inactive'],
+                    'updated_at': now,
+                },
+                '$setOnInsert': {
+                    'frequency_limit': 1,
+                    'time_window': 300,
+                    'created_at': now,
+                    'created_by': 'sigma-import',
+                },
+            }, upsert=True)
+
+        cache.save()
+        self.stdout.write(self.style.SUCCESS(f'Imported {imported} Sigma rules ({failed} skipped)'))
@@ -0,0 +1,147 @@
+"""
+First-seen value detection backed by per-(device, field) scalable Bloom filters.
+
+Each lookup is a constant number of hash probes, so it runs on every ingested log
+instead of a Mongo `distinct` per check. Filters are pickled to disk every
+`persist_interval` seconds (a minute by default) and reloaded on start, so "first
+seen" survives receiver restarts.
+"""
+import logging
+import os
+import pickle
+import re
+import tempfile
+import time
+
+from .alerts import build_alert
+from .bloom import ScalableBloomFilter
+from .events import SERVICE_INSTALL_EVENT_ID, event_id, present
+
+logger = logging.getLogger(__name__)
+
+SERVICE_NAME_RE = re.compile(r'Service Name:\s*(.+?)(?:\s+Service File Name:|\s*\[|\s*$)')
+
+
+def service_name(log):
+    if event_id(log) != SERVICE_INSTALL_EVENT_ID:
+        return None
+    if present(log.get('ServiceName')):
+        return log['ServiceName']
+    match = SERVICE_NAME_RE.search(log.get('Message') or '')
+    return match.group(1) if match else None
+
+
+def source_ip(log):
+    return log.get('SourceIP') if present(log.get('SourceIP')) else None
+
+
+def account_source(log):
+    account, ip = log.get('AccountName'), log.get('SourceIP')
+    if present(account) and present(ip):
+        return f'{account}@{ip}'
+    return None
+
+
+# field name -> (value extractor, alert severity, human-readable label)
+TRACKED_FIELDS = {
+    'service_name': (service_name, 'high', 'service'),
+    'source_ip': (source_ip, 'low', 'source IP'),
+    'account_source': (account_source, 'medium', 'account/source IP pair'),
+}
+
+
+class RarityDetector:
+    """
+    Flag values never seen before on a device. A filter only raises alerts once it
+    is older than `learning_seconds`, so a fresh deployment learns the existing
+    estate instead of alerting on all of it.
+    """
+    rule_name = 'first_seen_value'
+
+    def __init__(self, state_path=None, error_rate=0.001, initial_capacity=1024,
+                 learning_seconds=24 * 3600, persist_interval=60, fields=TRACKED_FIELDS):
+        self.state_path = state_path
+        self.error_rate = error_rate
+        self.initial_capacity = initial_capacity
+        self.learning_seconds = learning_seconds
+        self.persist_interval = persist_interval
+        self.fields = fields
+        # (device, field) -> (created_at, ScalableBloomFilter)
+        self.filters = {}
+        self._dirty = False
+        self._persisted_at = time.time()
+        if state_path and os.path.exists(state_path):
+            self.load()
+
+    def _filter(self, device, field, now):
+        key = (device, field)
+        entry = self.filters.get(key)
+        if entry is None:
+            entry = (now, ScalableBloomFilter(self.initial_capacity, self.error_rate))
+            self.filters[key] = entry
+        return entry
+
+    def observe(self, log):
+        device = log.get('ComputerName')
+        if not present(device):
+            return []
+        alerts = []
+        now = time.time()
+        for field, (extract, severity, label) in self.fields.items():
+            value = extract(log)
+            if value is None:
+                continue
+            created_at, bloom = self._filter(device, field, now)
+            if not bloom.add(value):
+                continue
+            self._dirty = True
+            if now - created_at < self.learning_seconds:
+                continue
+            alerts.append(build_alert(
+                rule_name=self.rule_name,
+                title=f"First-seen {label} on {device}: {value}",
+                description=f"{label.capitalize()} '{value}' has not been seen on {device} before.",
+                severity=severity,
+                related_logs=[log['_id']] if log.get('_id') else [],
+                source_ips=[log['SourceIP']] if present(log.get('SourceIP')) else [],
+                affected_hosts=[device],
+                tags=['first_seen', field],
+            ))
+        return alerts
+
+    def persist(self, force=False):
+        """
+        Write filters to `state_path` if they changed and the persist interval has passed.
+
+        Safe to call from a worker thread while `observe` runs: the filter dict is
+        copied first, and a filter that gains bits mid-pickle is saved with at least
+        the values it held when persisting started. Values added meanwhile mark the
+        detector dirty again, for the next call.
+        """
+        if not self.state_path or not self._dirty:
+            return False
+        if not force and time.time() - self._persisted_at < self.persist_interval:
+            return False
+        self._dirty = False
+        filters = dict(self.filters)
+        directory = os.path.dirname(os.path.abspath(self.state_path))
+        try:
+            os.makedirs(directory, exist_ok=True)
+            # Write to a temp file and rename so a crash never leaves a truncated state file
+            fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(filters, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, self.state_path)
+        except Exception:
+            self._dirty = True
+            raise
+        self._persisted_at = time.time()
+        return True
+
+    def load(self):
+        try:
+            with open(self.state_path, 'rb') as f:
+                self.filters = pickle.load(f)
+            logger.info(f"Loaded {len(self.filters)} rarity filters from {self.state_path}")
+        except Exception as e:
+            logger.error(f"Could not load rarity state from {self.state_path}: {e}")
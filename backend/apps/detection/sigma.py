@@ -0,0 +1,644 @@
+"""
+Sigma rule compiler.
+
+A rule's YAML is parsed once into a small intermediate form (plain tuples, so it
+pickles) and cached by the SHA-256 of the rule text. From that form we build:
+
+- a Python predicate over a log dict, evaluated by SigmaDetector at ingest, and
+- a Mongo filter over the `logs` collection, for hunting in historical data.
+
+Both match values the way a MongoDB filter does, so a rule hunts the same logs
+it alerts on: string modifiers and regexes only match strings, case-insensitively
+for plain values; `eq` on a numeric value also matches numbers equal to it;
+numeric modifiers compare numbers and numeric strings; and a list field matches
+when any of its elements does.
+
+Sigma field names are mapped onto the SecurityLog schema via FIELD_MAP; unknown
+fields are passed through unchanged. Aggregations (`| count() ...`) and
+near/temporal conditions are not supported and raise SigmaError.
+"""
+import fnmatch
+import hashlib
+import ipaddress
+import logging
+import os
+import pickle
+import re
+import tempfile
+import threading
+
+import yaml
+
+from .alerts import build_alert
+from .events import event_id, present
+
+logger = logging.getLogger(__name__)
+
+# Sigma (Windows event log) field -> SecurityLog field
+FIELD_MAP = {
+    'EventID': 'EventID',
+    'Computer': 'ComputerName',
+    'ComputerName': 'ComputerName',
+    'Hostname': 'ComputerName',
+    'SubjectUserName': 'AccountName',
+    'TargetUserName': 'AccountName',
+    'User': 'AccountName',
+    'AccountName': 'AccountName',
+    'SubjectUserSid': 'AccountSID',
+    'TargetUserSid': 'AccountSID',
+    'SubjectLogonId': 'SessionID',
+    'TargetLogonId': 'SessionID',
+    'IpAddress': 'SourceIP',
+    'SourceIp': 'SourceIP',
+    'SourceAddress': 'SourceIP',
+    'src_ip': 'SourceIP',
+    'LogonType': 'LogonType',
+    'Provider_Name': 'SourceName',
+    'Channel': 'Channel',
+    'Level': 'Level',
+    'Message': 'Message',
+}
+
+# Sigma level -> Alert.severity
+LEVEL_SEVERITY = {
+    'informational': 'low',
+    'low': 'low',
+    'medium': 'medium',
+    'high': 'high',
+    'critical': 'critical',
+}
+
+KEYWORD_FIELD = 'Message'
+STRING_OPS = ('eq', 'contains', 'startswith', 'endswith')
+NUMERIC_OPS = {'gt': '$gt', 'gte': '$gte', 'lt': '$lt', 'lte': '$lte'}
+# Strings numeric comparisons and `eq` treat as numbers; the same pattern runs in Mongo's $regexMatch
+NUMBER_RE = re.compile(r'^[+-]?(\d+(\.\d*)?|\.\d+)([eE][+-]?\d+)?$')
+
+
+class SigmaError(ValueError):
+    pass
+
+
+def rule_hash(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+# --- YAML -> intermediate form -------------------------------------------------
+
+def _glob_to_regex(value):
+    """Translate a Sigma wildcard value (* and ?, backslash escapes) to a regex body."""
+    out = []
+    i = 0
+    while i < len(value):
+        char = value[i]
+        if char == '\\' and i + 1 < len(value) and value[i + 1] in '*?\\':
+            out.append(re.escape(value[i + 1]))
+            i += 2
+            continue
+        out.append('.*' if char == '*' else '.' if char == '?' else re.escape(char))
+        i += 1
+    return ''.join(out)
+
+
+def _has_wildcard(value):
+    return re.search(r'(?<!\\)[*?]', value) is not None
+
+
+def _string_term(field, op, value):
+    """Plain string ops stay as-is; values with wildcards become anchored case-insensitive regexes."""
+    if not _has_wildcard(value):
+        return (op, field, value.replace('\\*', '*').replace('\\?', '?'))
+    body = _glob_to_regex(value)
+    prefix = '' if op in ('contains', 'endswith') else '^'
+    suffix = '' if op in ('contains', 'startswith') else '$'
+    return ('re', field, prefix + body + suffix, True)
+
+
+def _field_terms(key, values):
+    name, *modifiers = key.split('|')
+    field = FIELD_MAP.get(name, name)
+    match_all = 'all' in modifiers
+    modifiers = [m for m in modifiers if m != 'all']
+    op = modifiers[0] if modifiers else 'eq'
+    if len(modifiers) > 1 or op not in STRING_OPS + tuple(NUMERIC_OPS) + ('re', 'cidr', 'exists'):
+        raise SigmaError(f"Unsupported modifier in '{key}'")
+
+    if not isinstance(values, list):
+        values = [values]
+    terms = []
+    for value in values:
+        if op == 'exists':
+            terms.append(('exists', field, bool(value)))
+        elif value is None:
+            terms.append(('null', field))
+        elif op in NUMERIC_OPS:
+            if _number(value) is None:
+                raise SigmaError(f"'{key}' needs a number, not {value!r}")
+            terms.append((op, field, _number(value)))
+        elif op == 're':
+            re.compile(value)
+            terms.append(('re', field, value, False))
+        elif op == 'cidr':
+            terms.append(('cidr', field, str(ipaddress.ip_network(value, strict=False))))
+        elif isinstance(value, (int, float)) and op == 'eq':
+            terms.append(('eq', field, str(value)))
+        else:
+            terms.append(_string_term(field, op, str(value)))
+    if len(terms) == 1:
+        return terms[0]
+    return ('and' if match_all else 'or', tuple(terms))
+
+
+def _selection(definition):
+    if isinstance(definition, dict):
+        terms = tuple(_field_terms(key, value) for key, value in definition.items())
+        return terms[0] if len(terms) == 1 else ('and', terms)
+    if isinstance(definition, list):
+        if all(isinstance(item, dict) for item in definition):
+            return ('or', tuple(_selection(item) for item in definition))
+        # A list of plain values is a keyword search over the message
+        return ('or', tuple(_string_term(KEYWORD_FIELD, 'contains', str(item)) for item in definition))
+    if isinstance(definition, str):
+        return _string_term(KEYWORD_FIELD, 'contains', definition)
+    raise SigmaError(f'Unsupported selection: {definition!r}')
+
+
+CONDITION_TOKEN_RE = re.compile(r'\s*(\(|\)|1 of|all of|any of|[^\s()]+)')
+
+
+def _tokenize(condition):
+    tokens = []
+    position = 0
+    condition = condition.strip()
+    while position < len(condition):
+        match = CONDITION_TOKEN_RE.match(condition, position)
+        if not match:
+            raise SigmaError(f'Cannot parse condition: {condition}')
+        tokens.append(match.group(1))
+        position = match.end()
+    return tokens
+
+
+def _parse_condition(condition, selections):
+    if '|' in condition:
+        raise SigmaError('Aggregation conditions are not supported')
+    tokens = _tokenize(condition)
+    position = 0
+
+    def peek():
+        return tokens[position].lower() if position < len(tokens) else None
+
+    def take():
+        nonlocal position
+        position += 1
+        return tokens[position - 1]
+
+    def parse_or():
+        nodes = [parse_and()]
+        while peek() == 'or':
+            take()
+            nodes.append(parse_and())
+        return nodes[0] if len(nodes) == 1 else ('or', tuple(nodes))
+
+    def parse_and():
+        nodes = [parse_not()]
+        while peek() == 'and':
+            take()
+            nodes.append(parse_not())
+        return nodes[0] if len(nodes) == 1 else ('and', tuple(nodes))
+
+    def parse_not():
+        if peek() == 'not':
+            take()
+            return ('not', parse_not())
+        return parse_atom()
+
+    def parse_atom():
+        token = take() if peek() is not None else None
+        if token is None:
+            raise SigmaError(f'Unexpected end of condition: {condition}')
+        if token == '(':
+            node = parse_or()
+            if peek() != ')':
+                raise SigmaError(f'Unbalanced parentheses in condition: {condition}')
+            take()
+            return node
+        if token.lower() in ('1 of', 'any of', 'all of'):
+            pattern = take() if peek() is not None else None
+            if pattern is None:
+                raise SigmaError(f'Missing selection pattern in condition: {condition}')
+            names = [name for name in selections if not name.startswith('_')] if pattern == 'them' \
+                else fnmatch.filter(selections, pattern)
+            if not names:
+                raise SigmaError(f"No selections match '{pattern}'")
+            nodes = tuple(selections[name] for name in sorted(names))
+            return ('and' if token.lower() == 'all of' else 'or', nodes)
+        if token not in selections:
+            raise SigmaError(f"Unknown selection '{token}' in condition")
+        return selections[token]
+
+    node = parse_or()
+    if position != len(tokens):
+        raise SigmaError(f'Unexpected token in condition: {tokens[position]}')
+    return node
+
+
+def parse_rule(text):
+    """Parse Sigma YAML into the cacheable intermediate form."""
+    try:
+        document = yaml.safe_load(text)
+    except yaml.YAMLError as e:
+        raise SigmaError(f'Invalid YAML: {e}')
+    if not isinstance(document, dict) or 'detection' not in document:
+        raise SigmaError('Not a Sigma rule: missing detection section')
+
+    detection = dict(document['detection'])
+    condition = detection.pop('condition', None)
+    detection.pop('timeframe', None)
+    if condition is None:
+        raise SigmaError('Sigma rule has no condition')
+    if isinstance(condition, list):
+        condition = ' or '.join(f'({c})' for c in condition)
+    selections = {name: _selection(definition) for name, definition in detection.items()}
+
+    tags = document.get('tags') or []
+    return {
+        'id': str(document.get('id') or ''),
+        'title': document.get('title') or 'Untitled Sigma rule',
+        'description': document.get('description') or '',
+        'level': str(document.get('level') or 'medium').lower(),
+        'tags': list(tags),
+        'techniques': [tag.split('.', 1)[1].upper() for tag in tags
+                       if tag.lower().startswith('attack.t')],
+        'expr': _parse_condition(str(condition), selections),
+    }
+
+
+# --- intermediate form -> Python predicate -------------------------------------
+
+def _number(value):
+    """A number, or a string that reads as one, as a float; None for anything else (including bools)."""
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str) and NUMBER_RE.match(value):
+        return float(value)
+    return None
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _elements(value):
+    # A Mongo filter on an array field matches when any element does
+    return value if isinstance(value, list) else (value,)
+
+
+def _string_predicate(field, test):
+    return lambda log: any(isinstance(v, str) and test(v) for v in _elements(log.get(field)))
+
+
+def compile_predicate(node):
+    kind = node[0]
+    if kind in ('and', 'or'):
+        children = [compile_predicate(child) for child in node[1]]
+        if kind == 'and':
+            return lambda log: all(child(log) for child in children)
+        return lambda log: any(child(log) for child in children)
+    if kind == 'not':
+        child = compile_predicate(node[1])
+        return lambda log: not child(log)
+
+    field = node[1]
+    if kind == 'eq':
+        target = node[2].lower()
+        number = _number(node[2])
+        if number is None:
+            return _string_predicate(field, lambda v: v.lower() == target)
+
+        def equals(log):
+            return any(
+                (isinstance(v, str) and v.lower() == target) or (_is_number(v) and float(v) == number)
+                for v in _elements(log.get(field))
+            )
+        return equals
+    if kind == 'contains':
+        target = node[2].lower()
+        return _string_predicate(field, lambda v: target in v.lower())
+    if kind == 'startswith':
+        target = node[2].lower()
+        return _string_predicate(field, lambda v: v.lower().startswith(target))
+    if kind == 'endswith':
+        target = node[2].lower()
+        return _string_predicate(field, lambda v: v.lower().endswith(target))
+    if kind == 're':
+        pattern = re.compile(node[2], re.IGNORECASE if node[3] else 0)
+        return _string_predicate(field, lambda v: pattern.search(v) is not None)
+    if kind in NUMERIC_OPS:
+        target = node[2]
+        compare = {'gt': float.__gt__, 'gte': float.__ge__, 'lt': float.__lt__, 'lte': float.__le__}[kind]
+
+        def compares(log):
+            value = log.get(field)
+            if isinstance(value, list):
+                # Array elements compare natively in Mongo, so only numbers count
+                return any(_is_number(v) and compare(float(v), target) for v in value)
+            number = _number(value)
+            return number is not None and compare(number, target)
+        return compares
+    if kind == 'cidr':
+        network = ipaddress.ip_network(node[2])
+
+        def in_network(v):
+            try:
+                return ipaddress.ip_address(v) in network
+            except ValueError:
+                return False
+        return _string_predicate(field, in_network)
+    if kind == 'exists':
+        expected = node[2]
+        return lambda log: (log.get(field) is not None) == expected
+    if kind == 'null':
+        return lambda log: any(v is None or v == '' for v in _elements(log.get(field)))
+    raise SigmaError(f'Unknown node type: {kind}')
+
+
+# --- intermediate form -> Mongo filter -----------------------------------------
+
+def _cidr_regex(network):
+    """Regex matching dotted-quad strings inside an IPv4 network."""
+    prefix = network.prefixlen
+    if prefix == 0:
+        return '^'
+    boundary = (prefix + 7) // 8 * 8
+    octets = boundary // 8
+    alternatives = []
+    for subnet in network.subnets(new_prefix=boundary) if boundary != prefix else [network]:
+        parts = str(subnet.network_address).split('.')[:octets]
+        alternatives.append(r'\.'.join(parts))
+    tail = r'(\.|$)' if octets < 4 else '$'
+    return '^(' + '|'.join(alternatives) + ')' + tail
+
+
+def compile_mongo(node):
+    kind = node[0]
+    if kind in ('and', 'or'):
+        return {'$' + kind: [compile_mongo(child) for child in node[1]]}
+    if kind == 'not':
+        return {'$nor': [compile_mongo(node[1])]}
+
+    field = node[1]
+    if kind == 'eq':
+        value = node[2]
+        alternatives = [{field: {'$regex': '^' + re.escape(value) + '$', '$options': 'i'}}]
+        number = _number(value)
+        if number is not None:
+            # EventID and friends are stored as ints by some sources and strings by others
+            alternatives.append({field: int(number) if number.is_integer() else number})
+        return alternatives[0] if len(alternatives) == 1 else {'$or': alternatives}
+    if kind in ('contains', 'startswith', 'endswith'):
+        body = re.escape(node[2])
+        pattern = {'contains': body, 'startswith': '^' + body, 'endswith': body + '$'}[kind]
+        return {field: {'$regex': pattern, '$options': 'i'}}
+    if kind == 're':
+        return {field: {'$regex': node[2], '$options': 'i' if node[3] else ''}}
+    if kind in NUMERIC_OPS:
+        operator, path = NUMERIC_OPS[kind], '$' + field
+        # Numbers compare natively; numeric strings only through $expr, which cannot use an index
+        numeric_string = {'$cond': [
+            {'$eq': [{'$type': path}, 'string']},
+            {'$cond': [
+                {'$regexMatch': {'input': path, 'regex': NUMBER_RE.pattern}},
+                {operator: [{'$toDouble': path}, node[2]]},
+                False,
+            ]},
+            False,
+        ]}
+        return {'$or': [{field: {operator: node[2]}}, {'$expr': numeric_string}]}
+    if kind == 'cidr':
+        network = ipaddress.ip_network(node[2])
+        if network.version != 4:
+            raise SigmaError('IPv6 CIDR matching is not supported in Mongo queries')
+        return {field: {'$regex': _cidr_regex(network)}}
+    if kind == 'exists':
+        # A null field counts as missing, as in the predicate
+        return {field: {'$ne': None}} if node[2] else {field: None}
+    if kind == 'null':
+        return {field: {'$in': [None, '']}}
+    raise SigmaError(f'Unknown node type: {kind}')
+
+
+def required_event_ids(node):
+    """
+    EventIDs one of which a log must have to match, or None if unconstrained.
+    Used to dispatch logs only to rules that can possibly match them.
+    """
+    kind = node[0]
+    if kind == 'eq' and node[1] == 'EventID':
+        number = _number(node[2])
+        # Logs are dispatched on str(int(EventID)); other values can only be checked by the predicate
+        return {str(int(number))} if number is not None and number.is_integer() else None
+    if kind == 'and':
+        for child in node[1]:
+            ids = required_event_ids(child)
+            if ids is not None:
+                return ids
+        return None
+    if kind == 'or':
+        ids = set()
+        for child in node[1]:
+            child_ids = required_event_ids(child)
+            if child_ids is None:
+                return None
+            ids |= child_ids
+        return ids
+    return None
+
+
+# --- compiled rules and cache --------------------------------------------------
+
+class CompiledRule:
+    def __init__(self, text, ir, digest):
+        self.text = text
+        self.hash = digest
+        self.ir = ir
+        self.id = ir['id']
+        self.title = ir['title']
+        self.severity = LEVEL_SEVERITY.get(ir['level'], 'medium')
+        self.predicate = compile_predicate(ir['expr'])
+        self.event_ids = required_event_ids(ir['expr'])
+        self._mongo_query = None
+
+    def matches(self, log):
+        return self.predicate(log)
+
+    def mongo_query(self):
+        if self._mongo_query is None:
+            self._mongo_query = compile_mongo(self.ir['expr'])
+        return self._mongo_query
+
+
+class SigmaCache:
+    """
+    Rules keyed by rule hash. Intermediate forms can be persisted to a pickle file,
+    which is reread when its mtime changes, so rules parsed by another process
+    (import_sigma_rules writes the same file) skip YAML parsing here. Compiled
+    rules stay in memory, so reloading an unchanged rule or hunting with it again
+    compiles nothing.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.entries = {}
+        self.rules = {}
+        self._dirty = False
+        self._mtime = None
+        self._lock = threading.Lock()
+        self.refresh()
+
+    def _file_mtime(self):
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except OSError:
+            return None
+
+    def refresh(self):
+        """Merge in the intermediate forms of the pickle file if it changed since it was last read or written."""
+        if not self.path:
+            return False
+        mtime = self._file_mtime()
+        if mtime is None or mtime == self._mtime:
+            return False
+        self._mtime = mtime
+        try:
+            with open(self.path, 'rb') as f:
+                entries = pickle.load(f)
+        except Exception as e:
+            logger.error(f"Could not load Sigma cache from {self.path}: {e}")
+            return False
+        with self._lock:
+            self.entries = {**entries, **self.entries}
+        return True
+
+    def compile(self, text):
+        digest = rule_hash(text)
+        rule = self.rules.get(digest)
+        if rule is not None:
+            return rule
+        ir = self.entries.get(digest)
+        if ir is None:
+            ir = parse_rule(text)
+            with self._lock:
+                self.entries[digest] = ir
+                self._dirty = True
+        rule = CompiledRule(text, ir, digest)
+        self.rules[digest] = rule
+        return rule
+
+    def prune(self, keep_hashes):
+        with self._lock:
+            stale = set(self.entries) - set(keep_hashes)
+            for digest in stale:
+                del self.entries[digest]
+            for digest in set(self.rules) - set(keep_hashes):
+                del self.rules[digest]
+            self._dirty = self._dirty or bool(stale)
+
+    def save(self):
+        if not self.path or not self._dirty:
+            return False
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with self._lock, os.fdopen(fd, 'wb') as f:
+            pickle.dump(self.entries, f, protocol=pickle.HIGHEST_PROTOCOL)
+            self._dirty = False
+        os.replace(tmp_path, self.path)
+        self._mtime = self._file_mtime()
+        return True
+
+
+# Process-wide cache for callers that compile rules on demand (e.g. hunt views)
+default_cache = SigmaCache()
+
+
+# --- ingest-time matching ------------------------------------------------------
+
+SIGMA_CONDITION_TYPE = 'sigma'
+
+
+class SigmaDetector:
+    """
+    Evaluate compiled Sigma rules on each ingested log. Rules are bucketed by the
+    EventIDs they require, so a log is only checked against rules that could match.
+    """
+    rule_name = 'sigma'
+
+    def __init__(self, cache=None):
+        self.cache = cache or SigmaCache()
+        self.rules = []
+        # (rules by EventID, rules without an EventID constraint), swapped as one reference
+        self._dispatch = ({}, [])
+        self._hashes = frozenset()
+
+    def load(self, texts):
+        """Compile rule texts and swap them in; returns False if nothing changed."""
+        texts = list(texts)
+        hashes = frozenset(rule_hash(text) for text in texts)
+        if hashes == self._hashes:
+            return False
+        self.cache.refresh()
+        rules = []
+        for text in texts:
+            try:
+                rules.append(self.cache.compile(text))
+            except SigmaError as e:
+                logger.error(f"Skipping Sigma rule: {e}")
+        by_event_id, generic = {}, []
+        for rule in rules:
+            if rule.event_ids is None:
+                generic.append(rule)
+            else:
+                for eid in rule.event_ids:
+                    by_event_id.setdefault(eid, []).append(rule)
+        self.rules = rules
+        self._dispatch = (by_event_id, generic)
+        self._hashes = hashes
+        self.cache.prune(hashes)
+        logger.info(f"Loaded {len(rules)} Sigma rules")
+        return True
+
+    def load_from_collection(self, collection):
+        return self.load(
+            doc['conditions']['yaml']
+            for doc in collection.find(
+                {'conditions.type': SIGMA_CONDITION_TYPE, 'is_active': {'$ne': False}},
+                {'conditions.yaml': 1},
+            )
+        )
+
+    def persist(self, force=False):
+        return self.cache.save()
+
+    def observe(self, log):
+        by_event_id, generic = self._dispatch
+        eid = event_id(log)
+        candidates = by_event_id.get(str(eid), []) if eid is not None else []
+        alerts = []
+        for rule in (*candidates, *generic):
+            if not rule.matches(log):
+                continue
+            host = log.get('ComputerName')
+            alerts.append(build_alert(
+                rule_name=f'sigma:{rule.id or rule.hash[:12]}',
+                title=rule.title,
+                description=rule.ir['description'] or f"Sigma rule '{rule.title}' matched.",
+                severity=rule.severity,
+                related_logs=[log['_id']] if log.get('_id') else [],
+                source_ips=[log['SourceIP']] if present(log.get('SourceIP')) else [],
+                affected_hosts=[host] if present(host) else [],
+                tags=['sigma'] + rule.ir['techniques'],
+            ))
+        return alerts
@@ -0,0 +1,91 @@
+import ipaddress
+import os
+import random
+import tempfile
+from unittest import TestCase
+
+from apps.detection.asn import ASNEnricher, ASNTable, Provider, read_csv_ranges
+
+CSV = """network,autonomous_system_number,autonomous_system_organization
+1.0.0.0/24,13335,CLOUDFLARENET
+8.8.8.0/24,15169,GOOGLE
+41.90.0.0/15,AS33771,Safaricom
+0.0.0.0/8,,
+255.255.255.255/32,1,Last
+2001:4860::/32,15169,GOOGLE
+bogus,1,Skipped
+"""
+
+
+def write(directory, text, name='asn.csv'):
+    path = os.path.join(directory, name)
+    with open(path, 'w') as f:
+        f.write(text)
+    return path
+
+
+class ASNTableTests(TestCase):
+    def setUp(self):
+        with tempfile.TemporaryDirectory() as directory:
+            self.table = ASNTable.from_file(write(directory, CSV))
+
+    def test_batch_lookup_in_order(self):
+        ips = ['8.8.8.8', '41.91.255.255', '41.92.0.0', '2001:4860::8888', 'N/A', None, '1.0.0.0', '255.255.255.255',
+               '0.1.2.3', '2001:4861::1', '999.1.1.1']
+        self.assertEqual(self.table.lookup_many(ips), [
+            Provider(15169, 'GOOGLE'), Provider(33771, 'Safaricom'), None, Provider(15169, 'GOOGLE'), None, None,
+            Provider(13335, 'CLOUDFLARENET'), Provider(1, 'Last'), Provider(None, None), None, None,
+        ])
+        self.assertEqual(len(self.table), 6)
+        # Repeated organisations share one Provider
+        self.assertEqual(len(self.table.providers), 5)
+
+    def test_searchsorted_matches_a_linear_scan(self):
+        rng = random.Random(5)
+        ranges, start = [], 0
+        for asn in range(1, 300):
+            start += rng.randint(1, 2 ** 22)
+            end = start + rng.randint(0, 2 ** 20)
+            ranges.append((start, end, 4, asn, f'ISP {asn % 7}'))
+            start = end + 1
+        table = ASNTable(ranges)
+        addresses = [rng.randint(0, start + 2 ** 22) for _ in range(2000)] + [r[0] for r in ranges] + [r[1] for r in ranges]
+        expected = [next((Provider(asn, isp) for low, high, _, asn, isp in ranges if low <= a <= high), None)
+                    for a in addresses]
+        self.assertEqual(table.lookup_many([str(ipaddress.IPv4Address(a)) for a in addresses]), expected)
+
+    def test_empty_table(self):
+        self.assertEqual(ASNTable().lookup_many(['8.8.8.8', '::1']), [None, None])
+
+
+class ReadRangesTests(TestCase):
+    def test_start_end_columns(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = write(directory, 'start_ip,end_ip,asn,isp\n10.0.0.0,10.0.0.255,64512,Lab\n10.0.1.9,10.0.1.0,1,Reversed\n')
+            self.assertEqual(list(read_csv_ranges(path)), [(167772160, 167772415, 4, 64512, 'Lab')])
+
+    def test_needs_range_columns(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with self.assertRaises(ValueError):
+                list(read_csv_ranges(write(directory, 'asn,isp\n1,x\n')))
+
+
+class ASNEnricherTests(TestCase):
+    def test_enriches_a_batch_and_reloads_on_change(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = write(directory, CSV)
+            enricher = ASNEnricher(path)
+            logs = [{'SourceIP': '8.8.4.4'}, {'SourceIP': '8.8.8.8'}, {'SourceIP': '0.0.0.1'}]
+            enricher.enrich_many(logs)
+            self.assertEqual(logs, [
+                {'SourceIP': '8.8.4.4'},
+                {'SourceIP': '8.8.8.8', 'SourceASN': 15169, 'SourceISP': 'GOOGLE'},
+                {'SourceIP': '0.0.0.1'},
+            ])
+            self.assertFalse(enricher.reload_if_changed())
+            write(directory, CSV + '8.8.4.0/24,15169,GOOGLE\n')
+            os.utime(path, (1, 1))
+            self.assertTrue(enricher.reload_if_changed())
+            log = {'SourceIP': '8.8.4.4'}
+            enricher.enrich(log)
+            self.assertEqual(log['SourceISP'], 'GOOGLE')
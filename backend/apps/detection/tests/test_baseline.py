@@ -0,0 +1,78 @@
+from datetime import datetime, timedelta
+from unittest import TestCase
+
+import numpy as np
+
+from apps.detection import baseline
+
+
+class FakeCollection:
+    """Answers the baseline aggregation with fixed rows."""
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    def aggregate(self, pipeline, **kwargs):
+        return iter(self.rows)
+
+
+def row(host, account, hour, count, event_type='FailureAudit'):
+    return {'_id': {'host': host, 'account': account, 'event_type': event_type,
+                    'hour': hour.strftime(baseline.HOUR_KEY_FORMAT)}, 'count': count}
+
+
+class HourWindowsTests(TestCase):
+    def test_same_hour_of_week_oldest_first(self):
+        scored = datetime(2024, 3, 29, 14, 37)
+        windows = baseline.hour_windows(scored, weeks=4)
+        self.assertEqual(len(windows), 5)
+        self.assertEqual(windows[-1], datetime(2024, 3, 29, 14))
+        self.assertEqual(windows[0], datetime(2024, 3, 1, 14))
+        self.assertTrue(all(later - earlier == timedelta(weeks=1) for earlier, later in zip(windows, windows[1:])))
+
+    def test_pipeline_matches_dates_and_strings(self):
+        windows = baseline.hour_windows(datetime(2024, 3, 29, 14), weeks=1)
+        ranges = baseline.build_pipeline(windows)[0]['$match']['$or']
+        self.assertEqual(len(ranges), 4)
+        self.assertEqual(ranges[1]['TimeGenerated']['$gte'], '2024-03-22 14:00:00 +0300')
+
+
+class ScoreTests(TestCase):
+    def test_missing_hours_count_as_zero(self):
+        # Entity 0 had 2 events in one history window and 12 now; entity 1 is steady at 5
+        entity_idx = np.array([0, 0, 1, 1, 1, 1, 1])
+        window_idx = np.array([1, 4, 0, 1, 2, 3, 4])
+        counts = np.array([2, 12, 5, 5, 5, 5, 5], dtype=np.float64)
+        z, mean, std, current = baseline.score(entity_idx, window_idx, counts, 2, weeks=4)
+        self.assertEqual(mean[0], 0.5)
+        self.assertEqual(current.tolist(), [12.0, 5.0])
+        self.assertGreater(z[0], 4)
+        self.assertEqual(z[1], 0)
+
+    def test_flat_history_floors_the_variance(self):
+        entity_idx = np.array([0, 0, 0, 0, 0])
+        window_idx = np.array([0, 1, 2, 3, 4])
+        counts = np.array([3, 3, 3, 3, 4], dtype=np.float64)
+        z, mean, std, current = baseline.score(entity_idx, window_idx, counts, 1, weeks=4)
+        self.assertAlmostEqual(std[0], np.sqrt(3))
+        self.assertLess(z[0], 1)
+
+
+class DetectTests(TestCase):
+    def test_flags_outliers_and_merges_missing_accounts(self):
+        scored = datetime(2024, 3, 29, 14)
+        windows = baseline.hour_windows(scored)
+        rows = [row('HOST-1', 'alice', start, 2) for start in windows[:-1]]
+        rows.append(row('HOST-1', 'alice', scored, 40))
+        rows.append(row('HOST-2', baseline.NO_ACCOUNT, scored, 20))
+        rows.append(row('HOST-3', 'bob', scored, 3))
+
+        alerts = baseline.detect(FakeCollection(rows), scored_hour=scored)
+        self.assertEqual([alert['affected_hosts'] for alert in alerts], [['HOST-1'], ['HOST-2']])
+        self.assertIn('alice', alerts[0]['title'])
+        self.assertIn('unknown account', alerts[1]['title'])
+        self.assertEqual(alerts[0]['log_count'], 40)
+        self.assertEqual(alerts[0]['first_seen'], scored)
+
+    def test_no_rows_no_alerts(self):
+        self.assertEqual(baseline.detect(FakeCollection([]), scored_hour=datetime(2024, 3, 29, 14)), [])
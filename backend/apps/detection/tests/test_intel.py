@@ -0,0 +1,75 @@
+import json
+import os
+import tempfile
+from unittest import TestCase
+
+from apps.detection.intel import IOCIndex, ThreatIntelMatcher, read_csv_feed, read_stix_feed
+
+
+class IOCIndexTests(TestCase):
+    def setUp(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'feed.csv')
+            with open(path, 'w') as f:
+                f.write('ip,threat\n10.0.0.0/8,corp\n10.1.0.0/16,lab\n10.1.2.3,c2\n10.2.0.0/16,dmz\n'
+                        '# comment\nnot-an-ip,skipped\n2001:db8::/32,v6 block\n')
+            self.index = IOCIndex.from_files([path])
+
+    def values(self, ip):
+        return [indicator.value for indicator in self.index.match(ip)]
+
+    def test_nested_ranges_innermost_first(self):
+        self.assertEqual(self.values('10.1.2.3'), ['10.1.2.3/32', '10.1.0.0/16', '10.0.0.0/8'])
+        self.assertEqual(self.values('10.1.9.9'), ['10.1.0.0/16', '10.0.0.0/8'])
+
+    def test_gap_after_nested_range_falls_back_to_the_parent(self):
+        # 10.1.255.255 < 10.1.2.4 < 10.2.0.0: the search lands on 10.1.2.3 and hops out twice
+        self.assertEqual(self.values('10.1.2.4'), ['10.1.0.0/16', '10.0.0.0/8'])
+        self.assertEqual(self.values('10.3.0.1'), ['10.0.0.0/8'])
+        self.assertEqual(self.values('11.0.0.1'), [])
+        self.assertEqual(self.values('9.255.255.255'), [])
+
+    def test_ipv6_and_invalid_addresses(self):
+        self.assertEqual(self.values('2001:db8::1'), ['2001:db8::/32'])
+        self.assertEqual(self.values('2001:db9::1'), [])
+        self.assertEqual(self.values('N/A'), [])
+        self.assertEqual(self.values(None), [])
+        self.assertEqual(len(self.index), 5)
+
+
+class FeedTests(TestCase):
+    def test_bare_csv_and_stix(self):
+        with tempfile.TemporaryDirectory() as directory:
+            bare = os.path.join(directory, 'bare.txt')
+            with open(bare, 'w') as f:
+                f.write('192.0.2.1\n198.51.100.0/24\n')
+            stix = os.path.join(directory, 'bundle.json')
+            with open(stix, 'w') as f:
+                json.dump({'type': 'bundle', 'objects': [
+                    {'type': 'indicator', 'name': 'Botnet', 'pattern': "[ipv4-addr:value = '203.0.113.7']"},
+                    {'type': 'ipv6-addr', 'value': '2001:db8::7'},
+                    {'type': 'malware', 'name': 'ignored'},
+                ]}, f)
+            self.assertEqual([i.value for _, i in read_csv_feed(bare)], ['192.0.2.1/32', '198.51.100.0/24'])
+            self.assertEqual([(i.value, i.description) for _, i in read_stix_feed(stix)],
+                             [('203.0.113.7/32', 'Botnet'), ('2001:db8::7/128', '')])
+
+
+class ThreatIntelMatcherTests(TestCase):
+    def test_enrich_then_alert_and_reload_if_changed(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with open(os.path.join(directory, 'feed.csv'), 'w') as f:
+                f.write('indicator,description\n203.0.113.0/24,scanner\n')
+            matcher = ThreatIntelMatcher(directory)
+            self.assertFalse(matcher.reload_if_changed())
+
+            log = {'_id': 'abc', 'SourceIP': '203.0.113.9', 'ComputerName': 'HOST-1'}
+            matcher.enrich(log)
+            self.assertEqual(log['ThreatIntel'][0]['value'], '203.0.113.0/24')
+            (alert,) = matcher.observe(log)
+            self.assertIn('scanner', alert['description'])
+            self.assertEqual(alert['tags'], ['threat_intel', 'feed.csv'])
+
+            clean = {'SourceIP': '198.51.100.1'}
+            matcher.enrich(clean)
+            self.assertEqual(matcher.observe(clean), [])
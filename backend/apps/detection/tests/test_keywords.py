@@ -0,0 +1,40 @@
+import random
+from unittest import TestCase
+
+from apps.detection.keywords import AhoCorasick, KeywordTagger
+
+
+class AhoCorasickTests(TestCase):
+    def test_overlapping_keywords(self):
+        automaton = AhoCorasick([('he', 1), ('she', 2), ('his', 3), ('hers', 4)])
+        self.assertEqual(automaton.search('ushers'), {1, 2, 4})
+        self.assertEqual(automaton.search('ahishe'), {1, 2, 3})
+        self.assertEqual(automaton.search('hx'), set())
+
+    def test_case_insensitive_and_shared_tags(self):
+        automaton = AhoCorasick([('Mimikatz', 'credential-theft'), ('sekurlsa', 'credential-theft'), ('', 'empty')])
+        self.assertEqual(automaton.search('Running MIMIKATZ sekurlsa::logonpasswords'), {'credential-theft'})
+        self.assertEqual(automaton.search(''), set())
+
+    def test_matches_a_substring_scan(self):
+        rng = random.Random(3)
+        keywords = {''.join(rng.choice('abc') for _ in range(rng.randint(1, 5))) for _ in range(40)}
+        entries = [(keyword, keyword) for keyword in keywords]
+        automaton = AhoCorasick(entries)
+        for _ in range(200):
+            text = ''.join(rng.choice('abcd') for _ in range(rng.randint(0, 30)))
+            self.assertEqual(automaton.search(text), {keyword for keyword in keywords if keyword in text}, text)
+
+
+class KeywordTaggerTests(TestCase):
+    def test_tags_messages_and_only_recompiles_on_change(self):
+        tagger = KeywordTagger([('powershell -enc', 'encoded-command')])
+        log = {'Message': 'Process: PowerShell -Enc SQBFAFgA'}
+        tagger.enrich(log)
+        self.assertEqual(log['KeywordTags'], ['encoded-command'])
+
+        self.assertFalse(tagger.load([('powershell -enc', 'encoded-command')]))
+        self.assertTrue(tagger.load([('psexec', 'lateral-movement'), ('', 'ignored')]))
+        log = {'Message': 'Process: PowerShell -Enc SQBFAFgA'}
+        tagger.enrich(log)
+        self.assertNotIn('KeywordTags', log)
@@ -0,0 +1,70 @@
+import os
+import tempfile
+from unittest import TestCase
+
+from apps.detection.bloom import BloomFilter, ScalableBloomFilter
+from apps.detection.rarity import RarityDetector, service_name
+
+
+def service_install(device, name):
+    return {'EventID': '7045', 'ComputerName': device, 'SourceIP': 'N/A', 'AccountName': 'N/A',
+            'Message': f'A service was installed in the system. Service Name: {name} Service File Name: C:\\x.exe'}
+
+
+class BloomFilterTests(TestCase):
+    def test_no_false_negatives(self):
+        bloom = ScalableBloomFilter(initial_capacity=100, error_rate=0.01)
+        values = [f'value-{i}' for i in range(1000)]
+        added = sum(bloom.add(value) for value in values)
+        # A false positive while adding leaves that value out of the count, never out of the filter
+        self.assertGreater(added, 980)
+        self.assertEqual(len(bloom), added)
+        self.assertTrue(all(value in bloom for value in values))
+        self.assertFalse(any(bloom.add(value) for value in values))
+
+    def test_false_positive_rate_stays_below_target_as_it_grows(self):
+        error_rate = 0.01
+        bloom = ScalableBloomFilter(initial_capacity=256, error_rate=error_rate)
+        for i in range(20000):
+            bloom.add(f'seen-{i}')
+        self.assertGreater(len(bloom.filters), 3)
+        probes = 50000
+        false_positives = sum(f'unseen-{i}' in bloom for i in range(probes))
+        # Full slices sit at their own error rate, so the total approaches the target; allow sampling noise
+        self.assertLess(false_positives / probes, error_rate * 1.1)
+        self.assertGreater(false_positives / probes, error_rate / 4)
+
+    def test_slice_is_sized_for_its_error_rate(self):
+        bloom = BloomFilter(1000, 0.01)
+        self.assertEqual(bloom.num_bits, 9586)
+        self.assertEqual(bloom.num_hashes, 7)
+
+
+class RarityDetectorTests(TestCase):
+    def test_service_name_from_message(self):
+        self.assertEqual(service_name(service_install('HOST-1', 'EvilSvc')), 'EvilSvc')
+        self.assertIsNone(service_name({'EventID': '4624', 'Message': 'Service Name: x'}))
+
+    def test_learning_period_then_first_seen_alerts(self):
+        detector = RarityDetector(learning_seconds=0)
+        (alert,) = detector.observe(service_install('HOST-1', 'EvilSvc'))
+        self.assertEqual(alert['severity'], 'high')
+        self.assertEqual(detector.observe(service_install('HOST-1', 'EvilSvc')), [])
+        self.assertEqual(len(detector.observe(service_install('HOST-2', 'EvilSvc'))), 1)
+
+        learning = RarityDetector(learning_seconds=3600)
+        self.assertEqual(learning.observe(service_install('HOST-1', 'EvilSvc')), [])
+
+    def test_persist_and_reload(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'state', 'rarity.pkl')
+            detector = RarityDetector(state_path=path, learning_seconds=0)
+            self.assertFalse(detector.persist())
+            detector.observe(service_install('HOST-1', 'EvilSvc'))
+            self.assertFalse(detector.persist())
+            self.assertTrue(detector.persist(force=True))
+            self.assertFalse(detector.persist(force=True))
+
+            restored = RarityDetector(state_path=path, learning_seconds=0)
+            self.assertEqual(restored.observe(service_install('HOST-1', 'EvilSvc')), [])
+            self.assertEqual(os.listdir(os.path.dirname(path)), ['rarity.pkl'])
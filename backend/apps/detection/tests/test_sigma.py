@@ -0,0 +1,264 @@
+import os
+import re
+import tempfile
+import time
+from unittest import TestCase
+
+from apps.detection.sigma import SigmaCache, SigmaDetector, SigmaError, compile_mongo, parse_rule
+
+RULES = {
+    'logon_type': """
+detection:
+    selection:
+        EventID: 4624
+        LogonType: 10
+    condition: selection
+""",
+    'numeric': """
+detection:
+    high:
+        Level|gte: 4
+    low:
+        Level|lt: '1.5'
+    condition: high or low
+""",
+    'strings': """
+detection:
+    tools:
+        CommandLine|contains:
+            - 'mimikatz'
+            - '-EncodedCommand'
+    admin:
+        User|startswith: 'adm'
+    condition: tools and not admin
+""",
+    'wildcards': """
+detection:
+    selection:
+        Image: '*\\\\powershell?.exe'
+        ParentImage|endswith: '\\\\winword.exe'
+    condition: selection
+""",
+    'network': """
+detection:
+    selection:
+        IpAddress|cidr: '10.1.0.0/16'
+    filter:
+        Computer: null
+    condition: selection and not filter
+""",
+    'exists_and_regex': """
+detection:
+    selection:
+        Tags|re: '^T10[0-9]{2}$'
+        ServiceName|exists: true
+    condition: selection
+""",
+    'keywords': """
+detection:
+    keywords:
+        - 'whoami'
+        - 'net user'
+    condition: keywords
+""",
+}
+
+LOGS = [
+    {'EventID': 4624, 'LogonType': 10},
+    {'EventID': '4624', 'LogonType': '10'},
+    {'EventID': '04624', 'LogonType': 10.0},
+    {'EventID': 4624.0, 'LogonType': '10.0'},
+    {'EventID': '4624', 'LogonType': True},
+    {'EventID': [4624, 4625], 'LogonType': ['10']},
+    {'Level': 4}, {'Level': '4'}, {'Level': ' 4'}, {'Level': '4.5e0'}, {'Level': 'high'},
+    {'Level': [1, 7]}, {'Level': ['9']}, {'Level': 1}, {'Level': '-2'}, {'Level': None}, {'Level': False},
+    {'CommandLine': 'powershell -encodedcommand SQBFAFgA', 'User': 'bob'},
+    {'CommandLine': 'MIMIKATZ.exe', 'User': 'Administrator'},
+    {'CommandLine': ['cmd', 'mimikatz'], 'User': ['bob']},
+    {'CommandLine': 1234, 'User': None},
+    {'Image': 'C:\\Windows\\powershell1.exe', 'ParentImage': 'C:\\Office\\WINWORD.EXE'},
+    {'Image': 'C:\\Windows\\powershell.exe', 'ParentImage': 'C:\\Office\\winword.exe'},
+    {'IpAddress': '10.1.2.3', 'Computer': 'HOST-1'},
+    {'IpAddress': '10.1.2.3', 'Computer': ''},
+    {'IpAddress': '10.2.2.3', 'Computer': 'HOST-1'},
+    {'IpAddress': ['192.0.2.1', '10.1.9.9'], 'Computer': 'HOST-1'},
+    {'IpAddress': 167838211, 'Computer': 'HOST-1'},
+    {'Tags': 'T1059', 'ServiceName': 'svc'},
+    {'Tags': 't1059', 'ServiceName': None},
+    {'Tags': ['T1003', 'x'], 'ServiceName': 'svc'},
+    {'Tags': 1059, 'ServiceName': 'svc'},
+    {'Message': 'ran WhoAmI /all'},
+    {'Message': 'Net User admin /add'},
+    {'Message': ['net', 'user']},
+    {},
+]
+
+FIELD_MAP = {'User': 'AccountName', 'IpAddress': 'SourceIP', 'Computer': 'ComputerName'}
+
+
+def stored(log):
+    return {FIELD_MAP.get(field, field): value for field, value in log.items()}
+
+
+# --- MongoDB filter semantics, for the operators compile_mongo emits ------------
+
+NUMBER_TYPES = (int, float)
+
+
+def _missing(doc, field):
+    return field not in doc
+
+
+def _is_number(value):
+    return isinstance(value, NUMBER_TYPES) and not isinstance(value, bool)
+
+
+def _candidates(value):
+    # Filters on an array match the array itself or any element
+    return [value, *value] if isinstance(value, list) else [value]
+
+
+def _compare(operator, value, target):
+    # Comparison operators only match values of the same type bracket
+    if _is_number(target):
+        if not _is_number(value):
+            return False
+    elif type(value) is not type(target):
+        return False
+    return {'$gt': value > target, '$gte': value >= target, '$lt': value < target,
+            '$lte': value <= target}[operator] if operator != '$eq' else value == target
+
+
+def _regex(pattern, options):
+    # PCRE and Python agree on the patterns used here
+    return re.compile(pattern, re.IGNORECASE if 'i' in options else 0)
+
+
+def _field_matches(doc, field, condition):
+    value = doc.get(field)
+    if not isinstance(condition, dict):
+        if condition is None:
+            return value is None or (isinstance(value, list) and None in value)
+        return any(_compare('$eq', candidate, condition) for candidate in _candidates(value))
+    for operator, target in condition.items():
+        if operator == '$options':
+            continue
+        if operator == '$regex':
+            pattern = _regex(target, condition.get('$options', ''))
+            ok = any(isinstance(c, str) and pattern.search(c) for c in _candidates(value))
+        elif operator == '$ne':
+            ok = not _field_matches(doc, field, target)
+        elif operator == '$in':
+            ok = any(_field_matches(doc, field, item) for item in target)
+        elif operator in ('$gt', '$gte', '$lt', '$lte'):
+            ok = not _missing(doc, field) and any(_compare(operator, c, target) for c in _candidates(value))
+        else:
+            raise AssertionError(f'Unexpected operator {operator}')
+        if not ok:
+            return False
+    return True
+
+
+def _expression(doc, expression):
+    if isinstance(expression, str) and expression.startswith('$'):
+        return doc.get(expression[1:])
+    if not isinstance(expression, dict):
+        return expression
+    ((operator, args),) = expression.items()
+    if operator == '$cond':
+        return _expression(doc, args[1] if _expression(doc, args[0]) else args[2])
+    if operator == '$eq':
+        return _expression(doc, args[0]) == _expression(doc, args[1])
+    if operator == '$type':
+        value = _expression(doc, args)
+        return 'missing' if value is None and args[1:] not in doc else {str: 'string', list: 'array'}.get(type(value), 'other')
+    if operator == '$regexMatch':
+        return re.search(args['regex'], _expression(doc, args['input'])) is not None
+    if operator == '$toDouble':
+        return float(_expression(doc, args))
+    if operator in ('$gt', '$gte', '$lt', '$lte'):
+        return _compare(operator, _expression(doc, args[0]), _expression(doc, args[1]))
+    raise AssertionError(f'Unexpected expression {operator}')
+
+
+def mongo_matches(doc, query):
+    for key, condition in query.items():
+        if key == '$and':
+            ok = all(mongo_matches(doc, part) for part in condition)
+        elif key == '$or':
+            ok = any(mongo_matches(doc, part) for part in condition)
+        elif key == '$nor':
+            ok = not any(mongo_matches(doc, part) for part in condition)
+        elif key == '$expr':
+            ok = bool(_expression(doc, condition))
+        else:
+            ok = _field_matches(doc, key, condition)
+        if not ok:
+            return False
+    return True
+
+
+class SigmaParityTests(TestCase):
+    """Each rule must alert at ingest on exactly the logs its hunting query finds."""
+
+    def test_predicate_and_mongo_filter_agree(self):
+        cache = SigmaCache()
+        for name, text in RULES.items():
+            rule = cache.compile(text)
+            query = compile_mongo(rule.ir['expr'])
+            for log in map(stored, LOGS):
+                with self.subTest(rule=name, log=log):
+                    self.assertEqual(rule.matches(log), mongo_matches(log, query))
+
+    def test_expected_matches(self):
+        cache = SigmaCache()
+
+        def matched(name):
+            rule = cache.compile(RULES[name])
+            return [i for i, log in enumerate(map(stored, LOGS)) if rule.matches(log)]
+        # '04624' and '10.0' are strings, compared as strings
+        self.assertEqual(matched('logon_type'), [0, 1, 5])
+        self.assertEqual(matched('numeric'), [6, 7, 9, 11, 13, 14])
+        self.assertEqual(matched('strings'), [17, 19])
+        self.assertEqual(matched('network'), [23, 26])
+
+    def test_numeric_modifier_needs_a_number(self):
+        with self.assertRaises(SigmaError):
+            parse_rule("detection:\n  selection:\n    Level|gt: high\n  condition: selection\n")
+
+
+class SigmaDetectorTests(TestCase):
+    def test_dispatch_by_event_id(self):
+        detector = SigmaDetector()
+        detector.load([RULES['logon_type'], RULES['keywords']])
+        by_event_id, generic = detector._dispatch
+        self.assertEqual(list(by_event_id), ['4624'])
+        self.assertEqual(len(generic), 1)
+        (alert,) = detector.observe({'EventID': '4624', 'LogonType': 10, 'ComputerName': 'HOST-1'})
+        self.assertEqual(alert['affected_hosts'], ['HOST-1'])
+        self.assertEqual(detector.observe({'EventID': 4625, 'LogonType': 10}), [])
+
+
+class SigmaCacheTests(TestCase):
+    def test_compiled_rules_are_reused(self):
+        cache = SigmaCache()
+        rule = cache.compile(RULES['strings'])
+        self.assertIs(cache.compile(RULES['strings']), rule)
+        cache.prune([])
+        self.assertIsNot(cache.compile(RULES['strings']), rule)
+
+    def test_reloads_the_file_another_process_saved(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'sigma-cache.pkl')
+            receiver = SigmaCache(path)
+            importer = SigmaCache(path)
+            importer.compile(RULES['network'])
+            self.assertTrue(importer.save())
+            # Make sure the mtime moves on filesystems with coarse timestamps
+            later = time.time() + 5
+            os.utime(path, (later, later))
+
+            self.assertTrue(receiver.refresh())
+            self.assertFalse(receiver.refresh())
+            self.assertEqual(len(receiver.entries), 1)
+            self.assertFalse(receiver._dirty)
@@ -0,0 +1,76 @@
+from unittest import TestCase, mock
+
+from apps.detection import geoip
+from apps.detection.travel import ImpossibleTravelDetector, haversine_km
+
+PARIS = geoip.Location('France', 'Paris', 48.8566, 2.3522)
+TOKYO = geoip.Location('Japan', 'Tokyo', 35.6762, 139.6503)
+LOCATIONS = {'1.1.1.1': PARIS, '2.2.2.2': TOKYO}
+
+
+def logon(account, ip, time):
+    return {'EventID': '4624', 'EventType': 'SuccessAudit', 'AccountName': account, 'SourceIP': ip,
+            'TimeGenerated': f'2024-03-29 {time} +0300', 'ComputerName': 'HOST-1'}
+
+
+class ImpossibleTravelTests(TestCase):
+    def test_haversine(self):
+        self.assertAlmostEqual(haversine_km(PARIS.latitude, PARIS.longitude, TOKYO.latitude, TOKYO.longitude),
+                               9712, delta=10)
+
+    def test_alerts_on_impossible_speed(self):
+        detector = ImpossibleTravelDetector(locate=LOCATIONS.get)
+        self.assertEqual(detector.observe(logon('alice', '1.1.1.1', '10:00:00')), [])
+        (alert,) = detector.observe(logon('alice', '2.2.2.2', '11:00:00'))
+        self.assertEqual(alert['source_ips'], ['1.1.1.1', '2.2.2.2'])
+        self.assertEqual(alert['affected_hosts'], ['HOST-1'])
+
+    def test_plausible_speed_and_failed_logons_are_ignored(self):
+        detector = ImpossibleTravelDetector(locate=LOCATIONS.get)
+        detector.observe(logon('alice', '1.1.1.1', '00:00:00'))
+        failed = dict(logon('alice', '2.2.2.2', '00:10:00'), EventType='FailureAudit')
+        self.assertEqual(detector.observe(failed), [])
+        self.assertEqual(detector.observe(logon('alice', '2.2.2.2', '23:00:00')), [])
+
+    def test_table_keeps_the_most_recently_seen_accounts(self):
+        detector = ImpossibleTravelDetector(capacity=2, max_accounts=3, locate=LOCATIONS.get)
+        for account in ('a', 'b', 'c'):
+            detector.observe(logon(account, '1.1.1.1', '10:00:00'))
+        detector.observe(logon('a', '1.1.1.1', '10:01:00'))
+        detector.observe(logon('d', '1.1.1.1', '10:02:00'))
+        self.assertEqual(len(detector), 3)
+        self.assertEqual(list(detector._slots), ['c', 'a', 'd'])
+        self.assertEqual(len(detector._seen), 3)
+        # 'b' was evicted, so its next logon starts a new history instead of alerting
+        self.assertEqual(detector.observe(logon('b', '2.2.2.2', '10:03:00')), [])
+        self.assertEqual(len(detector.observe(logon('d', '2.2.2.2', '10:04:00'))), 1)
+
+    def test_skips_logons_without_a_geoip_database(self):
+        def unavailable(ip):
+            raise FileNotFoundError(ip)
+        detector = ImpossibleTravelDetector(locate=unavailable)
+        self.assertEqual(detector.observe(logon('alice', '1.1.1.1', '10:00:00')), [])
+        self.assertEqual(len(detector), 0)
+
+
+class GetReaderTests(TestCase):
+    def setUp(self):
+        patcher = mock.patch.multiple(geoip, _reader=None, _reader_version=None, _reader_error=None, _next_check=0.0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_missing_file_is_checked_once_per_interval(self):
+        with mock.patch.dict('os.environ', {'GEOIP_CITY_DB': '/nonexistent/GeoLite2-City.mmdb'}), \
+                mock.patch.object(geoip, '_file_version', side_effect=FileNotFoundError('missing')) as version, \
+                self.assertLogs(geoip.logger, 'WARNING') as logged:
+            for _ in range(3):
+                with self.assertRaises(OSError):
+                    geoip.get_reader()
+        self.assertEqual(version.call_count, 1)
+        self.assertEqual(len(logged.output), 1)
+
+    def test_path_from_environment(self):
+        with mock.patch.dict('os.environ', {'GEOIP_CITY_DB': '/data/city.mmdb'}):
+            self.assertEqual(geoip.db_path(), '/data/city.mmdb')
+        with mock.patch.dict('os.environ', {'GEOIP_PATH': '/data'}, clear=True):
+            self.assertEqual(geoip.db_path(), '/data/GeoLite2-City.mmdb')
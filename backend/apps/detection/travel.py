@@ -0,0 +1,124 @@
+"""
+Impossible-travel detection on successful logons.
+
+Each account's last known location and time live in flat NumPy arrays indexed
+through a dict, so the per-event cost is a dict lookup, a cached GeoIP lookup and
+a haversine distance. The table keeps the `max_accounts` most recently seen
+accounts; the least recently seen one gives up its slot to a new account.
+"""
+import math
+from collections import OrderedDict
+
+import numpy as np
+
+from . import geoip
+from .alerts import build_alert
+from .events import is_successful_logon, parse_time, present
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = (math.sin((lat2 - lat1) / 2) ** 2
+         + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a))
+
+
+class ImpossibleTravelDetector:
+    """
+    Raise an alert when two successful logons for the same account imply a travel
+    speed above `max_speed_kmh`. Jumps shorter than `min_distance_km` are ignored,
+    since GeoLite2 city coordinates are only accurate to tens of kilometres.
+    Without a GeoIP database logons are skipped (see geoip.get_reader).
+    """
+    rule_name = 'impossible_travel'
+
+    def __init__(self, max_speed_kmh=900.0, min_distance_km=500.0, capacity=1024, max_accounts=100000,
+                 locate=geoip.lookup):
+        self.max_speed_kmh = max_speed_kmh
+        self.min_distance_km = min_distance_km
+        self.max_accounts = max_accounts
+        self.locate = locate
+        # account -> slot, least recently seen first
+        self._slots = OrderedDict()
+        self._ips = []
+        self._lat = np.empty(capacity, dtype=np.float32)
+        self._lon = np.empty(capacity, dtype=np.float32)
+        self._seen = np.empty(capacity, dtype=np.float64)
+
+    def __len__(self):
+        return len(self._slots)
+
+    def _grow(self):
+        capacity = min(len(self._seen) * 2, self.max_accounts)
+        self._lat = np.resize(self._lat, capacity)
+        self._lon = np.resize(self._lon, capacity)
+        self._seen = np.resize(self._seen, capacity)
+
+    def observe(self, log):
+        """Update the account's location from `log` and return any alerts raised."""
+        if not is_successful_logon(log):
+            return []
+        account, ip = log.get('AccountName'), log.get('SourceIP')
+        if not present(account) or not present(ip):
+            return []
+        seen = parse_time(log.get('TimeGenerated'))
+        if seen is None:
+            return []
+        try:
+            location = self.locate(ip)
+        except OSError:
+            return []
+        if location is None or location.latitude is None:
+            return []
+
+        slot = self._slots.get(account)
+        if slot is None:
+            self._slots[account] = self._free_slot()
+            self._store(self._slots[account], ip, location, seen)
+            return []
+        self._slots.move_to_end(account)
+
+        prev_ip = self._ips[slot]
+        prev_lat, prev_lon, prev_seen = float(self._lat[slot]), float(self._lon[slot]), float(self._seen[slot])
+        if seen >= prev_seen:
+            self._store(slot, ip, location, seen)
+
+        distance = haversine_km(prev_lat, prev_lon, location.latitude, location.longitude)
+        if distance < self.min_distance_km:
+            return []
+        hours = max(abs(seen - prev_seen), 1.0) / 3600
+        speed = distance / hours
+        if speed <= self.max_speed_kmh:
+            return []
+
+        return [build_alert(
+            rule_name=self.rule_name,
+            title=f"Impossible travel for {account}",
+            description=(
+                f"{account} logged on from {prev_ip} and {ip} ({location.city or location.country}), "
+                f"{distance:.0f} km apart within {hours * 60:.0f} minutes ({speed:.0f} km/h)."
+            ),
+            severity='high',
+            related_logs=[log['_id']] if log.get('_id') else [],
+            source_ips=[prev_ip, ip],
+            affected_hosts=[log['ComputerName']] if present(log.get('ComputerName')) else [],
+            tags=['impossible_travel', 'T1078'],
+        )]
+
+    def _free_slot(self):
+        if len(self._slots) >= self.max_accounts:
+            _, slot = self._slots.popitem(last=False)
+            return slot
+        slot = len(self._slots)
+        if slot == len(self._seen):
+            self._grow()
+        self._ips.append(None)
+        return slot
+
+    def _store(self, slot, ip, location, seen):
+        self._ips[slot] = ip
+        self._lat[slot] = location.latitude
+        self._lon[slot] = location.longitude
+        self._seen[slot] = seen
@@ -0,0 +1,347 @@
+"""
+Columnar Parquet archive of the logs, partitioned by day and device.
+
+Files are laid out Hive-style, so readers can prune partitions from the path:
+
+    <root>/day=2025-03-01/device=LAPTOP-45TZ9WK/part-<run>.parquet
+
+Logs are read from one Mongo cursor in time order and appended column by column
+to a batch buffer per partition. Every `row_group_rows` logs a buffer becomes one
+Arrow RecordBatch and one Parquet row group, so memory is bounded by the open
+partitions rather than the size of the range. Low-cardinality columns
+(ComputerName, EventType, Status, AccountName, ...) are dictionary-encoded, and
+TimeGenerated and the ingest timestamp are stored as timestamps.
+
+Each run writes to temporary files and, once done, replaces the files of every
+partition it wrote, so re-archiving a day gives the same result. Partitions for
+which the run found no logs are left as they are. Part files whose logs have
+been purged from MongoDB (see purge) are listed in the partition's marker file
+and kept, since MongoDB no longer holds their logs; only the other part files
+are replaced, so every log is archived once.
+"""
+import os
+import re
+import uuid
+import zipfile
+from datetime import datetime, timedelta, timezone
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from .rollups import log_time
+
+DAY_FORMAT = '%Y-%m-%d'
+UNKNOWN = 'unknown'
+ROW_GROUP_ROWS = 64 * 1024
+BATCH_SIZE = 5000
+COMPRESSION = 'zstd'
+# Archived _ids per delete when purging
+PURGE_BATCH = 1000
+# Part files of a partition whose logs were purged from MongoDB, one name per line;
+# readers skip files starting with _
+PURGED_MARKER = '_purged'
+# Bytes read from a part file at a time when zipping a partition
+ZIP_CHUNK_BYTES = 1024 * 1024
+
+_DICT = pa.dictionary(pa.int32(), pa.string())
+SCHEMA = pa.schema([
+    ('_id', pa.string()),
+    ('TimeGenerated', pa.timestamp('ms')),
+    ('timestamp', pa.timestamp('ms')),
+    ('ComputerName', _DICT),
+    ('EventType', _DICT),
+    ('Status', _DICT),
+    ('AccountName', _DICT),
+    ('EventID', pa.string()),
+    ('Level', pa.int32()),
+    ('SourceName', _DICT),
+    ('Channel', _DICT),
+    ('Technique', _DICT),
+    ('OperatingSystem', _DICT),
+    ('SourceIP', pa.string()),
+    ('SourceISP', _DICT),
+    ('country', _DICT),
+    ('KeywordTags', pa.list_(pa.string())),
+    ('Message', pa.string()),
+    # Lets the DuckDB read path (apps.logs.coldstore) answer token searches
+    ('SearchTokens', pa.list_(pa.string())),
+])
+# Fields read from Mongo; anything else in a log is not archived
+PROJECTION = dict.fromkeys(SCHEMA.names, 1)
+
+_UNSAFE = re.compile(r'[^A-Za-z0-9._-]')
+
+
+def partition_value(value):
+    """Path-safe form of a partition value."""
+    return _UNSAFE.sub('_', str(value)) or UNKNOWN
+
+
+def partition_dir(root, day, device):
+    return os.path.join(root, f'day={day}', f'device={partition_value(device)}')
+
+
+def time_range_query(start, end):
+    """
+    Logs with TimeGenerated on days start..end inclusive (dates). TimeGenerated is a
+    date or a 'YYYY-MM-DD HH:MM:SS +0300' string; strings compare by prefix.
+    """
+    since = datetime.combine(start, datetime.min.time())
+    until = datetime.combine(end + timedelta(days=1), datetime.min.time())
+    return {'$or': [
+        {'TimeGenerated': {'$gte': since, '$lt': until}},
+        {'TimeGenerated': {'$gte': since.strftime(DAY_FORMAT), '$lt': until.strftime(DAY_FORMAT)}},
+    ]}
+
+
+def archive_query(start, end, device=None):
+    """Logs of days start..end, optionally of one device: what archive_logs writes."""
+    query = time_range_query(start, end)
+    return {'$and': [query, {'ComputerName': device}]} if device else query
+
+
+def _timestamp(value):
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value)
+        except ValueError:
+            return None
+    if not isinstance(value, datetime):
+        return None
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def _int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _string(value):
+    return None if value is None else str(value)
+
+
+def _strings(value):
+    if not isinstance(value, list):
+        return None
+    return [str(item) for item in value]
+
+
+_CONVERTERS = {
+    '_id': _string,
+    'timestamp': _timestamp,
+    'Level': _int,
+    'KeywordTags': _strings,
+    'SearchTokens': _strings,
+}
+
+
+class _Batch:
+    """Column buffers for one partition's next row group."""
+
+    def __init__(self):
+        self.columns = {name: [] for name in SCHEMA.names}
+        self.rows = 0
+
+    def add(self, log, moment):
+        for name, values in self.columns.items():
+            if name == 'TimeGenerated':
+                values.append(moment)
+            else:
+                values.append(_CONVERTERS.get(name, _string)(log.get(name)))
+        self.rows += 1
+
+    def to_record_batch(self):
+        arrays = [pa.array(self.columns[field.name], type=field.type) for field in SCHEMA]
+        return pa.RecordBatch.from_arrays(arrays, schema=SCHEMA)
+
+
+class _Partition:
+    def __init__(self, directory, run_id, keep_ids=False):
+        self.directory = directory
+        self.path = os.path.join(directory, f'part-{run_id}.parquet')
+        self.temp_path = os.path.join(directory, f'.part-{run_id}.parquet.tmp')
+        self.batch = _Batch()
+        self.writer = None
+        self.rows = 0
+        self.ids = [] if keep_ids else None
+
+    def add(self, log, moment):
+        self.batch.add(log, moment)
+        if self.ids is not None:
+            self.ids.append(log['_id'])
+
+    def flush(self):
+        if not self.batch.rows:
+            return
+        if self.writer is None:
+            os.makedirs(self.directory, exist_ok=True)
+            self.writer = pq.ParquetWriter(self.temp_path, SCHEMA, compression=COMPRESSION)
+        self.writer.write_batch(self.batch.to_record_batch())
+        self.rows += self.batch.rows
+        self.batch = _Batch()
+
+    def close(self):
+        self.flush()
+        if self.writer is not None:
+            self.writer.close()
+
+    def commit(self):
+        # Replace what earlier runs wrote for this partition, except files MongoDB no longer has the logs of
+        kept = purged_files(self.directory)
+        for name in os.listdir(self.directory):
+            if name.endswith('.parquet') and name not in kept and os.path.join(self.directory, name) != self.path:
+                os.remove(os.path.join(self.directory, name))
+        os.replace(self.temp_path, self.path)
+
+    def discard(self):
+        if self.writer is not None:
+            self.writer.close()
+        if os.path.exists(self.temp_path):
+            os.remove(self.temp_path)
+
+
+def archive_logs(collection, root, start, end, device=None, batch_size=BATCH_SIZE, row_group_rows=ROW_GROUP_ROWS,
+                 keep_ids=False):
+    """
+    Write the logs of days start..end (dates, inclusive) to Parquet under `root`,
+    optionally for one device only. Returns [{day, device, rows, path}] per partition
+    written, with the archived _ids under `ids` if `keep_ids`.
+    """
+    query = archive_query(start, end, device)
+    run_id = f'{datetime.now():%Y%m%d%H%M%S}-{uuid.uuid4().hex[:8]}'
+    partitions = {}
+    try:
+        found = collection.find(query, PROJECTION).sort([('TimeGenerated', 1), ('_id', 1)]).batch_size(batch_size)
+        for log in found:
+            moment = log_time(log, None)
+            day = moment.strftime(DAY_FORMAT) if moment else UNKNOWN
+            # Keyed by directory, so names that sanitize alike share one partition
+            name = partition_value(log.get('ComputerName') or UNKNOWN)
+            partition = partitions.get((day, name))
+            if partition is None:
+                partition = partitions[day, name] = _Partition(partition_dir(root, day, name), run_id, keep_ids)
+            partition.add(log, moment)
+            if partition.batch.rows >= row_group_rows:
+                partition.flush()
+        for partition in partitions.values():
+            partition.close()
+    except BaseException:
+        for partition in partitions.values():
+            partition.discard()
+        raise
+
+    written = []
+    for (day, name), partition in sorted(partitions.items()):
+        partition.commit()
+        written.append({'day': day, 'device': name, 'rows': partition.rows, 'path': partition.path})
+        if keep_ids:
+            written[-1]['ids'] = partition.ids
+    return written
+
+
+def purged_files(directory):
+    """Names of the part files of a partition whose logs were purged from MongoDB."""
+    try:
+        with open(os.path.join(directory, PURGED_MARKER)) as marker:
+            return {line.strip() for line in marker if line.strip()}
+    except FileNotFoundError:
+        return set()
+
+
+def purge(collection, written, start, end, device=None, batch_size=PURGE_BATCH):
+    """
+    Delete from `collection` the logs an archive_logs(..., keep_ids=True) run over the
+    same days wrote, and nothing that arrived since. Returns the number deleted.
+    """
+    query = archive_query(start, end, device)
+    deleted = 0
+    for partition in written:
+        # Recorded first: if the deletes fail half way, a later run keeps this file (and may
+        # archive a log twice) rather than replacing it with what is left in MongoDB
+        directory, name = os.path.split(partition['path'])
+        with open(os.path.join(directory, PURGED_MARKER), 'a') as marker:
+            marker.write(name + '\n')
+        ids = partition['ids']
+        for i in range(0, len(ids), batch_size):
+            # The time bounds let partitioned logs route the delete
+            deleted += collection.delete_many({'$and': [query, {'_id': {'$in': ids[i:i + batch_size]}}]}).deleted_count
+    return deleted
+
+
+def partition_files(directory):
+    """Part files of a partition directory, oldest first."""
+    if not os.path.isdir(directory):
+        return []
+    return sorted(name for name in os.listdir(directory) if name.endswith('.parquet'))
+
+
+class _ZipSink:
+    """Write-only file object that hands what the zip writer wrote so far to a generator."""
+
+    def __init__(self):
+        self.parts = []
+        self.position = 0
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data, self.parts = b''.join(self.parts), []
+        return data
+
+
+def zipped(directory, files, chunk_size=ZIP_CHUNK_BYTES):
+    """
+    Byte chunks of a zip holding `files` of `directory`, built as it is read.
+    Entries are stored, not deflated, since Parquet pages are compressed already.
+    """
+    sink = _ZipSink()
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_STORED) as bundle:
+        for name in files:
+            with open(os.path.join(directory, name), 'rb') as source, \
+                    bundle.open(name, 'w', force_zip64=True) as entry:
+                while True:
+                    data = source.read(chunk_size)
+                    if not data:
+                        break
+                    entry.write(data)
+                    yield sink.drain()
+            yield sink.drain()
+    yield sink.drain()
+
+
+def list_partitions(root, start=None, end=None):
+    """[{day, device, files, bytes}] for the archived partitions, optionally of days start..end."""
+    partitions = []
+    if not os.path.isdir(root):
+        return partitions
+    for day_dir in sorted(os.listdir(root)):
+        if not day_dir.startswith('day='):
+            continue
+        day = day_dir[len('day='):]
+        if day != UNKNOWN and ((start and day < start.strftime(DAY_FORMAT)) or (end and day > end.strftime(DAY_FORMAT))):
+            continue
+        for device_dir in sorted(os.listdir(os.path.join(root, day_dir))):
+            if not device_dir.startswith('device='):
+                continue
+            directory = os.path.join(root, day_dir, device_dir)
+            files = partition_files(directory)
+            partitions.append({
+                'day': day,
+                'device': device_dir[len('device='):],
+                'files': files,
+                'bytes': sum(os.path.getsize(os.path.join(directory, name)) for name in files),
+            })
+    return partitions
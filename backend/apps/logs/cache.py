@@ -0,0 +1,172 @@
+"""
+Shared caching for expensive read-only views, on top of the Django cache API.
+
+With a shared backend (Redis in production, see CACHES in settings) every worker
+process reads the same entries. Two things keep an expiring entry from turning
+into a burst of identical aggregations:
+
+* single flight: only the caller that wins an atomic `cache.add` lock recomputes;
+  others wait briefly for its result instead of computing it themselves, and
+  compute it without the lock if it has not arrived after LOCK_SECONDS;
+* stale-while-revalidate: for `stale` seconds after an entry goes stale it is
+  still served, while one background thread refreshes it.
+
+`ingest_etag` adds conditional GETs on top: ETags derive from the ingest
+watermark, so polling clients get a 304 without any aggregation until new
+logs arrive.
+"""
+import functools
+import hashlib
+import logging
+import threading
+import time
+import uuid
+
+from django.core.cache import caches
+from rest_framework.response import Response
+
+from . import repository
+
+logger = logging.getLogger(__name__)
+
+CACHE_ALIAS = 'default'
+KEY_PREFIX = 'siem:'
+# Longest a recomputation may hold the lock; later callers take over after this
+LOCK_SECONDS = 30
+WAIT_INTERVAL = 0.05
+
+
+def _cache():
+    return caches[CACHE_ALIAS]
+
+
+def _acquire(lock_key):
+    """A token identifying this holder of `lock_key`, or None if someone else holds it."""
+    token = uuid.uuid4().hex
+    return token if _cache().add(lock_key, token, LOCK_SECONDS) else None
+
+
+def _release(lock_key, token):
+    # A lock that outlived LOCK_SECONDS may have been taken over; only delete our own.
+    # The cache API has no compare-and-delete, so a takeover between get and delete still slips through
+    if _cache().get(lock_key) == token:
+        _cache().delete(lock_key)
+
+
+def _refresh(key, compute, ttl, stale, cacheable, token=None):
+    """Compute and store the value; releases the lock if `token` says this caller holds it."""
+    try:
+        value = compute()
+        if cacheable(value):
+            _cache().set(key, (time.time() + ttl, value), ttl + stale)
+        return value
+    finally:
+        if token is not None:
+            _release(key + ':lock', token)
+
+
+def _refresh_in_background(key, compute, ttl, stale, cacheable, token):
+    def run():
+        try:
+            _refresh(key, compute, ttl, stale, cacheable, token)
+        except Exception:
+            logger.exception(f'Background refresh of {key} failed')
+    threading.Thread(target=run, daemon=True, name=f'cache-refresh {key}').start()
+
+
+def get_or_compute(key, compute, ttl, stale=0, cacheable=lambda value: True):
+    """
+    Return the cached value for `key`, computing it with `compute()` at most once
+    across all processes sharing the cache. Values are fresh for `ttl` seconds
+    and served stale for `stale` more while one caller refreshes them.
+    """
+    key = KEY_PREFIX + key
+    lock_key = key + ':lock'
+    cache = _cache()
+
+    entry = cache.get(key)
+    if entry is not None:
+        fresh_until, value = entry
+        if time.time() < fresh_until:
+            return value
+        token = _acquire(lock_key)
+        if token is not None:
+            _refresh_in_background(key, compute, ttl, stale, cacheable, token)
+        return value
+
+    deadline = time.time() + LOCK_SECONDS
+    token = _acquire(lock_key)
+    while token is None:
+        # Someone else is computing it; their result is ours too
+        time.sleep(WAIT_INTERVAL)
+        entry = cache.get(key)
+        if entry is not None:
+            return entry[1]
+        if time.time() > deadline:
+            # The holder is stuck or gone: compute without the lock, leaving it to expire
+            break
+        token = _acquire(lock_key)
+    return _refresh(key, compute, ttl, stale, cacheable, token)
+
+
+def cached_view(ttl, stale=None, vary_on_user=False):
+    """
+    Cache a read-only DRF function view's response data.
+
+    Keyed on the view name and its sorted query parameters (and the user, if
+    `vary_on_user`); only 200 responses are cached. Apply it below @api_view
+    and @permission_classes so authentication still runs on every request.
+    """
+    stale = ttl * 3 if stale is None else stale
+
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            params = sorted((name, tuple(request.GET.getlist(name))) for name in request.GET)
+            parts = [view.__module__, view.__name__, repr(args), repr(sorted(kwargs.items())), repr(params)]
+            if vary_on_user:
+                parts.append(str(request.user.pk))
+            key = 'view:' + hashlib.sha1('\0'.join(parts).encode()).hexdigest()
+
+            def compute():
+                # Read before computing, so the data is at least as new as the watermark
+                current = repository.ingest_watermark()
+                response = view(request, *args, **kwargs)
+                return response.status_code, response.data, current
+
+            status, data, current = get_or_compute(key, compute, ttl, stale, cacheable=lambda value: value[0] == 200)
+            response = Response(data, status=status)
+            # Lets ingest_etag tag cached data with the watermark it was computed at
+            response.watermark = current
+            return response
+        return wrapper
+    return decorator
+
+
+def _etag(request, current):
+    digest = hashlib.sha1(f'{request.get_full_path()}\0{current}'.encode()).hexdigest()[:24]
+    return f'W/"{digest}"'
+
+
+def ingest_etag(view):
+    """
+    Answer `If-None-Match` with 304 while no logs have been ingested since the
+    client's copy was computed. Apply it above @cached_view, if both are used.
+    """
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        current = repository.ingest_watermark()
+        etag = _etag(request, current)
+        if_none_match = {tag.strip() for tag in request.headers.get('If-None-Match', '').split(',')}
+        if etag in if_none_match:
+            response = Response(status=304)
+        else:
+            response = view(request, *args, **kwargs)
+            if response.status_code != 200:
+                return response
+            etag = _etag(request, getattr(response, 'watermark', current))
+        response['ETag'] = etag
+        # Browsers revalidate on every poll instead of reusing a copy unchecked
+        response['Cache-Control'] = 'private, no-cache'
+        return response
+    return wrapper
@@ -0,0 +1,415 @@
+"""
+Read path over the Parquet archive (apps.logs.archive), with embedded DuckDB.
+
+The API keeps expressing log queries as MongoDB filters. `compile_filter`
+translates the subset the log list produces (equality, $in/$nin/$all, ranges,
+$regex, $exists and $and/$or/$nor) into SQL over the archive columns, so both
+tiers answer the same filter. Before DuckDB opens any file, partitions are
+pruned by their day=/device= directories using the filter's TimeGenerated
+bounds and ComputerName equality.
+
+Archived TimeGenerated is the wall-clock timestamp the rollups use; logs whose
+time could not be parsed live in the day=unknown partition with a null time.
+"""
+import os
+import threading
+from datetime import datetime, time, timezone
+
+import duckdb
+
+from . import archive, rollups
+
+COLUMNS = frozenset(archive.SCHEMA.names)
+LIST_COLUMNS = frozenset(('KeywordTags', 'SearchTokens'))
+# Columns returned as log documents; search tokens are an index, as in LOG_PROJECTION
+RESULT_COLUMNS = [name for name in archive.SCHEMA.names if name != 'SearchTokens']
+ORDER = {'desc': 'ORDER BY "TimeGenerated" DESC NULLS LAST, "_id" DESC',
+         'asc': 'ORDER BY "TimeGenerated" ASC NULLS FIRST, "_id" ASC'}
+COMPARISONS = {'$gt': '>', '$gte': '>=', '$lt': '<', '$lte': '<='}
+
+
+class UnsupportedQuery(ValueError):
+    pass
+
+
+_connection = None
+_connection_lock = threading.Lock()
+
+# Counts keyed by the compiled filter and the state of the files it read, so they stay
+# valid until the archive changes; the log list counts on every page
+COUNT_CACHE_SIZE = 1024
+_count_cache = {}
+_count_cache_lock = threading.Lock()
+
+
+def _cursor():
+    """A cursor of the shared in-memory database; DuckDB cursors are not shared across threads."""
+    global _connection
+    if _connection is None:
+        with _connection_lock:
+            if _connection is None:
+                _connection = duckdb.connect(':memory:')
+    return _connection.cursor()
+
+
+def _value(value):
+    if isinstance(value, datetime) and value.tzinfo is not None:
+        return value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def _field_clause(field, condition, params):
+    if field not in COLUMNS:
+        raise UnsupportedQuery(f'{field} is not in the archive')
+    column = f'"{field}"'
+    is_list = field in LIST_COLUMNS
+    if not isinstance(condition, dict) or not any(key.startswith('$') for key in condition):
+        condition = {'$eq': condition}
+
+    clauses = []
+    for operator, operand in condition.items():
+        if operator == '$eq':
+            if operand is None:
+                clauses.append(f'{column} IS NULL')
+            else:
+                params.append(_value(operand))
+                clauses.append(f'list_contains({column}, ?)' if is_list else f'{column} = ?')
+        elif operator == '$ne':
+            params.append(_value(operand))
+            clauses.append(f'NOT coalesce(list_contains({column}, ?), false)' if is_list
+                           else f'({column} IS NULL OR {column} != ?)')
+        elif operator in ('$in', '$nin'):
+            values = [_value(value) for value in operand if value is not None]
+            if is_list:
+                params.append(values)
+                clause = f'coalesce(list_has_any({column}, ?), false)'
+            elif values:
+                params.extend(values)
+                clause = f'coalesce({column} IN ({", ".join("?" * len(values))}), false)'
+            else:
+                clause = 'false'
+            if None in operand:
+                clause = f'({clause} OR {column} IS NULL)'
+            clauses.append(clause if operator == '$in' else f'NOT {clause}')
+        elif operator == '$all':
+            params.append([_value(value) for value in operand])
+            if not is_list:
+                raise UnsupportedQuery(f'$all on {field}')
+            clauses.append(f'coalesce(list_has_all({column}, ?), false)')
+        elif operator in COMPARISONS:
+            if is_list:
+                raise UnsupportedQuery(f'{operator} on {field}')
+            params.append(_value(operand))
+            clauses.append(f'{column} {COMPARISONS[operator]} ?')
+        elif operator == '$regex':
+            flags = 'i' if 'i' in condition.get('$options', '') else ''
+            params.extend([operand, flags])
+            if is_list:
+                clauses.append(f'coalesce(len(list_filter({column}, token -> regexp_matches(token, ?, ?))) > 0, false)')
+            else:
+                clauses.append(f'coalesce(regexp_matches({column}, ?, ?), false)')
+        elif operator == '$options':
+            continue
+        elif operator == '$exists':
+            clauses.append(f'{column} IS {"NOT " if operand else ""}NULL')
+        else:
+            raise UnsupportedQuery(f'{operator} is not supported on the archive')
+    return ' AND '.join(clauses) or 'true'
+
+
+def _clause(query, params):
+    clauses = []
+    for key, value in query.items():
+        if key in ('$and', '$or', '$nor'):
+            parts = [f'({_clause(part, params)})' for part in value]
+            if key == '$and':
+                clauses.append(' AND '.join(parts) or 'true')
+            elif key == '$or':
+                clauses.append(f"({' OR '.join(parts) or 'false'})")
+            else:
+                clauses.append(f"NOT ({' OR '.join(parts) or 'false'})")
+        elif key.startswith('$'):
+            raise UnsupportedQuery(f'{key} is not supported on the archive')
+        else:
+            clauses.append(_field_clause(key, value, params))
+    return ' AND '.join(f'({clause})' for clause in clauses) or 'true'
+
+
+def compile_filter(query):
+    """SQL condition and parameters equivalent to a MongoDB filter over the archive columns."""
+    params = []
+    return _clause(query or {}, params), params
+
+
+def _top_level(query):
+    """The filter's top-level conditions, looking through $and."""
+    for key, value in (query or {}).items():
+        if key == '$and':
+            for part in value:
+                yield from _top_level(part)
+        else:
+            yield key, value
+
+
+def prune_bounds(query):
+    """(first day, last day, devices) the filter can match, each None when unbounded."""
+    first = last = devices = None
+    for field, condition in _top_level(query):
+        if field == 'TimeGenerated' and isinstance(condition, dict):
+            for operator, value in condition.items():
+                if not isinstance(value, datetime):
+                    continue
+                day = _value(value).date()
+                if operator in ('$gte', '$gt') and (first is None or day > first):
+                    first = day
+                elif operator in ('$lte', '$lt') and (last is None or day < last):
+                    # An exclusive bound at midnight does not reach that day
+                    if operator == '$lt' and _value(value).time() == time.min:
+                        day = day.fromordinal(day.toordinal() - 1)
+                    last = day
+        elif field == 'ComputerName':
+            if isinstance(condition, str):
+                devices = {condition}
+            elif isinstance(condition, dict) and isinstance(condition.get('$in'), list):
+                devices = {value for value in condition['$in'] if isinstance(value, str)}
+    return first, last, devices
+
+
+class ColdStore:
+    """Queries over the archive under `root`."""
+
+    def __init__(self, root):
+        self.root = root
+
+    def files(self, first=None, last=None, devices=None):
+        """Parquet files of the partitions in days first..last for `devices` (None: all)."""
+        wanted = {archive.partition_value(device) for device in devices} if devices is not None else None
+        paths = []
+        for partition in archive.list_partitions(self.root, first, last):
+            # Logs without a time cannot satisfy a time bound
+            if partition['day'] == archive.UNKNOWN and (first or last):
+                continue
+            if wanted is not None and partition['device'] not in wanted:
+                continue
+            directory = archive.partition_dir(self.root, partition['day'], partition['device'])
+            paths.extend(os.path.join(directory, name) for name in partition['files'])
+        return paths
+
+    def _paths(self, query, since=None, until=None):
+        first, last, devices = prune_bounds(query)
+        if since and (first is None or since.date() > first):
+            first = since.date()
+        if until and (last is None or until.date() < last):
+            last = until.date()
+        return self.files(first, last, devices)
+
+    def _source(self, query, since=None, until=None):
+        return self._from(self._paths(query, since, until))
+
+    @staticmethod
+    def _version(paths):
+        """What identifies the contents of `paths`: archive runs replace files, never rewrite them."""
+        version = []
+        for path in paths:
+            stat = os.stat(path)
+            version.append((path, stat.st_mtime_ns, stat.st_size))
+        return tuple(version)
+
+    @staticmethod
+    def _from(paths):
+        if not paths:
+            return None
+        listed = ', '.join("'" + path.replace("'", "''") + "'" for path in paths)
+        return f'read_parquet([{listed}], union_by_name = true)'
+
+    def _where(self, query, since=None, until=None):
+        condition, params = compile_filter(query)
+        clauses = [condition]
+        if since:
+            clauses.append('"TimeGenerated" >= ?')
+            params.append(_value(since))
+        if until:
+            # Untimed logs belong to the archive, as they sort after every timed one
+            clauses.append('("TimeGenerated" < ? OR "TimeGenerated" IS NULL)')
+            params.append(_value(until))
+        return ' AND '.join(clauses), params
+
+    def _rows(self, sql, params):
+        cursor = _cursor()
+        try:
+            cursor.execute(sql, params)
+            names = [column[0] for column in cursor.description]
+            return [
+                {name: value for name, value in zip(names, row) if value is not None}
+                for row in cursor.fetchall()
+            ]
+        finally:
+            cursor.close()
+
+    def find(self, query, until=None, skip=0, limit=10):
+        """Archived logs matching `query`, newest first, as log documents with string ids."""
+        source = self._source(query, until=until)
+        if source is None or limit <= 0:
+            return []
+        where, params = self._where(query, until=until)
+        columns = ', '.join(f'"{name}"' for name in RESULT_COLUMNS)
+        return self._rows(
+            f'SELECT {columns} FROM {source} WHERE {where} {ORDER["desc"]} LIMIT ? OFFSET ?',
+            params + [limit, skip],
+        )
+
+    def count(self, query, until=None, limit=None):
+        paths = self._paths(query, until=until)
+        if not paths:
+            return 0
+        where, params = self._where(query, until=until)
+        try:
+            version = self._version(paths)
+        except FileNotFoundError:
+            # Replaced by an archive run meanwhile
+            return self.count(query, until, limit)
+        key = (where, repr(params), limit, version)
+        cached = _count_cache.get(key)
+        if cached is not None:
+            return cached
+        source = self._from(paths)
+        if limit:
+            # Stop scanning once the cap is known to be exceeded
+            sql = f'SELECT count(*) AS n FROM (SELECT 1 FROM {source} WHERE {where} LIMIT ?)'
+            params = params + [limit]
+        else:
+            sql = f'SELECT count(*) AS n FROM {source} WHERE {where}'
+        total = self._rows(sql, params)[0]['n']
+        with _count_cache_lock:
+            if len(_count_cache) >= COUNT_CACHE_SIZE:
+                _count_cache.clear()
+            _count_cache[key] = total
+        return total
+
+    @staticmethod
+    def _seek(where, params, after, direction):
+        """Narrow `where` to logs strictly after (direction 'n') or before ('p') the key `after`."""
+        if after is None:
+            return where, params
+        value, doc_id = _value(after[0]), str(after[1])
+        op = '<' if direction == 'n' else '>'
+        # Nulls sort last, as null TimeGenerated sorts below every date in MongoDB
+        if value is None:
+            where += f' AND (("TimeGenerated" IS NULL AND "_id" {op} ?)'
+            where += ' OR "TimeGenerated" IS NOT NULL)' if direction == 'p' else ')'
+            return where, params + [doc_id]
+        where += (f' AND ("TimeGenerated" {op} ? OR ("TimeGenerated" = ? AND "_id" {op} ?)'
+                  + (' OR "TimeGenerated" IS NULL)' if direction == 'n' else ')'))
+        return where, params + [value, value, doc_id]
+
+    def scan(self, query, until=None, after=None, limit=0, batch_size=5000):
+        """Every archived log matching `query`, newest first, streamed `batch_size` rows at a time."""
+        source = self._source(query, until=until)
+        if source is None:
+            return
+        where, params = self._seek(*self._where(query, until=until), after, 'n')
+        columns = ', '.join(f'"{name}"' for name in RESULT_COLUMNS)
+        sql = f'SELECT {columns} FROM {source} WHERE {where} {ORDER["desc"]}'
+        if limit:
+            sql += f' LIMIT {int(limit)}'
+        cursor = _cursor()
+        try:
+            cursor.execute(sql, params)
+            names = [column[0] for column in cursor.description]
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                for row in rows:
+                    yield {name: value for name, value in zip(names, row) if value is not None}
+        finally:
+            cursor.close()
+
+    def page(self, query, page_size, after=None, direction='n', until=None):
+        """
+        Keyset page over (TimeGenerated, _id), newest first, mirroring pagination.keyset_page:
+        `after` is the (TimeGenerated, _id) of the cursor log, `direction` 'n' or 'p'.
+        Returns (logs, has_more) with logs newest first.
+        """
+        source = self._source(query, until=until)
+        if source is None:
+            return [], False
+        where, params = self._seek(*self._where(query, until=until), after, direction)
+        columns = ', '.join(f'"{name}"' for name in RESULT_COLUMNS)
+        order = ORDER['desc'] if direction == 'n' else ORDER['asc']
+        logs = self._rows(f'SELECT {columns} FROM {source} WHERE {where} {order} LIMIT ?', params + [page_size + 1])
+        has_more = len(logs) > page_size
+        logs = logs[:page_size]
+        if direction != 'n':
+            logs.reverse()
+        return logs, has_more
+
+    def facets(self, since, until):
+        """
+        Dashboard facets over archived logs with since <= TimeGenerated < until, in
+        the shapes of dashboard._facets over the rollups, from one grouping-sets scan.
+        """
+        source = self._source({}, since=since, until=until)
+        if source is None:
+            return {}
+        severity = ' '.join(
+            f"WHEN '{event_type}' THEN '{level}'" for event_type, level in rollups.SEVERITY_BY_EVENT_TYPE.items()
+        )
+        dims = ('ComputerName', 'EventType', 'Technique', 'os', 'day', 'severity')
+        sets = {
+            'stats': (),
+            'event_types': ('EventType',),
+            'alerts_by_agent': ('ComputerName',),
+            'alerts_evolution': ('day', 'severity'),
+            'mitre_attack': ('Technique',),
+            'os_severity_distribution': ('os', 'EventType'),
+        }
+        grouping_sets = ', '.join('(' + ', '.join(columns) + ')' for columns in sets.values())
+        sql = f'''
+            SELECT GROUPING({', '.join(dims)}) AS grouping_id, {', '.join(dims)},
+                   count(*) AS count, count(*) FILTER (WHERE critical) AS critical
+            FROM (
+                SELECT "ComputerName", "EventType",
+                       CASE WHEN regexp_full_match("Technique", ?) THEN "Technique" END AS "Technique",
+                       coalesce("OperatingSystem", ?) AS os,
+                       strftime("TimeGenerated", '%Y-%m-%d') AS day,
+                       CASE "EventType" {severity} ELSE 'low' END AS severity,
+                       ("EventType" = 'FailureAudit' OR coalesce("Level", 0) >= ?) AS critical
+                FROM {source}
+                WHERE "TimeGenerated" >= ? AND "TimeGenerated" < ?
+            )
+            GROUP BY GROUPING SETS ({grouping_sets})
+        '''
+        rows = self._rows(sql, [
+            rollups.TECHNIQUE_PATTERN.pattern, rollups.DEFAULT_OS, rollups.CRITICAL_LEVEL, _value(since), _value(until),
+        ])
+
+        def grouped(name):
+            # GROUPING() sets a bit, most significant first, for each column left out of the set
+            mask = sum(1 << (len(dims) - 1 - i) for i, dim in enumerate(dims) if dim not in sets[name])
+            return [row for row in rows if row['grouping_id'] == mask]
+
+        totals = grouped('stats')
+        evolution = {}
+        for row in grouped('alerts_evolution'):
+            evolution.setdefault(row['day'], []).append({'severity': row['severity'], 'count': row['count']})
+        return {
+            'stats': [{
+                '_id': None,
+                'total_events': row['count'],
+                'critical_alerts': row.get('critical', 0),
+                'active_threats': 0,
+            } for row in totals if row['count']],
+            'event_types': [{'_id': row.get('EventType'), 'count': row['count']} for row in grouped('event_types')],
+            'alerts_by_agent': [
+                {'agent': row.get('ComputerName', 'Unknown'), 'count': row['count']} for row in grouped('alerts_by_agent')
+            ],
+            'alerts_evolution': [{'_id': day, 'counts': counts} for day, counts in sorted(evolution.items())],
+            'mitre_attack': [
+                {'name': row['Technique'], 'value': row['count']} for row in grouped('mitre_attack') if 'Technique' in row
+            ],
+            'os_severity_distribution': [
+                {'_id': {'os': row.get('os'), 'level': row.get('EventType')}, 'count': row['count']}
+                for row in grouped('os_severity_distribution')
+            ],
+        }
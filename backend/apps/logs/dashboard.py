@@ -0,0 +1,220 @@
+"""
+The dashboard widgets, computed together in one `$facet` over the hour rollups.
+
+Every widget reads the same rollup documents, selected once by a `bucket` range
+on the rollup index, so a full dashboard costs one aggregation over
+O(hours x dimension combinations) documents. Only `critical_alerts` lists
+individual logs and is fetched separately from the raw logs by index.
+
+Windows longer than the hour rollups' retention are only served when there is a
+Parquet archive: the days before the rollups are counted from it with DuckDB
+(coldstore.ColdStore.facets) and merged into the facet results.
+"""
+from datetime import datetime, timedelta
+
+from . import repository, rollups, tiers
+
+DEFAULT_DAYS = 7
+# Hour rollups expire after this, so longer windows would be silently truncated
+MAX_DAYS = rollups.RETENTION[rollups.HOUR].days
+# Longest window when the days before the rollups can be read from the archive
+ARCHIVE_MAX_DAYS = 366
+
+CRITICAL_ALERT_TYPES = ['FailureAudit', 'Error']
+POSITIVE_EVENT_TYPES = ('SuccessAudit', 'Information', 'Success')
+NEGATIVE_EVENT_WEIGHTS = {'Error': 1.5, 'Warning': 2, 'FailureAudit': 3}
+
+
+def health_score(event_type_counts):
+    """
+    Weighted share of positive events, 0-100; 100 when there are no events.
+
+    SuccessAudit, Information and Success count for the system, Error, Warning
+    and FailureAudit against it, failures most heavily.
+    """
+    positive = sum(event_type_counts.get(event_type, 0) for event_type in POSITIVE_EVENT_TYPES)
+    negative = sum(event_type_counts.get(event_type, 0) * weight for event_type, weight in NEGATIVE_EVENT_WEIGHTS.items())
+    if positive + negative == 0:
+        return 100
+    return round(positive / (positive + negative) * 100)
+
+
+def format_evolution(results):
+    """[{date, critical, high, moderate, low}] from (date -> [{severity, count}]) groups."""
+    formatted = []
+    for entry in results:
+        row = {'date': entry['_id'], 'critical': 0, 'high': 0, 'moderate': 0, 'low': 0}
+        for counts in entry['counts']:
+            row[counts['severity']] = counts['count']
+        formatted.append(row)
+    return formatted
+
+
+def format_os_severity(results):
+    """[{os, critical, high, moderate, low}] from (os, EventType) counts."""
+    by_os = {}
+    for result in results:
+        row = by_os.setdefault(result['_id']['os'], {'critical': 0, 'high': 0, 'moderate': 0, 'low': 0})
+        event_type = result['_id']['level']
+        if event_type in rollups.SEVERITY_BY_EVENT_TYPE:
+            row[rollups.SEVERITY_BY_EVENT_TYPE[event_type]] += result['count']
+        elif event_type in POSITIVE_EVENT_TYPES:
+            row['low'] += result['count']
+    return [{'os': os_name, **counts} for os_name, counts in by_os.items()]
+
+
+def format_critical_alerts(logs):
+    return [
+        {
+            'id': str(log.get('_id')),
+            'timestamp': log.get('TimeGenerated'),
+            'source': log.get('ComputerName', 'Unknown'),
+            'type': log.get('OperatingSystem', 'Windows 11 Home'),
+            'source_ip': log.get('SourceIP', ''),
+        }
+        for log in logs
+    ]
+
+
+def _facets(now):
+    last_hour = rollups.truncate(now - timedelta(hours=1), rollups.HOUR)
+    last_day = rollups.truncate(now - timedelta(hours=24), rollups.HOUR)
+    return {
+        'stats': [
+            {'$group': {
+                '_id': None,
+                'total_events': {'$sum': '$count'},
+                'critical_alerts': {'$sum': {'$ifNull': ['$critical', 0]}},
+                'active_threats': {'$sum': {'$cond': [
+                    {'$gte': ['$bucket', last_hour]}, {'$ifNull': ['$critical', 0]}, 0,
+                ]}},
+            }},
+        ],
+        'event_types': [
+            {'$group': {'_id': '$EventType', 'count': {'$sum': '$count'}}},
+        ],
+        'alerts_by_agent': [
+            {'$group': {'_id': '$ComputerName', 'count': {'$sum': '$count'}}},
+            {'$project': {'agent': {'$ifNull': ['$_id', 'Unknown']}, 'count': 1, '_id': 0}},
+            {'$sort': {'count': -1}},
+        ],
+        'alerts_evolution': [
+            {'$group': {
+                '_id': {
+                    'date': {'$dateToString': {'format': '%Y-%m-%d', 'date': '$bucket'}},
+                    'severity': '$severity',
+                },
+                'count': {'$sum': '$count'},
+            }},
+            {'$group': {'_id': '$_id.date', 'counts': {'$push': {'severity': '$_id.severity', 'count': '$count'}}}},
+            {'$sort': {'_id': 1}},
+        ],
+        'mitre_attack': [
+            {'$match': {'Technique': {'$ne': None}}},
+            {'$group': {'_id': '$Technique', 'value': {'$sum': '$count'}}},
+            {'$project': {'name': '$_id', 'value': 1, '_id': 0}},
+            {'$sort': {'value': -1}},
+        ],
+        'os_severity_distribution': [
+            {'$group': {'_id': {'os': '$OperatingSystem', 'level': '$EventType'}, 'count': {'$sum': '$count'}}},
+        ],
+        'critical_logs_by_device': [
+            {'$match': {'bucket': {'$gte': last_day}}},
+            {'$group': {
+                '_id': '$ComputerName',
+                'critical': {'$sum': {'$cond': [{'$eq': ['$EventType', 'FailureAudit']}, '$count', 0]}},
+                'high': {'$sum': {'$cond': [{'$eq': ['$EventType', 'Warning']}, '$count', 0]}},
+            }},
+        ],
+    }
+
+
+def max_days():
+    return ARCHIVE_MAX_DAYS if tiers.cold_store() else MAX_DAYS
+
+
+def _sum_by(rows, key, value):
+    totals = {}
+    for row in rows:
+        totals[row[key]] = totals.get(row[key], 0) + row[value]
+    return sorted(({key: k, value: v} for k, v in totals.items()), key=lambda row: row[value], reverse=True)
+
+
+def merge_facets(data, cold):
+    """Add the archive's facet counts for the days before the rollups to the rollup facets."""
+    merged = dict(data)
+    if 'stats' in data:
+        totals = dict(data['stats'][0]) if data['stats'] else {
+            '_id': None, 'total_events': 0, 'critical_alerts': 0, 'active_threats': 0,
+        }
+        for row in cold.get('stats', []):
+            totals['total_events'] += row['total_events']
+            totals['critical_alerts'] += row['critical_alerts']
+        merged['stats'] = [totals]
+        merged['event_types'] = _sum_by(data['event_types'] + cold.get('event_types', []), '_id', 'count')
+    if 'alerts_by_agent' in data:
+        merged['alerts_by_agent'] = _sum_by(data['alerts_by_agent'] + cold.get('alerts_by_agent', []), 'agent', 'count')
+    if 'alerts_evolution' in data:
+        # The archive covers whole days before the rollup window, so days do not overlap
+        merged['alerts_evolution'] = cold.get('alerts_evolution', []) + data['alerts_evolution']
+    if 'mitre_attack' in data:
+        merged['mitre_attack'] = _sum_by(data['mitre_attack'] + cold.get('mitre_attack', []), 'name', 'value')
+    if 'os_severity_distribution' in data:
+        merged['os_severity_distribution'] = data['os_severity_distribution'] + cold.get('os_severity_distribution', [])
+    return merged
+
+
+# Widgets computed by the facet, plus the one read from raw logs
+WIDGETS = ('stats', 'alerts_by_agent', 'alerts_evolution', 'mitre_attack',
+           'os_severity_distribution', 'critical_logs_by_device', 'critical_alerts')
+
+
+def build(widgets=WIDGETS, days=DEFAULT_DAYS, now=None):
+    """Compute the requested widgets over the last `days` days, in the shapes of their own endpoints."""
+    now = now or datetime.now()
+    since = rollups.truncate(now - timedelta(days=days), rollups.HOUR)
+    cold = None
+    if days > MAX_DAYS:
+        store = tiers.cold_store()
+        if store is not None:
+            # Hour rollups start after this; the whole days before it come from the archive
+            boundary = rollups.truncate(now - timedelta(days=MAX_DAYS - 1), rollups.DAY)
+            cold = store.facets(since, boundary)
+            since = boundary
+    facets = _facets(now)
+    requested = {name: facets[name] for name in widgets if name in facets}
+    if 'stats' in widgets:
+        requested['event_types'] = facets['event_types']
+
+    data = {}
+    if requested:
+        pipeline = [{'$match': {'bucket': {'$gte': since}}}, {'$facet': requested}]
+        (facet,) = repository.aggregate_rollups(rollups.HOUR, pipeline)
+        data.update(merge_facets(facet, cold) if cold else facet)
+
+    widgets_out = {}
+    if 'stats' in widgets:
+        totals = data['stats'][0] if data['stats'] else {}
+        widgets_out['stats'] = {
+            'total_events': totals.get('total_events', 0),
+            'critical_alerts': totals.get('critical_alerts', 0),
+            'active_threats': totals.get('active_threats', 0),
+            'system_health': health_score({doc['_id']: doc['count'] for doc in data['event_types']}),
+        }
+    if 'alerts_by_agent' in widgets:
+        widgets_out['alerts_by_agent'] = data['alerts_by_agent']
+    if 'alerts_evolution' in widgets:
+        widgets_out['alerts_evolution'] = format_evolution(data['alerts_evolution'])
+    if 'mitre_attack' in widgets:
+        widgets_out['mitre_attack'] = data['mitre_attack']
+    if 'os_severity_distribution' in widgets:
+        widgets_out['os_severity_distribution'] = format_os_severity(data['os_severity_distribution'])
+    if 'critical_logs_by_device' in widgets:
+        widgets_out['critical_logs_by_device'] = {
+            row['_id']: {'critical': row['critical'], 'high': row['high']}
+            for row in data['critical_logs_by_device']
+        }
+    if 'critical_alerts' in widgets:
+        logs = repository.find_logs({'EventType': {'$in': CRITICAL_ALERT_TYPES}}, limit=5)
+        widgets_out['critical_alerts'] = format_critical_alerts(logs)
+    return widgets_out
@@ -0,0 +1,226 @@
+"""
+Index declarations for the logs database and the query shapes they serve.
+
+INDEXES lists, per collection, the compound indexes the API needs. Keys follow
+equality-sort-range order so that a filtered, time-sorted page is answered from
+the index without an in-memory SORT. query_shapes() gives one canonical query per
+endpoint; `provision_indexes` explains each of them and fails on any plan that
+still scans the collection or sorts in memory.
+
+Log collections stored as MongoDB time-series (apps.logs.timeseries) get
+TIMESERIES_LOG_INDEXES instead of INDEXES['logs'], since time-series
+collections refuse indexes that include _id or array (multikey) measurement fields.
+The API refuses the query shapes those indexes served (TIMESERIES_REFUSED_SHAPES)
+in that mode.
+"""
+from datetime import datetime, timedelta
+
+from pymongo import ASCENDING, DESCENDING, IndexModel
+
+from .partitions import LEGACY, STORED_PATTERN
+from .rollups import COLLECTIONS as ROLLUP_COLLECTIONS, DAY, rollup_indexes
+from .timeseries import META_FIELD
+
+NEWEST = ('TimeGenerated', DESCENDING)
+
+
+def _index(keys):
+    # Servers since 4.2 always build online and ignore `background`; older ones need it.
+    # Default names, so an index already created by the log receiver is not duplicated
+    return IndexModel(keys, background=True)
+
+
+INDEXES = {
+    'logs': [
+        # Log list (page and keyset cursor), date range and critical alerts sort
+        _index([NEWEST, ('_id', DESCENDING)]),
+        _index([('SourceIP', ASCENDING), NEWEST]),
+        _index([('SourceISP', ASCENDING), NEWEST]),
+        _index([('EventType', ASCENDING), NEWEST]),
+        _index([('ComputerName', ASCENDING), NEWEST]),
+        # No Level index: Level is only ever a range, which an index can only bound ahead of an
+        # in-memory sort; Level__gte pages walk the newest-first index above instead
+        _index([('KeywordTags', ASCENDING), NEWEST]),
+        # Token search (apps.logs.search)
+        _index([('SearchTokens', ASCENDING), NEWEST]),
+        # Attack map: the geographic aggregation reads only these fields, from the index
+        _index([('country', ASCENDING), ('latitude', ASCENDING), ('longitude', ASCENDING)]),
+    ],
+    'alerts': [
+        _index([('created_at', DESCENDING)]),
+        _index([('status', ASCENDING), ('created_at', DESCENDING)]),
+        _index([('severity', ASCENDING), ('created_at', DESCENDING)]),
+        # save_alerts upserts on this key
+        _index([('rule_name', ASCENDING), ('title', ASCENDING), ('first_seen', ASCENDING)]),
+    ],
+    'analysts_queue': [
+        # Queue list and its keyset cursor, optionally filtered by status and/or priority
+        _index([('added_at', DESCENDING), ('_id', DESCENDING)]),
+        _index([('status', ASCENDING), ('added_at', DESCENDING), ('_id', DESCENDING)]),
+        _index([('priority', ASCENDING), ('added_at', DESCENDING), ('_id', DESCENDING)]),
+        _index([('status', ASCENDING), ('priority', ASCENDING), ('added_at', DESCENDING), ('_id', DESCENDING)]),
+        # Claim next: highest priority, then oldest; and the sweep of expired leases
+        _index([('status', ASCENDING), ('priority_rank', DESCENDING), ('added_at', ASCENDING)]),
+        _index([('status', ASCENDING), ('lease_expires_at', ASCENDING)]),
+    ],
+    'users': [
+        _index([('username', ASCENDING)]),
+    ],
+    **rollup_indexes(),
+}
+
+
+# Time-series collections index the meta field, the time field and scalar measurements only:
+# no (TimeGenerated, _id) keyset index, and no KeywordTags or SearchTokens, which hold arrays
+TIMESERIES_LOG_INDEXES = [
+    _index([(META_FIELD, ASCENDING), NEWEST]),
+    _index([NEWEST]),
+    _index([('SourceIP', ASCENDING), NEWEST]),
+    _index([('SourceISP', ASCENDING), NEWEST]),
+    _index([('EventType', ASCENDING), NEWEST]),
+    _index([('country', ASCENDING), ('latitude', ASCENDING), ('longitude', ASCENDING)]),
+]
+
+
+# Query shapes the log list answers with a 400 under time-series storage, for want of their index
+TIMESERIES_REFUSED_SHAPES = ('logs', 'logs?tag', 'logs?search', 'logs?search=prefix*')
+
+
+def log_indexes(storage):
+    """Indexes for new log collections stored as `storage` (LOG_STORAGE: 'regular' or 'timeseries')."""
+    return TIMESERIES_LOG_INDEXES if storage == 'timeseries' else INDEXES['logs']
+
+
+def _log_collections(db):
+    """{name: collection type} of the logs collection and its time partitions, in one listCollections."""
+    listed = db.list_collections(filter={'name': {'$regex': STORED_PATTERN}})
+    return {info['name']: info.get('type', 'collection') for info in listed}
+
+
+def query_shapes(now=None):
+    """
+    Canonical queries per endpoint as (endpoint, collection, explain command).
+
+    Aggregations that must read every document (e.g. grouping all logs by
+    ComputerName) are not listed; they are served by rollups, not indexes.
+    """
+    now = now or datetime.now()
+    day_ago = now - timedelta(days=1)
+    newest = {'TimeGenerated': -1}
+    queue_order = {'added_at': -1, '_id': -1}
+
+    def find(collection, query, sort=None, limit=10):
+        command = {'find': collection, 'filter': query, 'limit': limit}
+        if sort:
+            command['sort'] = sort
+        return command
+
+    return [
+        ('logs', 'logs', find('logs', {}, {'TimeGenerated': -1, '_id': -1})),
+        ('logs?source_ip', 'logs', find('logs', {'SourceIP': '10.0.0.1'}, newest)),
+        ('logs?isp', 'logs', find('logs', {'SourceISP': 'Safaricom'}, newest)),
+        ('logs?EventType', 'logs', find('logs', {'EventType': 'FailureAudit'}, newest)),
+        ('logs?EventType (several)', 'logs', find('logs', {'EventType': {'$in': ['FailureAudit', 'Error']}}, newest)),
+        ('logs?Level__gte', 'logs', find('logs', {'Level': {'$gte': 13}}, newest)),
+        ('logs?tag', 'logs', find('logs', {'KeywordTags': 'mimikatz'}, newest)),
+        ('logs?search', 'logs', find('logs', {'SearchTokens': {'$all': ['failed', 'logon']}}, newest)),
+        ('logs?search=prefix*', 'logs', find('logs', {'SearchTokens': {'$regex': '^mimi'}})),
+        ('logs?start_date', 'logs', find('logs', {'TimeGenerated': {'$gte': day_ago}}, newest)),
+        ('logs/<id>', 'logs', find('logs', {'_id': 0}, limit=1)),
+        ('computer-names', 'logs', {'distinct': 'logs', 'key': 'ComputerName'}),
+        ('critical-alerts', 'logs', {
+            'aggregate': 'logs',
+            'pipeline': [
+                {'$match': {'$or': [{'EventType': 'FailureAudit'}, {'EventType': 'Error'}]}},
+                {'$sort': newest},
+                {'$limit': 5},
+            ],
+            'cursor': {},
+        }),
+        ('mitre-attack', ROLLUP_COLLECTIONS[DAY], {
+            'aggregate': ROLLUP_COLLECTIONS[DAY],
+            'pipeline': [
+                {'$match': {'Technique': {'$ne': None}}},
+                {'$group': {'_id': '$Technique', 'value': {'$sum': '$count'}}},
+            ],
+            'cursor': {},
+        }),
+        ('analytics/geographic', 'logs', {
+            'aggregate': 'logs',
+            'pipeline': [
+                {'$match': {'country': {'$type': 'string'}}},
+                {'$project': {'_id': 0, 'country': 1, 'latitude': 1, 'longitude': 1}},
+                {'$group': {'_id': '$country', 'count': {'$sum': 1}, 'lat': {'$avg': '$latitude'}}},
+            ],
+            'cursor': {},
+        }),
+        ('alerts', 'alerts', find('alerts', {}, {'created_at': -1})),
+        ('alerts?status', 'alerts', find('alerts', {'status': 'open'}, {'created_at': -1})),
+        ('alerts?severity', 'alerts', find('alerts', {'severity': 'critical'}, {'created_at': -1})),
+        ('analyst-queue', 'analysts_queue', find('analysts_queue', {}, queue_order)),
+        ('analyst-queue?status', 'analysts_queue', find('analysts_queue', {'status': 'pending'}, queue_order)),
+        ('analyst-queue?priority', 'analysts_queue', find('analysts_queue', {'priority': 'high'}, queue_order)),
+        ('analyst-queue?status&priority', 'analysts_queue', find(
+            'analysts_queue', {'status': 'pending', 'priority': {'$in': ['high', 'medium']}}, queue_order
+        )),
+        ('analyst-queue/claim', 'analysts_queue', find(
+            'analysts_queue',
+            {'$or': [{'status': 'pending'}, {'status': 'investigating', 'lease_expires_at': {'$lt': now}}]},
+            {'priority_rank': -1, 'added_at': 1},
+            limit=1,
+        )),
+        ('release_queue_claims', 'analysts_queue', find(
+            'analysts_queue', {'status': 'investigating', 'lease_expires_at': {'$lt': now}}
+        )),
+    ]
+
+
+def ensure_indexes(db, collections=None, partitioned=False):
+    """
+    Create the declared indexes; existing ones with the same spec are left alone.
+    With `partitioned` logs, the unpartitioned logs collection is only indexed if it
+    is left from before, since creating indexes would create it and every read would visit it.
+    """
+    created = {}
+    for collection, models in INDEXES.items():
+        if collections and collection not in collections:
+            continue
+        if collection != 'logs':
+            created[collection] = db[collection].create_indexes(models)
+            continue
+        # Time partitions (apps.logs.partitions) are queried the same way; each gets the
+        # index set its storage accepts
+        stored = _log_collections(db)
+        if not partitioned:
+            stored.setdefault(LEGACY, 'collection')
+        for name, kind in sorted(stored.items()):
+            created[name] = db[name].create_indexes(TIMESERIES_LOG_INDEXES if kind == 'timeseries' else models)
+    return created
+
+
+def plan_stages(plan):
+    """Yield every stage name in the winning plan of an explain() result."""
+    if isinstance(plan, dict):
+        if 'stage' in plan:
+            yield plan['stage']
+        for key, value in plan.items():
+            if key == 'stages':
+                # Aggregation stages left after pushdown run in memory, e.g. a blocking $sort
+                for stage in value:
+                    if '$sort' in stage:
+                        yield 'SORT'
+            # Rejected plans never run, and 'command' echoes the request itself
+            if key not in ('rejectedPlans', 'command', 'originalCommand'):
+                yield from plan_stages(value)
+    elif isinstance(plan, list):
+        for item in plan:
+            yield from plan_stages(item)
+
+
+BAD_STAGES = {'COLLSCAN': 'collection scan', 'SORT': 'in-memory sort'}
+
+
+def check_plan(db, command):
+    """Return the problems (collection scan, in-memory sort) in a command's query plan."""
+    explain = db.command('explain', command, verbosity='queryPlanner')
+    return sorted({BAD_STAGES[stage] for stage in plan_stages(explain) if stage in BAD_STAGES})
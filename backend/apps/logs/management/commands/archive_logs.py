@@ -0,0 +1,52 @@
+from datetime import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.logs import archive, tiers, watermark
+from apps.logs.mongo import get_db
+from apps.logs.repository import logs_collection
+
+
+def _date(value):
+    return datetime.strptime(value, archive.DAY_FORMAT).date()
+
+
+class Command(BaseCommand):
+    help = 'Writes the logs of a range of days to Parquet files partitioned by day and device'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', type=_date, required=True, help='First day to archive (YYYY-MM-DD)')
+        parser.add_argument('--end', type=_date, help='Last day to archive, inclusive (default: --start)')
+        parser.add_argument('--device', help='Only archive this ComputerName')
+        parser.add_argument('--output', default=settings.LOG_ARCHIVE_DIR, help='Archive root directory')
+        parser.add_argument('--batch-size', type=int, default=archive.BATCH_SIZE, help='Cursor batch size when reading logs')
+        parser.add_argument('--row-group-rows', type=int, default=archive.ROW_GROUP_ROWS, help='Rows per Parquet row group')
+        parser.add_argument('--purge', action='store_true',
+                            help='Delete the archived logs from MongoDB; they stay readable through the archive')
+
+    def handle(self, *args, **options):
+        start, end = options['start'], options['end'] or options['start']
+        if end < start:
+            raise CommandError('--end is before --start')
+        if options['purge']:
+            cutoff = tiers.cutoff()
+            # Before the cutoff the log list reads the archive, so purged logs stay visible
+            if cutoff is None or end >= cutoff.date():
+                raise CommandError('--purge only applies to days before the LOG_HOT_RETENTION_DAYS cutoff')
+            if options['output'] != settings.LOG_ARCHIVE_DIR:
+                raise CommandError('--purge needs the archive in LOG_ARCHIVE_DIR, where the log list reads it')
+        written = archive.archive_logs(
+            logs_collection(), options['output'], start, end, device=options['device'],
+            batch_size=options['batch_size'], row_group_rows=options['row_group_rows'], keep_ids=options['purge'],
+        )
+        for partition in written:
+            self.stdout.write(f"{partition['day']} {partition['device']}: {partition['rows']} logs")
+        total = sum(partition['rows'] for partition in written)
+        self.stdout.write(self.style.SUCCESS(f'Archived {total} logs into {len(written)} partitions under {options["output"]}'))
+        if options['purge']:
+            # Only the logs this run wrote; ones that arrived meanwhile wait for the next run
+            deleted = archive.purge(logs_collection(), written, start, end, options['device'])
+            if deleted:
+                watermark.bump(get_db())
+            self.stdout.write(self.style.SUCCESS(f'Deleted {deleted} archived logs from MongoDB'))
@@ -0,0 +1,40 @@
+from django.core.management.base import BaseCommand
+from pymongo import UpdateOne
+
+from apps.detection.geoip import lookup
+from apps.logs.repository import log_collections
+
+
+class Command(BaseCommand):
+    help = 'Stores country, city and coordinates on logs ingested before GeoIP enrichment, for the attack map'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Logs read per batch')
+
+    def handle(self, *args, **options):
+        # Private and unknown addresses stay without a country and are looked at again on each run
+        query = {'country': {'$exists': False}, 'SourceIP': {'$type': 'string'}}
+
+        located, scanned = 0, 0
+        # One collection at a time when logs are time-partitioned
+        for logs in log_collections():
+            last_id = None
+            while True:
+                # Walk by _id so each batch is an index seek, whatever has been updated so far
+                batch_query = dict(query, _id={'$gt': last_id}) if last_id is not None else query
+                batch = list(logs.find(batch_query, {'SourceIP': 1}).sort('_id', 1).limit(options['batch_size']))
+                if not batch:
+                    break
+                last_id = batch[-1]['_id']
+                scanned += len(batch)
+                requests = []
+                for log in batch:
+                    location = lookup(log['SourceIP'])
+                    if location is not None:
+                        fields = {field: value for field, value in location._asdict().items() if value is not None}
+                        requests.append(UpdateOne({'_id': log['_id']}, {'$set': fields}))
+                if requests:
+                    located += logs.bulk_write(requests, ordered=False).modified_count
+                self.stdout.write(f'{located} of {scanned} logs located')
+
+        self.stdout.write(self.style.SUCCESS(f'Located {located} of {scanned} logs'))
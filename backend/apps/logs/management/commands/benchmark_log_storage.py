@@ -0,0 +1,161 @@
+import random
+import statistics
+import time
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.logs import timeseries
+from apps.logs.dashboard import CRITICAL_ALERT_TYPES
+from apps.logs.indexes import INDEXES, TIMESERIES_LOG_INDEXES
+from apps.logs.mongo import get_db
+from apps.logs.repository import LOG_PROJECTION, LOGS, logs_collection
+
+REGULAR = 'bench_logs_regular'
+TIME_SERIES = 'bench_logs_timeseries'
+
+HOSTS = [f'HOST-{i:03d}' for i in range(40)]
+EVENT_TYPES = ['Information'] * 12 + ['SuccessAudit'] * 4 + ['Warning', 'Error', 'FailureAudit']
+OPERATING_SYSTEMS = ['Windows 11 Home', 'Windows 10 Pro', 'Windows Server 2022']
+SOURCES = ['Security', 'Microsoft-Windows-Kernel-General', 'Service Control Manager', 'Application Error']
+
+
+def synthetic_logs(count, days, now):
+    """Logs spread over the last `days` days, time-ordered per host, shaped like the receiver's."""
+    rng = random.Random(7)
+    start = now - timedelta(days=days)
+    logs = []
+    for i in range(count):
+        host = rng.choice(HOSTS)
+        event_type = rng.choice(EVENT_TYPES)
+        logs.append({
+            'TimeGenerated': start + timedelta(seconds=days * 86400 * i / count),
+            'EventID': str(rng.choice([4624, 4625, 4634, 4672, 7036, 1000])),
+            'EventType': event_type,
+            'Level': rng.randint(0, 15),
+            'SourceName': rng.choice(SOURCES),
+            'ComputerName': host,
+            'AccountName': f'user{rng.randint(1, 200)}',
+            'SourceIP': f'10.{rng.randint(0, 3)}.{rng.randint(0, 255)}.{rng.randint(1, 254)}',
+            'Channel': 'Security',
+            'OperatingSystem': OPERATING_SYSTEMS[HOSTS.index(host) % len(OPERATING_SYSTEMS)],
+            'Message': f'{event_type} event {i} on {host}',
+            'timestamp': datetime.utcnow().isoformat(),
+        })
+    return logs
+
+
+def raw_dashboard(since):
+    """The dashboard widgets computed from raw logs instead of the rollups."""
+    return [
+        {'$match': {'TimeGenerated': {'$gte': since}}},
+        {'$facet': {
+            'event_types': [{'$group': {'_id': '$EventType', 'count': {'$sum': 1}}}],
+            'alerts_by_agent': [
+                {'$group': {'_id': '$ComputerName', 'count': {'$sum': 1}}},
+                {'$sort': {'count': -1}},
+            ],
+            'alerts_evolution': [{'$group': {
+                '_id': {'date': {'$dateToString': {'format': '%Y-%m-%d', 'date': '$TimeGenerated'}}, 'type': '$EventType'},
+                'count': {'$sum': 1},
+            }}],
+            'os_severity_distribution': [
+                {'$group': {'_id': {'os': '$OperatingSystem', 'level': '$EventType'}, 'count': {'$sum': 1}}},
+            ],
+        }},
+    ]
+
+
+def queries(now):
+    """(name, function of a collection) for the raw-log reads behind the log list and the dashboard."""
+    day_ago, week_ago = now - timedelta(days=1), now - timedelta(days=7)
+    newest = [('TimeGenerated', -1), ('_id', -1)]
+    return [
+        ('log list, first page', lambda c: list(c.find({}, LOG_PROJECTION).sort(newest).limit(50))),
+        ('log list, one host, 24h', lambda c: list(
+            c.find({'ComputerName': HOSTS[0], 'TimeGenerated': {'$gte': day_ago}}, LOG_PROJECTION).sort(newest).limit(50)
+        )),
+        ('critical alerts', lambda c: list(
+            c.find({'EventType': {'$in': CRITICAL_ALERT_TYPES}}).sort('TimeGenerated', -1).limit(5)
+        )),
+        ('count, 24h', lambda c: c.count_documents({'TimeGenerated': {'$gte': day_ago}})),
+        ('dashboard from raw logs, 7 days', lambda c: list(c.aggregate(raw_dashboard(week_ago), allowDiskUse=True))),
+        ('dashboard from raw logs, all', lambda c: list(c.aggregate(raw_dashboard(datetime.min), allowDiskUse=True))),
+    ]
+
+
+def storage(db, name):
+    (stats,) = db[name].aggregate([{'$collStats': {'storageStats': {}}}])
+    storage_stats = stats['storageStats']
+    return storage_stats.get('storageSize', 0), storage_stats.get('totalIndexSize', 0)
+
+
+def timed(function, collection, repeat):
+    function(collection)  # warm the cache, so both layouts are timed from memory
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function(collection)
+        samples.append((time.perf_counter() - started) * 1000)
+    samples.sort()
+    return statistics.median(samples), samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+
+
+class Command(BaseCommand):
+    help = ('Compares storage size and query latency of the same logs in a regular and a time-series '
+            'collection. The dashboard endpoint reads rollups; its widgets are timed here from raw logs, '
+            'which is what the rollups are built from and what longer or filtered windows would need.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--logs', type=int, default=200000, help='Logs to load into each collection')
+        parser.add_argument('--days', type=int, default=30, help='Days the synthetic logs span')
+        parser.add_argument('--sample', action='store_true',
+                            help='Load the most recent logs of the logs collection instead of synthetic ones')
+        parser.add_argument('--repeat', type=int, default=10, help='Timed runs per query')
+        parser.add_argument('--keep', action='store_true', help='Keep the benchmark collections afterwards')
+
+    def handle(self, *args, **options):
+        db = get_db()
+        now = datetime.now()
+        if options['sample']:
+            logs = list(logs_collection().find({}, LOG_PROJECTION).sort('TimeGenerated', -1).limit(options['logs']))
+            if not logs:
+                raise CommandError(f'{LOGS} is empty; run without --sample')
+        else:
+            logs = synthetic_logs(options['logs'], options['days'], now)
+        # Both collections get identical documents, so only the storage layout differs
+        logs = [timeseries.native_time(log) for log in logs]
+
+        for name in (REGULAR, TIME_SERIES):
+            db.drop_collection(name)
+        db.create_collection(REGULAR)
+        db.create_collection(TIME_SERIES, **timeseries.collection_options())
+
+        try:
+            for name in (REGULAR, TIME_SERIES):
+                started = time.perf_counter()
+                for i in range(0, len(logs), 10000):
+                    # Copies, since insert_many sets _id on the documents it is given
+                    db[name].insert_many([dict(log) for log in logs[i:i + 10000]], ordered=False)
+                # Each layout gets the indexes it accepts, as ensure_indexes would create them
+                db[name].create_indexes(TIMESERIES_LOG_INDEXES if name == TIME_SERIES else INDEXES[LOGS])
+                self.stdout.write(f'{name}: loaded and indexed {len(logs)} logs in {time.perf_counter() - started:.1f}s')
+
+            self.stdout.write('')
+            self.stdout.write(f"{'':34}{'regular':>16}{'time-series':>16}")
+            sizes = {name: storage(db, name) for name in (REGULAR, TIME_SERIES)}
+            for label, index in (('storage size (MiB)', 0), ('index size (MiB)', 1)):
+                self.stdout.write(
+                    f'{label:34}{sizes[REGULAR][index] / 2**20:16.2f}{sizes[TIME_SERIES][index] / 2**20:16.2f}'
+                )
+            for label, function in queries(now):
+                regular = timed(function, db[REGULAR], options['repeat'])
+                series = timed(function, db[TIME_SERIES], options['repeat'])
+                self.stdout.write(
+                    f'{label + " (ms, p50/p95)":34}'
+                    f'{f"{regular[0]:.1f}/{regular[1]:.1f}":>16}{f"{series[0]:.1f}/{series[1]:.1f}":>16}'
+                )
+        finally:
+            if not options['keep']:
+                for name in (REGULAR, TIME_SERIES):
+                    db.drop_collection(name)
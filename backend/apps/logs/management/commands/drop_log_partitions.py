@@ -0,0 +1,36 @@
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.logs import watermark
+from apps.logs.mongo import get_db
+from apps.logs.partitions import PartitionedLogs
+
+
+class Command(BaseCommand):
+    help = 'Applies log retention by dropping whole time partitions instead of deleting logs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--keep-days', type=int, required=True,
+                            help='Drop partitions whose logs are all older than this many days')
+        parser.add_argument('--dry-run', action='store_true', help='List the partitions without dropping them')
+
+    def handle(self, *args, **options):
+        if not settings.LOG_PARTITIONING:
+            raise CommandError('LOG_PARTITIONING is not set; logs are not partitioned')
+        if options['keep_days'] < 1:
+            raise CommandError('--keep-days must be at least 1')
+        db = get_db()
+        logs = PartitionedLogs(db, settings.LOG_PARTITIONING)
+        before = (datetime.now() - timedelta(days=options['keep_days'])).date()
+        expired = logs.expired(before)
+        for name in expired:
+            self.stdout.write(name)
+        if options['dry_run']:
+            self.stdout.write(f'{len(expired)} partitions end before {before}')
+            return
+        logs.drop(expired)
+        if expired:
+            watermark.bump(db)
+        self.stdout.write(self.style.SUCCESS(f'Dropped {len(expired)} partitions ending before {before}'))
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+from pymongo import UpdateOne
+
+from apps.logs.repository import log_collections
+from apps.logs.search import SEARCH_FIELDS, TOKENS_FIELD, log_tokens
+
+
+class Command(BaseCommand):
+    help = 'Backfills SearchTokens on logs stored before token search, so they can be found with search'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Logs updated per bulk write')
+        parser.add_argument('--rebuild', action='store_true', help='Recompute tokens for every log, not only missing ones')
+
+    def handle(self, *args, **options):
+        query = {} if options['rebuild'] else {TOKENS_FIELD: {'$exists': False}}
+        projection = dict.fromkeys(SEARCH_FIELDS, 1)
+
+        updated = 0
+        # One collection at a time when logs are time-partitioned
+        for logs in log_collections():
+            last_id = None
+            while True:
+                # Walk by _id so each batch is an index seek, whatever has been updated so far
+                batch_query = dict(query, _id={'$gt': last_id}) if last_id is not None else query
+                batch = list(logs.find(batch_query, projection).sort('_id', 1).limit(options['batch_size']))
+                if not batch:
+                    break
+                last_id = batch[-1]['_id']
+                requests = [UpdateOne({'_id': log['_id']}, {'$set': {TOKENS_FIELD: log_tokens(log)}}) for log in batch]
+                updated += logs.bulk_write(requests, ordered=False).modified_count
+                self.stdout.write(f'{updated} logs tokenized')
+
+        self.stdout.write(self.style.SUCCESS(f'Tokenized {updated} logs'))
@@ -0,0 +1,115 @@
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.logs import timeseries, watermark
+from apps.logs.indexes import ensure_indexes
+from apps.logs.mongo import get_db
+from apps.logs.repository import LOGS
+
+
+def _boundaries(collection, ranges):
+    """Start _ids splitting `collection` into about `ranges` equal ranges, by skipping along the _id index."""
+    total = collection.estimated_document_count()
+    step = max(math.ceil(total / ranges), 1)
+    starts = [None]
+    for i in range(1, ranges):
+        found = list(collection.find({}, {'_id': 1}).sort('_id', 1).skip(i * step).limit(1))
+        if not found:
+            break
+        starts.append(found[0]['_id'])
+    return list(zip(starts, starts[1:] + [None]))
+
+
+def _copy_range(source, target, start, end, batch_size):
+    query = {}
+    if start is not None or end is not None:
+        query['_id'] = {}
+        if start is not None:
+            query['_id']['$gte'] = start
+        if end is not None:
+            query['_id']['$lt'] = end
+    copied, batch = 0, []
+    for log in source.find(query, batch_size=batch_size):
+        batch.append(timeseries.native_time(log))
+        if len(batch) >= batch_size:
+            target.insert_many(batch, ordered=False)
+            copied += len(batch)
+            batch = []
+    if batch:
+        target.insert_many(batch, ordered=False)
+        copied += len(batch)
+    return copied
+
+
+class Command(BaseCommand):
+    help = ('Recreates logs as a MongoDB time-series collection (meta field ComputerName) and copies the '
+            'existing logs into it in parallel batches, with TimeGenerated converted to native dates')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--backup', default='logs_regular',
+                            help='Name the regular logs collection is renamed to and copied from')
+        parser.add_argument('--granularity', default=timeseries.GRANULARITY, choices=('seconds', 'minutes', 'hours'),
+                            help='Bucket granularity of the time-series collection')
+        parser.add_argument('--expire-after-days', type=int, help='Let MongoDB delete logs older than this')
+        parser.add_argument('--workers', type=int, default=4, help='Parallel copy threads')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Logs per insert_many')
+        parser.add_argument('--drop-backup', action='store_true', help='Drop the regular collection once every log is copied')
+
+    def handle(self, *args, **options):
+        if settings.LOG_PARTITIONING:
+            raise CommandError('Partitioned logs are not migrated in place; new partitions are created as '
+                               'time-series collections once LOG_STORAGE=timeseries')
+        db = get_db()
+        backup = options['backup']
+        kind = timeseries.collection_type(db, LOGS)
+        if kind == 'timeseries':
+            if timeseries.collection_type(db, backup):
+                raise CommandError(f'{LOGS} is already a time-series collection and {backup} exists from an earlier '
+                                   f'run; compare their counts, then drop {backup}')
+            self.stdout.write(f'{LOGS} is already a time-series collection')
+            return
+        if kind is None:
+            timeseries.ensure_collection(db, LOGS, granularity=options['granularity'])
+            ensure_indexes(db, [LOGS])
+            self.stdout.write(self.style.SUCCESS(f'Created {LOGS} as a time-series collection'))
+            return
+        if timeseries.collection_type(db, backup):
+            raise CommandError(f'{backup} already exists')
+
+        # Point the receiver at the new collection (LOG_STORAGE=timeseries) right after this rename;
+        # logs it stores meanwhile go to the new collection, not to the one being copied
+        db[LOGS].rename(backup)
+        expire = options['expire_after_days'] * 86400 if options['expire_after_days'] else None
+        timeseries.ensure_collection(db, LOGS, granularity=options['granularity'], expire_after_seconds=expire)
+        self.stdout.write(f'Renamed {LOGS} to {backup} and created {LOGS} as a time-series collection')
+
+        source, target = db[backup], db[LOGS]
+        ranges = _boundaries(source, options['workers'] * 4)
+        started = time.perf_counter()
+        copied = 0
+        with ThreadPoolExecutor(max_workers=options['workers']) as pool:
+            futures = [
+                pool.submit(_copy_range, source, target, start, end, options['batch_size'])
+                for start, end in ranges
+            ]
+            for future in as_completed(futures):
+                copied += future.result()
+                self.stdout.write(f'{copied} logs copied')
+        # Indexes build faster once, over the loaded buckets, than during the copy
+        ensure_indexes(db, [LOGS])
+        watermark.bump(db)
+
+        elapsed = time.perf_counter() - started
+        expected = source.count_documents({})
+        self.stdout.write(self.style.SUCCESS(
+            f'Copied {copied} of {expected} logs into the time-series {LOGS} in {elapsed:.1f}s'
+        ))
+        if copied != expected:
+            raise CommandError(f'{backup} was kept: {expected - copied} logs were not copied')
+        if options['drop_backup']:
+            source.drop()
+            self.stdout.write(f'Dropped {backup}')
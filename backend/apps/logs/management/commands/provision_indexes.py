@@ -0,0 +1,43 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.logs.indexes import INDEXES, TIMESERIES_REFUSED_SHAPES, check_plan, ensure_indexes, query_shapes
+from apps.logs.mongo import get_db
+
+
+class Command(BaseCommand):
+    help = 'Creates the indexes each API query shape needs and verifies their plans with explain()'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--collection', action='append', choices=sorted(INDEXES),
+                            help='Only provision and check this collection (repeatable)')
+        parser.add_argument('--check-only', action='store_true', help='Verify query plans without creating indexes')
+        parser.add_argument('--skip-check', action='store_true', help='Create indexes without verifying query plans')
+
+    def handle(self, *args, **options):
+        db = get_db()
+        collections = options['collection']
+
+        if not options['check_only']:
+            for collection, names in ensure_indexes(db, collections, partitioned=bool(settings.LOG_PARTITIONING)).items():
+                self.stdout.write(f"{collection}: {', '.join(names)}")
+
+        if options['skip_check']:
+            return
+
+        failures = 0
+        for endpoint, collection, command in query_shapes():
+            if collections and collection not in collections:
+                continue
+            if settings.LOG_STORAGE == 'timeseries' and endpoint in TIMESERIES_REFUSED_SHAPES:
+                self.stdout.write(f'{endpoint}: refused with time-series storage')
+                continue
+            problems = check_plan(db, command)
+            if problems:
+                failures += 1
+                self.stdout.write(self.style.ERROR(f"{endpoint}: {', '.join(problems)}"))
+            else:
+                self.stdout.write(self.style.SUCCESS(f'{endpoint}: ok'))
+
+        if failures:
+            raise CommandError(f'{failures} query shapes are not fully served by an index')
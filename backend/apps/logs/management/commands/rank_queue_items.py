@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from pymongo import UpdateMany
+
+from apps.logs.repository import QUEUE_PRIORITIES, priority_rank, queue_collection
+
+
+class Command(BaseCommand):
+    help = 'Sets priority_rank on analyst queue items added before claim-next, so they are claimed in priority order'
+
+    def handle(self, *args, **options):
+        requests = [
+            UpdateMany({'priority': priority}, {'$set': {'priority_rank': priority_rank(priority)}})
+            for priority in QUEUE_PRIORITIES
+        ]
+        # Anything else ranks with the lowest priority, as insert_queue_item does
+        requests.append(UpdateMany({'priority': {'$nin': list(QUEUE_PRIORITIES)}}, {'$set': {'priority_rank': 0}}))
+        updated = queue_collection().bulk_write(requests, ordered=False).modified_count
+        self.stdout.write(self.style.SUCCESS(f'Ranked {updated} queue items'))
@@ -0,0 +1,46 @@
+from collections import Counter
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand
+
+from apps.logs import rollups, watermark
+from apps.logs.mongo import get_db
+from apps.logs.repository import logs_collection
+
+PROJECTION = dict.fromkeys(('TimeGenerated', 'Level') + rollups.DIMENSIONS, 1)
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the dashboard rollup collections from the raw logs'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int,
+                            help='Only rebuild this many most recent days (default: everything)')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Cursor batch size when reading logs')
+
+    def handle(self, *args, **options):
+        db = get_db()
+        query, bucket_range = {}, {}
+        if options['days']:
+            since = rollups.truncate(datetime.now() - timedelta(days=options['days'] - 1), rollups.DAY)
+            # TimeGenerated is a date or a 'YYYY-MM-DD HH:MM:SS +0300' string; strings compare by prefix
+            query = {'$or': [
+                {'TimeGenerated': {'$gte': since}},
+                {'TimeGenerated': {'$gte': since.strftime('%Y-%m-%d %H:%M:%S')}},
+            ]}
+            bucket_range = {'bucket': {'$gte': since}}
+
+        counts = Counter()
+        scanned = 0
+        for log in logs_collection().find(query, PROJECTION, batch_size=options['batch_size']):
+            rollups.count_log(counts, log)
+            scanned += 1
+
+        # Ingest keeps incrementing while this runs; counts added between the scan
+        # and the swap below are lost, so rebuild closed days when that matters
+        for collection in rollups.COLLECTIONS.values():
+            db[collection].delete_many(bucket_range)
+        written = rollups.write_counts(db, counts, replace=True)
+        watermark.bump(db)
+
+        self.stdout.write(self.style.SUCCESS(f'Rolled up {scanned} logs into {written} rollup documents'))
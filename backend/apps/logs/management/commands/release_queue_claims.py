@@ -0,0 +1,22 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from apps.logs.repository import release_expired_claims
+
+
+class Command(BaseCommand):
+    help = ('Returns analyst queue items whose claim lease ran out to pending, so listings stop showing '
+            'them as investigated; claims already take such items over without it')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=int, default=0,
+                            help='Re-run every N seconds instead of exiting after one pass')
+
+    def handle(self, *args, **options):
+        while True:
+            released = release_expired_claims()
+            self.stdout.write(self.style.SUCCESS(f'Released {released} expired claims'))
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,66 @@
+"""
+Process-wide MongoDB client for the logs database.
+
+PyMongo clients own a connection pool and background monitor threads, so each
+process should create exactly one and share it. The client is created lazily on
+first use and recreated after a fork (e.g. gunicorn pre-fork workers), since a
+client inherited from the parent process must not be used in the child.
+"""
+import os
+import threading
+
+from django.conf import settings
+from pymongo import MongoClient
+
+_client = None
+_client_pid = None
+_lock = threading.Lock()
+
+
+def _client_options():
+    options = {
+        'maxPoolSize': 50,
+        'minPoolSize': 0,
+        'maxIdleTimeMS': 60000,
+        'connectTimeoutMS': 5000,
+        'serverSelectionTimeoutMS': 5000,
+        'socketTimeoutMS': 30000,
+        # zstd/snappy need extra packages; override in MONGO_CLIENT_OPTIONS when installed
+        'compressors': 'zlib',
+        'appname': 'siem-backend',
+    }
+    options.update(getattr(settings, 'MONGO_CLIENT_OPTIONS', {}))
+    return options
+
+
+def get_client():
+    """Return this process's MongoClient, creating it on first use or after a fork."""
+    global _client, _client_pid
+    pid = os.getpid()
+    if _client is None or _client_pid != pid:
+        with _lock:
+            if _client is None or _client_pid != pid:
+                # The parent's client is not closed here: its sockets belong to the parent
+                _client = MongoClient(settings.DATABASES['logs']['CLIENT']['host'], **_client_options())
+                _client_pid = pid
+    return _client
+
+
+def get_db():
+    return get_client()[settings.DATABASES['logs']['NAME']]
+
+
+def get_collection(name):
+    return get_db()[name]
+
+
+def _reset_after_fork():
+    # Another thread may have held the lock at fork time, so replace it rather than acquire it
+    global _client, _client_pid, _lock
+    _lock = threading.Lock()
+    _client = None
+    _client_pid = None
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
@@ -0,0 +1,126 @@
+"""
+Keyset (cursor) pagination over (TimeGenerated, _id), newest first.
+
+A cursor encodes the sort key of the last (or first) log on a page, and the next
+page is fetched with a range predicate on that key rather than `.skip()`, so
+every page costs O(page_size) on the {TimeGenerated: -1, _id: -1} index.
+Other collections page the same way on their own time field (`field`), e.g. the
+analyst queue on added_at.
+
+TimeGenerated is stored either as a BSON date or as a string, and MongoDB sorts
+all dates above all strings, which sort above null/missing. Range operators only
+compare values of the same type, so the seek predicate also has to include the
+documents whose TimeGenerated has a lower (or higher) type than the cursor's.
+"""
+import base64
+import binascii
+from datetime import datetime
+
+from bson import json_util
+from bson.errors import BSONError
+
+SORT_FIELD = 'TimeGenerated'
+
+NEXT = 'n'
+PREV = 'p'
+
+# BSON sort order of the types TimeGenerated takes, lowest first
+_NULL, _STRING, _DATE = 0, 1, 2
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def _rank(value):
+    if isinstance(value, datetime):
+        return _DATE
+    if isinstance(value, str):
+        return _STRING
+    return _NULL
+
+
+def encode_cursor(doc, direction, field=SORT_FIELD):
+    payload = json_util.dumps([doc.get(field), doc['_id'], direction])
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Return (value, _id, direction) from a cursor made by encode_cursor."""
+    try:
+        payload = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        value, doc_id, direction = json_util.loads(payload)
+    except (binascii.Error, BSONError, ValueError, TypeError):
+        raise InvalidCursor('Invalid cursor')
+    if direction not in (NEXT, PREV) or not isinstance(value, (datetime, str, type(None))):
+        raise InvalidCursor('Invalid cursor')
+    return value, doc_id, direction
+
+
+def _lower_types(rank, field):
+    if rank == _DATE:
+        return {field: {'$not': {'$type': 'date'}}}
+    if rank == _STRING:
+        return {field: {'$not': {'$type': ['string', 'date']}}}
+    return None
+
+
+def _higher_types(rank, field):
+    if rank == _NULL:
+        return {field: {'$type': ['string', 'date']}}
+    if rank == _STRING:
+        return {field: {'$type': 'date'}}
+    return None
+
+
+def seek_query(value, doc_id, direction, field=SORT_FIELD):
+    """Predicate matching documents strictly after (NEXT) or before (PREV) the key."""
+    op = '$lt' if direction == NEXT else '$gt'
+    rank = _rank(value)
+    if rank == _NULL:
+        # $lt/$gt never match null, so only the _id tie-break applies within nulls
+        clauses = [{field: None, '_id': {op: doc_id}}]
+    else:
+        clauses = [
+            {field: {op: value}},
+            {field: value, '_id': {op: doc_id}},
+        ]
+    other = _lower_types(rank, field) if direction == NEXT else _higher_types(rank, field)
+    if other:
+        clauses.append(other)
+    return {'$or': clauses}
+
+
+def keyset_page(collection, query, page_size, cursor=None, projection=None, max_time_ms=None, field=SORT_FIELD):
+    """
+    Fetch one page of `query`, newest `field` first, and the cursors around it.
+
+    Returns (docs, next_cursor, prev_cursor); a cursor is None when there is
+    nothing further in that direction. Documents keep their raw `_id`.
+    """
+    direction = NEXT
+    if cursor:
+        value, doc_id, direction = decode_cursor(cursor)
+        seek = seek_query(value, doc_id, direction, field)
+        query = {'$and': [query, seek]} if query else seek
+
+    sort = [(field, -1), ('_id', -1)] if direction == NEXT else [(field, 1), ('_id', 1)]
+    # One extra document tells whether another page exists in this direction
+    found = collection.find(query, projection).sort(sort).limit(page_size + 1)
+    if max_time_ms:
+        found = found.max_time_ms(max_time_ms)
+    docs = list(found)
+    has_more = len(docs) > page_size
+    docs = docs[:page_size]
+    if direction == PREV:
+        docs.reverse()
+    if not docs:
+        return docs, None, None
+
+    if direction == NEXT:
+        has_next, has_prev = has_more, bool(cursor)
+    else:
+        has_next, has_prev = True, has_more
+    next_cursor = encode_cursor(docs[-1], NEXT, field) if has_next else None
+    prev_cursor = encode_cursor(docs[0], PREV, field) if has_prev else None
+    return docs, next_cursor, prev_cursor
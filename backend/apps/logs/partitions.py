@@ -0,0 +1,380 @@
+"""
+Time-partitioned log storage: one collection per day or ISO week instead of one
+ever-growing `logs` collection.
+
+A partition is named after its first day, `logs_YYYYMMDD` (the Monday for
+weekly partitions), and holds the logs whose TimeGenerated falls in it; logs
+without a usable time go to the partition of the moment they arrive. Retention
+drops whole collections, and index builds and compaction work on one
+partition at a time.
+
+PartitionedLogs stands in for the `logs` collection. Reads go only to the
+partitions overlapping the query's TimeGenerated bounds, plus the unpartitioned
+`logs` collection if one is left from before partitioning was enabled. Bounded
+reads (pages, counts, single logs) run concurrently on a shared thread pool and
+are merge-sorted on the requested sort; unbounded scans stream a lazy merge of
+the partition cursors. The list of partitions is cached for NAMES_TTL seconds,
+and refreshed at once when this process creates or drops one. Aggregations run once, on the newest partition, with the
+others pulled in through $unionWith, so $group and $sort stages see every log.
+
+Kept free of Django imports so the Fluent Bit receiver can write partitions.
+"""
+import heapq
+import logging
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from pymongo.errors import CollectionInvalid, OperationFailure
+from pymongo.results import DeleteResult
+
+from .rollups import log_time
+
+LEGACY = 'logs'
+PREFIX = 'logs_'
+DAY, WEEK = 'day', 'week'
+GRANULARITIES = (DAY, WEEK)
+SPAN = {DAY: timedelta(days=1), WEEK: timedelta(days=7)}
+NAME_PATTERN = re.compile(r'^logs_(\d{8})$')
+# Partitions and the legacy collection, in one listCollections
+STORED_PATTERN = r'^logs(_\d{8})?$'
+# Seconds a listing of the stored partitions is reused; other processes' new partitions show up within it
+NAMES_TTL = 10
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+
+def executor(workers=8):
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='log-partitions')
+    return _executor
+
+
+def partition_start(moment, granularity):
+    day = moment.date() if isinstance(moment, datetime) else moment
+    if granularity == WEEK:
+        day -= timedelta(days=day.weekday())
+    return day
+
+
+def partition_name(moment, granularity):
+    return PREFIX + partition_start(moment, granularity).strftime('%Y%m%d')
+
+
+def partition_day(name):
+    """First day of partition `name`, or None if it is not a partition."""
+    match = NAME_PATTERN.match(name)
+    return datetime.strptime(match.group(1), '%Y%m%d').date() if match else None
+
+
+def partition_names(db):
+    """Every partition in `db`, newest first."""
+    names = db.list_collection_names(filter={'name': {'$regex': NAME_PATTERN.pattern}})
+    return sorted(names, reverse=True)
+
+
+def _moment(value):
+    if isinstance(value, datetime):
+        return value.replace(tzinfo=None)
+    if isinstance(value, str):
+        for length, layout in ((19, '%Y-%m-%d %H:%M:%S'), (10, '%Y-%m-%d')):
+            try:
+                return datetime.strptime(value[:length], layout)
+            except ValueError:
+                continue
+    return None
+
+
+def _field_bounds(condition):
+    since = until = None
+    if not isinstance(condition, dict):
+        moment = _moment(condition)
+        return moment, moment
+    for operator, value in condition.items():
+        moment = _moment(value)
+        if moment is None:
+            continue
+        if operator in ('$gte', '$gt', '$eq'):
+            since = moment if since is None else max(since, moment)
+        if operator in ('$lte', '$lt', '$eq'):
+            until = moment if until is None else min(until, moment)
+    return since, until
+
+
+def time_bounds(query):
+    """(since, until) TimeGenerated bounds implied by `query`, each None when open."""
+    since = until = None
+
+    def narrow(bounds):
+        nonlocal since, until
+        if bounds[0] is not None:
+            since = bounds[0] if since is None else max(since, bounds[0])
+        if bounds[1] is not None:
+            until = bounds[1] if until is None else min(until, bounds[1])
+
+    for key, value in (query or {}).items():
+        if key == 'TimeGenerated':
+            narrow(_field_bounds(value))
+        elif key == '$and':
+            for part in value:
+                narrow(time_bounds(part))
+        elif key == '$or' and value:
+            # Bounded only if every branch is, by the widest of them
+            branches = [time_bounds(part) for part in value]
+            lows, highs = [low for low, _ in branches], [high for _, high in branches]
+            narrow((None if None in lows else min(lows), None if None in highs else max(highs)))
+    return since, until
+
+
+def _rank(value):
+    # BSON sort order of the types logs are sorted on
+    if value is None:
+        return 0
+    if isinstance(value, (int, float)):
+        return 1
+    if isinstance(value, str):
+        return 2
+    if isinstance(value, ObjectId):
+        return 3
+    if isinstance(value, datetime):
+        return 4
+    return 5
+
+
+def _sort_key(sort):
+    fields = [field for field, _ in sort]
+
+    def key(doc):
+        return tuple((_rank(doc.get(field)), doc.get(field) if doc.get(field) is not None else 0) for field in fields)
+    return key
+
+
+def _normalize_sort(sort):
+    if isinstance(sort, str):
+        return [(sort, 1)]
+    return list(sort)
+
+
+def _with_sort_fields(projection, sort):
+    """
+    (`projection` widened to return every field of `sort`, fields to strip again),
+    since the merge orders partitions by values the caller may not have asked for.
+    """
+    if not projection or not sort:
+        return projection, []
+    if isinstance(projection, (list, tuple)):
+        projection = dict.fromkeys(projection, 1)
+    projection = dict(projection)
+    inclusive = any(value for field, value in projection.items() if field != '_id')
+    added = []
+    for field, _ in sort:
+        if field == '_id' or inclusive:
+            if not projection.get(field, field == '_id'):
+                projection[field] = 1
+                added.append(field)
+        elif field in projection:
+            del projection[field]
+            added.append(field)
+    # PyMongo reads an empty projection as _id only
+    return projection or None, added
+
+
+class _FanOutCursor:
+    """The chainable subset of a PyMongo Cursor the repository uses, over several partitions."""
+
+    def __init__(self, logs, query, projection):
+        self._logs = logs
+        self._query = query
+        self._projection = projection
+        self._stripped = []
+        self._sort = None
+        self._skip = 0
+        self._limit = 0
+        self._max_time_ms = None
+        self._batch_size = None
+
+    def sort(self, key, direction=None):
+        self._sort = _normalize_sort(key) if direction is None else [(key, direction)]
+        self._projection, self._stripped = _with_sort_fields(self._projection, self._sort)
+        return self
+
+    def skip(self, skip):
+        self._skip = skip
+        return self
+
+    def limit(self, limit):
+        self._limit = limit
+        return self
+
+    def max_time_ms(self, max_time_ms):
+        self._max_time_ms = max_time_ms
+        return self
+
+    def batch_size(self, batch_size):
+        self._batch_size = batch_size
+        return self
+
+    def _cursor(self, collection, limit):
+        found = collection.find(self._query, self._projection)
+        if self._sort:
+            found = found.sort(self._sort)
+        if limit:
+            found = found.limit(limit)
+        if self._max_time_ms:
+            found = found.max_time_ms(self._max_time_ms)
+        if self._batch_size:
+            found = found.batch_size(self._batch_size)
+        return found
+
+    def __iter__(self):
+        collections = self._logs.collections(self._query)
+        if self._limit:
+            # Each partition can contribute at most skip + limit logs to the page
+            wanted = self._skip + self._limit
+            streams = self._logs.map(lambda collection: list(self._cursor(collection, wanted)), collections)
+        else:
+            streams = [self._cursor(collection, 0) for collection in collections]
+
+        if self._sort:
+            directions = {direction for _, direction in self._sort}
+            if len(directions) > 1:
+                raise ValueError('Partitioned sorts need one direction for every key')
+            merged = heapq.merge(*streams, key=_sort_key(self._sort), reverse=directions == {-1})
+        else:
+            merged = (doc for stream in streams for doc in stream)
+
+        for position, doc in enumerate(merged):
+            if self._limit and position >= self._skip + self._limit:
+                break
+            if position >= self._skip:
+                for field in self._stripped:
+                    doc.pop(field, None)
+                yield doc
+
+
+class PartitionedLogs:
+    """Collection-like access to the log partitions of `db` (see the module docstring)."""
+
+    def __init__(self, db, granularity, index_models=(), workers=8, collection_options=None):
+        if granularity not in GRANULARITIES:
+            raise ValueError(f'Log partitioning must be one of {", ".join(GRANULARITIES)}')
+        self.database = db
+        self.granularity = granularity
+        self.index_models = list(index_models)
+        self.workers = workers
+        # create_collection options for new partitions, e.g. timeseries.collection_options()
+        self.collection_options = collection_options
+        self._indexed = set()
+        # (monotonic time listed, stored collection names)
+        self._stored = None
+
+    # Writes
+
+    def partition_for(self, log):
+        moment = log_time(log, None) or datetime.now()
+        name = partition_name(moment, self.granularity)
+        if name not in self._indexed:
+            if self.collection_options:
+                try:
+                    self.database.create_collection(name, **self.collection_options)
+                except CollectionInvalid:
+                    pass
+            if self.index_models:
+                # create_indexes is a no-op for indexes that exist, so a restart only costs one call per partition.
+                # Best effort: a partition without indexes is slow to read, one that refuses logs loses them
+                try:
+                    self.database[name].create_indexes(self.index_models)
+                except OperationFailure as e:
+                    logger.warning('Could not index log partition %s: %s', name, e)
+            self._indexed.add(name)
+            self._stored = None
+        return self.database[name]
+
+    def insert_one(self, log):
+        return self.partition_for(log).insert_one(log)
+
+    # Routing
+
+    def stored(self):
+        """Names of the partitions and the legacy collection, listed at most every NAMES_TTL seconds."""
+        listed = self._stored
+        if listed is None or time.monotonic() - listed[0] > NAMES_TTL:
+            names = self.database.list_collection_names(filter={'name': {'$regex': STORED_PATTERN}})
+            listed = self._stored = (time.monotonic(), names)
+        return listed[1]
+
+    def collections(self, query=None):
+        """Partitions that can hold logs matching `query`, newest first, then the legacy collection."""
+        since, until = time_bounds(query)
+        span = SPAN[self.granularity]
+        stored = self.stored()
+        names = []
+        for name in sorted(stored, reverse=True):
+            if name == LEGACY:
+                continue
+            start = datetime.combine(partition_day(name), datetime.min.time())
+            if (until is None or start <= until) and (since is None or start + span > since):
+                names.append(name)
+        if LEGACY in stored:
+            names.append(LEGACY)
+        return [self.database[name] for name in names]
+
+    def map(self, function, collections):
+        if len(collections) <= 1:
+            return [function(collection) for collection in collections]
+        return list(executor(self.workers).map(function, collections))
+
+    # Reads
+
+    def find(self, query=None, projection=None, batch_size=None):
+        found = _FanOutCursor(self, query or {}, projection)
+        return found.batch_size(batch_size) if batch_size else found
+
+    def find_one(self, query=None, projection=None):
+        found = self.map(lambda collection: collection.find_one(query, projection), self.collections(query))
+        return next((doc for doc in found if doc is not None), None)
+
+    def count_documents(self, query, limit=None, **options):
+        if limit:
+            options['limit'] = limit
+        total = sum(self.map(lambda collection: collection.count_documents(query, **options), self.collections(query)))
+        return min(total, limit) if limit else total
+
+    def distinct(self, key, query=None):
+        values = self.map(lambda collection: collection.distinct(key, query), self.collections(query))
+        return list(dict.fromkeys(value for found in values for value in found))
+
+    def aggregate(self, pipeline, **kwargs):
+        match = pipeline[0]['$match'] if pipeline and '$match' in pipeline[0] else None
+        collections = self.collections(match)
+        if not collections:
+            return iter(())
+        first, others = collections[0], collections[1:]
+        head = [pipeline[0]] if match is not None else []
+        unions = [{'$unionWith': {'coll': collection.name, 'pipeline': head}} for collection in others]
+        return first.aggregate(head + unions + pipeline[len(head):], **kwargs)
+
+    def delete_many(self, query):
+        deleted = self.map(lambda collection: collection.delete_many(query).deleted_count, self.collections(query))
+        return DeleteResult({'n': sum(deleted)}, True)
+
+    # Retention
+
+    def expired(self, before):
+        """Partitions that end on or before the date `before`, oldest first."""
+        span = SPAN[self.granularity]
+        return sorted(
+            name for name in partition_names(self.database)
+            if datetime.combine(partition_day(name), datetime.min.time()) + span <= datetime.combine(before, datetime.min.time())
+        )
+
+    def drop(self, names):
+        for name in names:
+            self.database.drop_collection(name)
+            self._indexed.discard(name)
+        self._stored = None
@@ -0,0 +1,378 @@
+"""
+Data access for the logs database.
+
+Views call these functions instead of opening their own PyMongo connections;
+everything goes through the shared client in apps.logs.mongo.
+"""
+import threading
+import time
+from datetime import datetime, timedelta
+
+from bson import ObjectId, json_util
+from django.conf import settings
+from pymongo import ReturnDocument
+
+from apps.detection.keywords import KEYWORDS_COLLECTION
+from . import timeseries, watermark
+from .indexes import log_indexes
+from .partitions import PartitionedLogs
+from .mongo import get_collection, get_db
+from .pagination import NEXT, InvalidCursor, decode_cursor, encode_cursor, keyset_page, seek_query
+from .rollups import COLLECTIONS as ROLLUP_COLLECTIONS
+from .search import TOKENS_FIELD
+
+LOGS = 'logs'
+ALERTS = 'alerts'
+ALERT_RULES = 'alert_rules'
+ANALYST_QUEUE = 'analysts_queue'
+USERS = 'users'
+
+NEWEST_FIRST = [('TimeGenerated', -1)]
+# Search tokens are an index, not something the API returns
+LOG_PROJECTION = {TOKENS_FIELD: 0}
+
+# Log-list totals are cached this many seconds per normalized filter
+COUNT_CACHE_TTL = getattr(settings, 'LOG_COUNT_CACHE_TTL', 30)
+COUNT_CACHE_SIZE = 1024
+
+# Queue priorities, lowest first; claims take the highest priority_rank, then the oldest
+QUEUE_PRIORITIES = ('low', 'medium', 'high', 'critical')
+# A claimed item returns to the queue if its lease is not renewed within this many seconds
+QUEUE_LEASE_SECONDS = getattr(settings, 'ANALYST_QUEUE_LEASE_SECONDS', 15 * 60)
+# What an update may change; claims, leases and ranks are only set by the functions below
+QUEUE_UPDATE_FIELDS = ('status', 'priority', 'notes', 'resolution', 'resolved_at', 'resolved_by')
+CLAIM_FIELDS = ('assigned_to', 'claimed_at', 'lease_expires_at')
+
+_count_cache = {}
+_count_cache_lock = threading.Lock()
+# One partition router per process, so its partition listing and created-partition set are shared
+_partitioned_logs = None
+
+
+def stringify_id(doc):
+    """Convert a document's ObjectId to a string in place so it can be serialized."""
+    if doc is not None and '_id' in doc:
+        doc['_id'] = str(doc['_id'])
+    return doc
+
+
+# Logs
+
+def logs_collection():
+    """The logs collection, or a router over the time partitions when LOG_PARTITIONING is set."""
+    global _partitioned_logs
+    if settings.LOG_PARTITIONING:
+        db = get_db()
+        # A new client means a new process, e.g. after a fork
+        if _partitioned_logs is None or _partitioned_logs.database.client is not db.client:
+            options = timeseries.collection_options() if settings.LOG_STORAGE == 'timeseries' else None
+            _partitioned_logs = PartitionedLogs(
+                db, settings.LOG_PARTITIONING, log_indexes(settings.LOG_STORAGE), settings.LOG_PARTITION_WORKERS,
+                collection_options=options,
+            )
+        return _partitioned_logs
+    return get_collection(LOGS)
+
+
+def log_collections(query=None):
+    """The physical collections holding logs that can match `query`, for batch jobs that update logs in place."""
+    logs = logs_collection()
+    return logs.collections(query) if isinstance(logs, PartitionedLogs) else [logs]
+
+
+def find_logs(query, skip=0, limit=10, sort=NEWEST_FIRST, projection=LOG_PROJECTION, max_time_ms=None):
+    cursor = logs_collection().find(query, projection).sort(sort)
+    if skip:
+        cursor = cursor.skip(skip)
+    if max_time_ms:
+        cursor = cursor.max_time_ms(max_time_ms)
+    return [stringify_id(log) for log in cursor.limit(limit)]
+
+
+def find_logs_page(query, page_size, cursor=None, projection=LOG_PROJECTION, max_time_ms=None):
+    """Keyset page of logs, newest first; returns (logs, next_cursor, prev_cursor)."""
+    logs, next_cursor, prev_cursor = keyset_page(
+        logs_collection(), query, page_size, cursor, projection, max_time_ms=max_time_ms
+    )
+    return [stringify_id(log) for log in logs], next_cursor, prev_cursor
+
+
+def iter_logs(query, cursor=None, projection=LOG_PROJECTION, batch_size=None, limit=0, max_time_ms=None):
+    """
+    Server-side cursor over every log matching `query`, newest first, for exports.
+
+    `cursor` is a next-page cursor (see log_cursor_after) to resume after a given log.
+    """
+    if cursor:
+        value, doc_id, direction = decode_cursor(cursor)
+        if direction != NEXT:
+            raise InvalidCursor('Exports resume from a next cursor')
+        seek = seek_query(value, doc_id, direction)
+        query = {'$and': [query, seek]} if query else seek
+    found = logs_collection().find(query, projection).sort([('TimeGenerated', -1), ('_id', -1)]).limit(limit)
+    if batch_size:
+        found = found.batch_size(batch_size)
+    if max_time_ms:
+        found = found.max_time_ms(max_time_ms)
+    return found
+
+
+def log_cursor_after(log_id):
+    """Next-page cursor positioned just after a log, or None if there is no such log."""
+    if not ObjectId.is_valid(log_id):
+        return None
+    log = logs_collection().find_one({'_id': ObjectId(log_id)}, {'TimeGenerated': 1})
+    return encode_cursor(log, NEXT) if log else None
+
+
+def rank_logs(query, stages, skip=0, limit=10):
+    """Run `query` through scoring `stages` (see search.relevance_stages) and return one page."""
+    pipeline = [{'$match': query}, *stages, {'$skip': skip}, {'$limit': limit}, {'$project': LOG_PROJECTION}]
+    return [stringify_id(log) for log in logs_collection().aggregate(pipeline)]
+
+
+def count_logs(query=None):
+    return logs_collection().count_documents(query or {})
+
+
+def count_logs_cached(query, limit=None, max_time_ms=None):
+    """
+    Count logs matching `query`, stopping at `limit` if given.
+
+    Returns (total, capped); capped means there are more than `limit` matches and
+    total is `limit`. Results are reused for COUNT_CACHE_TTL seconds, keyed by the
+    filter with its keys sorted, so paging through one result set counts it once.
+    """
+    key = (json_util.dumps(query, sort_keys=True), limit)
+    now = time.monotonic()
+    cached = _count_cache.get(key)
+    if cached and now - cached[0] < COUNT_CACHE_TTL:
+        return cached[1]
+
+    options = {'maxTimeMS': max_time_ms} if max_time_ms else {}
+    if limit:
+        # Counting one past the cap is enough to know the cap was exceeded
+        total = logs_collection().count_documents(query, limit=limit + 1, **options)
+        result = (limit, True) if total > limit else (total, False)
+    else:
+        result = (logs_collection().count_documents(query, **options), False)
+
+    with _count_cache_lock:
+        if len(_count_cache) >= COUNT_CACHE_SIZE:
+            for stale in [k for k, (at, _) in _count_cache.items() if now - at >= COUNT_CACHE_TTL]:
+                del _count_cache[stale]
+            if len(_count_cache) >= COUNT_CACHE_SIZE:
+                _count_cache.clear()
+        _count_cache[key] = (now, result)
+    return result
+
+
+def get_log(log_id):
+    return stringify_id(logs_collection().find_one({'_id': ObjectId(log_id)}, LOG_PROJECTION))
+
+
+def get_logs_by_id(log_ids):
+    """Fetch several logs in one query; returns {str id: log}, skipping ids that are not ObjectIds."""
+    object_ids = list({ObjectId(log_id) for log_id in log_ids if ObjectId.is_valid(log_id)})
+    if not object_ids:
+        return {}
+    logs = logs_collection().find({'_id': {'$in': object_ids}}, LOG_PROJECTION)
+    return {log['_id']: log for log in map(stringify_id, logs)}
+
+
+def aggregate_logs(pipeline, **kwargs):
+    return list(logs_collection().aggregate(pipeline, **kwargs))
+
+
+def aggregate_rollups(granularity, pipeline):
+    """Aggregate over the minute, hour or day rollup collection (see apps.logs.rollups)."""
+    return list(get_collection(ROLLUP_COLLECTIONS[granularity]).aggregate(pipeline))
+
+
+def ingest_watermark():
+    return watermark.read(get_db())
+
+
+def bump_ingest_watermark():
+    """Mark logs as written outside the receiver, so conditional GETs see the change."""
+    watermark.bump(get_db())
+
+
+def computer_names():
+    return logs_collection().distinct('ComputerName')
+
+
+# Users
+
+def find_user(username):
+    return get_collection(USERS).find_one({'username': username})
+
+
+def display_name(user, default):
+    if not user:
+        return default
+    return f"{user.get('first_name', '')} {user.get('last_name', '')}".strip() or default
+
+
+def display_names(usernames):
+    """Map each username to its display name with one query; unknown names map to themselves."""
+    names = {username: username for username in usernames if isinstance(username, str)}
+    if names:
+        users = get_collection(USERS).find(
+            {'username': {'$in': list(names)}}, {'username': 1, 'first_name': 1, 'last_name': 1}
+        )
+        for user in users:
+            names[user['username']] = display_name(user, user['username'])
+    return names
+
+
+# Alerts and alert rules
+
+def alerts_collection():
+    return get_collection(ALERTS)
+
+
+def get_alert_rule(rule_id):
+    return get_collection(ALERT_RULES).find_one({'_id': ObjectId(rule_id)})
+
+
+# Analyst queue
+
+def queue_collection():
+    return get_collection(ANALYST_QUEUE)
+
+
+def list_queue_items(query=None):
+    return list(queue_collection().find(query or {}).sort([('added_at', -1), ('_id', -1)]))
+
+
+def find_queue_page(query, page_size, cursor=None):
+    """Keyset page of queue items, newest first; returns (items, next_cursor, prev_cursor)."""
+    return keyset_page(queue_collection(), query, page_size, cursor, field='added_at')
+
+
+def with_queue_details(items):
+    """
+    Stringify ids, resolve `added_by` to a display name and attach each item's
+    log as `log_details`, with one query for all the users and one for all the logs.
+    """
+    logs = get_logs_by_id({str(item['log_id']) for item in items if item.get('log_id')})
+    names = display_names({item.get('added_by') for item in items})
+    for item in items:
+        stringify_id(item)
+        if item.get('added_by') in names:
+            item['added_by'] = names[item['added_by']]
+        if 'log_id' in item:
+            item['log_id'] = str(item['log_id'])
+            if item['log_id'] in logs:
+                item['log_details'] = logs[item['log_id']]
+    return items
+
+
+def priority_rank(priority):
+    return QUEUE_PRIORITIES.index(priority) if priority in QUEUE_PRIORITIES else 0
+
+
+def insert_queue_item(item):
+    item['priority_rank'] = priority_rank(item.get('priority'))
+    return queue_collection().insert_one(item).inserted_id
+
+
+def update_queue_item(queue_id, fields):
+    """
+    Apply the QUEUE_UPDATE_FIELDS in `fields` to a queue item, ignoring any others;
+    returns the updated item, or None if there is none.
+    """
+    update = {}
+    changes = {field: fields[field] for field in QUEUE_UPDATE_FIELDS if field in fields}
+    if changes:
+        update['$set'] = changes
+    if 'priority' in changes:
+        changes['priority_rank'] = priority_rank(changes['priority'])
+    if changes.get('status', 'investigating') != 'investigating':
+        # Leaving investigation ends any claim on the item
+        update['$unset'] = dict.fromkeys(CLAIM_FIELDS, '')
+    if not update:
+        return stringify_id(queue_collection().find_one({'_id': ObjectId(queue_id)}))
+    item = queue_collection().find_one_and_update(
+        {'_id': ObjectId(queue_id)}, update, return_document=ReturnDocument.AFTER
+    )
+    return stringify_id(item)
+
+
+def expired_claims(now=None):
+    return {'status': 'investigating', 'lease_expires_at': {'$lt': now or datetime.now()}}
+
+
+def release_expired_claims(now=None):
+    """
+    Return items whose claim lease ran out to the pending pool; returns how many.
+    Claims take over expired items themselves, so this only keeps listings current
+    (see the release_queue_claims command).
+    """
+    result = queue_collection().update_many(
+        expired_claims(now), {'$set': {'status': 'pending'}, '$unset': dict.fromkeys(CLAIM_FIELDS, '')},
+    )
+    return result.modified_count
+
+
+def claim_next_queue_item(username, priorities=None):
+    """
+    Atomically assign the highest-priority, oldest pending item to `username`.
+
+    Items whose lease ran out count as pending. The item moves to `investigating`
+    with a lease of QUEUE_LEASE_SECONDS; each item goes to exactly one caller,
+    however many claim at once. Returns the claimed item, or None when nothing
+    is pending.
+    """
+    now = datetime.now()
+    query = {'$or': [{'status': 'pending'}, expired_claims(now)]}
+    if priorities:
+        query['priority'] = {'$in': list(priorities)}
+    return queue_collection().find_one_and_update(
+        query,
+        {'$set': {
+            'status': 'investigating',
+            'assigned_to': username,
+            'claimed_at': now,
+            'lease_expires_at': now + timedelta(seconds=QUEUE_LEASE_SECONDS),
+        }},
+        sort=[('priority_rank', -1), ('added_at', 1)],
+        return_document=ReturnDocument.AFTER,
+    )
+
+
+def renew_queue_claim(queue_id, username):
+    """Extend the lease on an item `username` holds; returns the item, or None if the claim was lost."""
+    item = queue_collection().find_one_and_update(
+        {'_id': ObjectId(queue_id), 'status': 'investigating', 'assigned_to': username},
+        {'$set': {'lease_expires_at': datetime.now() + timedelta(seconds=QUEUE_LEASE_SECONDS)}},
+        return_document=ReturnDocument.AFTER,
+    )
+    return stringify_id(item)
+
+
+def delete_queue_item(queue_id):
+    return queue_collection().delete_one({'_id': ObjectId(queue_id)}).deleted_count > 0
+
+
+# Keyword tags
+
+def keywords_collection():
+    return get_collection(KEYWORDS_COLLECTION)
+
+
+def list_keywords():
+    return [stringify_id(keyword) for keyword in keywords_collection().find().sort('tag', 1)]
+
+
+def keyword_exists(keyword, tag):
+    return keywords_collection().find_one({'keyword': keyword, 'tag': tag}, {'_id': 1}) is not None
+
+
+def insert_keyword(keyword):
+    return keywords_collection().insert_one(keyword).inserted_id
+
+
+def delete_keyword(keyword_id):
+    return keywords_collection().delete_one({'_id': ObjectId(keyword_id)}).deleted_count > 0
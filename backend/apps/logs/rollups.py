@@ -0,0 +1,165 @@
+"""
+Time-bucket rollups of log counts for the dashboards.
+
+Each rollup document counts the logs of one bucket (minute, hour or day) for one
+combination of ComputerName, EventType, Technique and OperatingSystem, so the
+dashboard widgets group a few thousand rollup documents instead of every log.
+Besides `count`, `critical` counts the logs that are FailureAudit or Level 13+.
+
+The log receiver adds each stored log to a RollupWriter, which accumulates
+counts in memory and flushes them every few seconds as `$inc` upserts. Counts
+lost in a crash, or logs written by other paths, are reconciled with the
+`rebuild_rollups` command, which recomputes whole days from the raw logs.
+
+Buckets use the wall-clock time written in TimeGenerated, matching how the
+dashboards have always read dates off the string form.
+"""
+import re
+import threading
+from collections import Counter
+from datetime import datetime, timedelta
+
+from pymongo import ASCENDING, IndexModel, UpdateOne
+
+MINUTE, HOUR, DAY = 'minute', 'hour', 'day'
+GRANULARITIES = (MINUTE, HOUR, DAY)
+COLLECTIONS = {MINUTE: 'rollup_minute', HOUR: 'rollup_hour', DAY: 'rollup_day'}
+# Finer buckets only serve recent windows; day buckets are kept for good
+RETENTION = {MINUTE: timedelta(days=3), HOUR: timedelta(days=90), DAY: None}
+
+DIMENSIONS = ('ComputerName', 'EventType', 'Technique', 'OperatingSystem')
+DEFAULT_OS = 'Windows 11 Home'
+TECHNIQUE_PATTERN = re.compile(r'^T\d+(\.\d+)?$')
+SEVERITY_BY_EVENT_TYPE = {'FailureAudit': 'critical', 'Warning': 'high', 'Error': 'moderate'}
+CRITICAL_LEVEL = 13
+TIME_STRING_LENGTH = len('YYYY-MM-DD HH:MM:SS')
+
+
+def severity(event_type):
+    return SEVERITY_BY_EVENT_TYPE.get(event_type, 'low')
+
+
+def log_time(log, default):
+    """Naive wall-clock time of a log, or `default` when TimeGenerated is unusable."""
+    value = log.get('TimeGenerated')
+    if isinstance(value, datetime):
+        return value.replace(tzinfo=None)
+    if isinstance(value, str):
+        try:
+            return datetime.strptime(value[:TIME_STRING_LENGTH], '%Y-%m-%d %H:%M:%S')
+        except ValueError:
+            pass
+    return default
+
+
+def truncate(moment, granularity):
+    if granularity == MINUTE:
+        return moment.replace(second=0, microsecond=0)
+    if granularity == HOUR:
+        return moment.replace(minute=0, second=0, microsecond=0)
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def is_critical(log):
+    if log.get('EventType') == 'FailureAudit':
+        return True
+    try:
+        return int(log.get('Level')) >= CRITICAL_LEVEL
+    except (TypeError, ValueError):
+        return False
+
+
+def dimensions(log):
+    technique = log.get('Technique')
+    operating_system = log.get('OperatingSystem')
+    return (
+        log.get('ComputerName'),
+        log.get('EventType'),
+        technique if isinstance(technique, str) and TECHNIQUE_PATTERN.match(technique) else None,
+        operating_system if operating_system is not None else DEFAULT_OS,
+    )
+
+
+def count_log(counts, log, now=None):
+    """Add one log to `counts`, keyed by (granularity, bucket, dimensions, counter)."""
+    moment = log_time(log, now or datetime.now())
+    dims = dimensions(log)
+    critical = is_critical(log)
+    for granularity in GRANULARITIES:
+        bucket = truncate(moment, granularity)
+        counts[granularity, bucket, dims, 'count'] += 1
+        if critical:
+            counts[granularity, bucket, dims, 'critical'] += 1
+
+
+def _key(bucket, dims):
+    key = {'bucket': bucket}
+    key.update(zip(DIMENSIONS, dims))
+    return key
+
+
+def write_counts(db, counts, replace=False):
+    """
+    Upsert `counts` into the rollup collections; returns the number of documents written.
+
+    Counts are added with `$inc`, or set outright with `replace` (used by rebuilds).
+    """
+    documents = {}
+    for (granularity, bucket, dims, counter), count in counts.items():
+        documents.setdefault((granularity, bucket, dims), {})[counter] = count
+
+    requests = {granularity: [] for granularity in GRANULARITIES}
+    for (granularity, bucket, dims), counters in documents.items():
+        update = {
+            ('$set' if replace else '$inc'): counters,
+            '$setOnInsert': {'severity': severity(dims[1])},
+        }
+        requests[granularity].append(UpdateOne(_key(bucket, dims), update, upsert=True))
+    written = 0
+    for granularity, batch in requests.items():
+        if batch:
+            result = db[COLLECTIONS[granularity]].bulk_write(batch, ordered=False)
+            written += result.upserted_count + result.modified_count
+    return written
+
+
+class RollupWriter:
+    """Accumulates rollup counts at ingest and writes them in batches."""
+
+    def __init__(self):
+        self._counts = Counter()
+        self._lock = threading.Lock()
+
+    def add(self, log):
+        with self._lock:
+            count_log(self._counts, log)
+
+    def flush(self, db):
+        with self._lock:
+            counts, self._counts = self._counts, Counter()
+        if not counts:
+            return 0
+        try:
+            return write_counts(db, counts)
+        except Exception:
+            # Keep the counts for the next flush; $inc upserts are not idempotent,
+            # so a partially applied batch can over-count until the next rebuild
+            with self._lock:
+                self._counts.update(counts)
+            raise
+
+
+def rollup_indexes():
+    """Index declarations per rollup collection: the upsert key, a TTL for finer buckets, and the MITRE widget's."""
+    indexes = {}
+    for granularity, collection in COLLECTIONS.items():
+        models = [IndexModel([('bucket', ASCENDING)] + [(field, ASCENDING) for field in DIMENSIONS], unique=True)]
+        if RETENTION[granularity]:
+            models.append(IndexModel(
+                [('bucket', ASCENDING)], expireAfterSeconds=int(RETENTION[granularity].total_seconds())
+            ))
+        if granularity == DAY:
+            # MITRE ATT&CK widget: all-time counts per Technique, read from the index alone
+            models.append(IndexModel([('Technique', ASCENDING), ('count', ASCENDING)]))
+        indexes[collection] = models
+    return indexes
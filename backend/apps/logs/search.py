@@ -0,0 +1,160 @@
+"""
+Token search over Message, ComputerName and SourceIP.
+
+At ingest each log gets `SearchTokens`: the distinct lowercased tokens of the
+three fields. Compound tokens such as hostnames, IPs and DOMAIN\\user names are
+stored whole and split into their parts, so "dc01", "corp" and
+"win-dc01.corp.local" all find the same host. The multikey
+{SearchTokens: 1, TimeGenerated: -1} index answers searches without scanning.
+
+Query syntax: plain terms must all match, `term*` matches a token prefix,
+"quoted phrases" must appear verbatim and `-term` / `-"phrase"` exclude.
+Phrases are first narrowed by their tokens on the index, then checked with a
+regex on the remaining candidates only.
+"""
+import re
+
+from apps.detection.events import present
+
+SEARCH_FIELDS = ('Message', 'ComputerName', 'SourceIP')
+TOKENS_FIELD = 'SearchTokens'
+
+MIN_TOKEN_LENGTH = 2
+MAX_TOKEN_LENGTH = 64
+# Bounds index entries per log; long messages keep their first distinct tokens
+MAX_TOKENS = 256
+
+TOKEN_PATTERN = re.compile(r"\w+(?:[.\-\\@:/]\w+)*")
+PART_SEPARATORS = re.compile(r"[.\-\\@:/]")
+QUERY_PATTERN = re.compile(r'(-?)"([^"]*)"|(-?)(\S+)')
+
+
+def _token_ok(token):
+    return MIN_TOKEN_LENGTH <= len(token) <= MAX_TOKEN_LENGTH
+
+
+def tokenize(text):
+    """Distinct tokens of `text` in order of first occurrence, compound ones with their parts."""
+    tokens = {}
+    for match in TOKEN_PATTERN.finditer(text.lower()):
+        token = match.group()
+        if _token_ok(token):
+            tokens[token] = None
+        if PART_SEPARATORS.search(token):
+            for part in PART_SEPARATORS.split(token):
+                if _token_ok(part):
+                    tokens[part] = None
+        if len(tokens) >= MAX_TOKENS:
+            break
+    return list(tokens)[:MAX_TOKENS]
+
+
+def log_tokens(log):
+    tokens = {}
+    for field in SEARCH_FIELDS:
+        value = log.get(field)
+        if present(value):
+            tokens.update(dict.fromkeys(tokenize(str(value))))
+    return list(tokens)[:MAX_TOKENS]
+
+
+class SearchTokenizer:
+    """Enricher storing the search tokens of each log."""
+
+    def enrich(self, log):
+        tokens = log_tokens(log)
+        if tokens:
+            log[TOKENS_FIELD] = tokens
+
+
+def _text_regex(text):
+    # Case-insensitive, any run of whitespace between words
+    return {'$regex': r'\s+'.join(re.escape(word) for word in text.split()), '$options': 'i'}
+
+
+def _matches_text(text):
+    regex = _text_regex(text)
+    return {'$or': [{field: regex} for field in SEARCH_FIELDS]}
+
+
+def parse_query(text):
+    """
+    Split a search string into (terms, prefixes, phrases, excluded_terms, excluded_phrases).
+
+    Terms and prefixes are lowercased tokens. An unquoted IP or hostname is a
+    whole token, so 10.0.0.1 does not match 10.0.0.15; quote it to match a substring.
+    """
+    terms, prefixes, phrases, excluded_terms, excluded_phrases = [], [], [], [], []
+    for match in QUERY_PATTERN.finditer(text):
+        negated_phrase, phrase, negated, word = match.groups()
+        if phrase is not None:
+            if phrase.strip():
+                (excluded_phrases if negated_phrase else phrases).append(phrase.strip())
+        elif negated:
+            # Exclude the word itself, not every log sharing one of its parts
+            excluded_terms.extend(tokenize(word)[:1])
+        elif word.endswith('*') and len(word) > 1:
+            prefixes.append(word[:-1].lower())
+        else:
+            terms.extend(tokenize(word))
+    return terms, prefixes, phrases, excluded_terms, excluded_phrases
+
+
+def required_tokens(text):
+    """Tokens every matching log must contain, used for scoring."""
+    terms, _, phrases, _, _ = parse_query(text)
+    tokens = dict.fromkeys(terms)
+    for phrase in phrases:
+        # Only the parts: "dc01.corp" is not itself a token of "win-dc01.corp.local"
+        tokens.update(dict.fromkeys(token for token in tokenize(phrase) if not PART_SEPARATORS.search(token)))
+    return list(tokens)
+
+
+def build_query(text):
+    """MongoDB filter for a search string, or None if it contains nothing searchable."""
+    _, prefixes, phrases, excluded_terms, excluded_phrases = parse_query(text)
+    required = required_tokens(text)
+    clauses = []
+    if required:
+        clauses.append({TOKENS_FIELD: {'$all': required}})
+    for prefix in prefixes:
+        # Anchored, case-sensitive regex on lowercased tokens is an index range scan
+        clauses.append({TOKENS_FIELD: {'$regex': '^' + re.escape(prefix)}})
+    if not clauses:
+        # Exclusions alone would select almost everything
+        return None
+    for phrase in phrases:
+        clauses.append(_matches_text(phrase))
+    if excluded_terms:
+        clauses.append({TOKENS_FIELD: {'$nin': excluded_terms}})
+    for phrase in excluded_phrases:
+        clauses.append({'$nor': [_matches_text(phrase)]})
+    return clauses[0] if len(clauses) == 1 else {'$and': clauses}
+
+
+def regex_query(pattern):
+    """The legacy unanchored, case-insensitive regex search; cannot use an index."""
+    regex = {'$regex': pattern, '$options': 'i'}
+    return {'$or': [{field: regex} for field in SEARCH_FIELDS]}
+
+
+def relevance_stages(text):
+    """
+    Stages scoring matched logs into `_score`, highest first, then newest first.
+
+    All required tokens match by construction, so the score favours logs where
+    they make up more of the text, and exact ComputerName/SourceIP hits.
+    """
+    tokens = required_tokens(text) or [prefix for prefix in parse_query(text)[1]]
+    lowered = [token.lower() for token in text.split()]
+    return [
+        {'$addFields': {'_score': {'$add': [
+            {'$divide': [
+                max(len(tokens), 1),
+                {'$max': [{'$size': {'$ifNull': ['$' + TOKENS_FIELD, []]}}, 1]},
+            ]},
+            {'$cond': [{'$in': [{'$toLower': '$ComputerName'}, lowered]}, 1, 0]},
+            {'$cond': [{'$in': [{'$toLower': '$SourceIP'}, lowered]}, 1, 0]},
+        ]}}},
+        {'$sort': {'_score': -1, 'TimeGenerated': -1}},
+    ]
@@ -91,4 +91,10 @@ class AnalystQueueSerializer(serializers.ModelSerializer):
 class AnalystQueueUpdateSerializer(serializers.ModelSerializer):
     class Meta:
         model = AnalystQueue
-        fields = ['status', 'priority', 'notes', 'resolution', 'resolved_by']
\ No newline at end of file
+        fields = ['status', 'priority', 'notes', 'resolution', 'resolved_by']
+
+class KeywordTagSerializer(serializers.Serializer):
+    keyword = serializers.CharField(max_length=500)
+    tag = serializers.SlugField(max_length=100)
+    description = serializers.CharField(required=False, allow_blank=True)
+    enabled = serializers.BooleanField(default=True)
\ No newline at end of file
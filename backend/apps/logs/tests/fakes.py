@@ -0,0 +1,212 @@
+"""
+In-memory stand-ins for the PyMongo objects the Django-free log modules use.
+
+Only the filter operators, sort order and cursor methods those modules rely on
+are implemented, following MongoDB semantics: range operators compare values of
+the same BSON type only, null matches missing fields, and sorts order values by
+type (null < numbers < strings < ObjectId < dates) before value.
+"""
+import re
+from datetime import datetime
+
+from bson import ObjectId
+from pymongo.errors import CollectionInvalid
+from pymongo.results import DeleteResult, InsertOneResult
+
+_TYPES = {'null': type(None), 'string': str, 'date': datetime, 'objectId': ObjectId}
+
+
+def bson_rank(value):
+    if value is None:
+        return 0
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return 1
+    if isinstance(value, str):
+        return 2
+    if isinstance(value, ObjectId):
+        return 3
+    if isinstance(value, datetime):
+        return 4
+    raise TypeError(f'Unsupported value {value!r}')
+
+
+def sort_key(value):
+    return bson_rank(value), value if value is not None else 0
+
+
+def _compare(operator, value, target):
+    if value is None or bson_rank(value) != bson_rank(target):
+        return False
+    return {'$lt': value < target, '$lte': value <= target, '$gt': value > target, '$gte': value >= target}[operator]
+
+
+def _has_type(value, names):
+    names = [names] if isinstance(names, str) else names
+    return any(isinstance(value, _TYPES[name]) for name in names)
+
+
+def _field_matches(doc, field, condition):
+    value = doc.get(field)
+    if not isinstance(condition, dict) or not any(key.startswith('$') for key in condition):
+        return value == condition
+    for operator, target in condition.items():
+        if operator in ('$lt', '$lte', '$gt', '$gte'):
+            ok = _compare(operator, value, target)
+        elif operator == '$ne':
+            ok = value != target
+        elif operator == '$in':
+            ok = value in target
+        elif operator == '$type':
+            ok = field in doc and _has_type(value, target)
+        elif operator == '$not':
+            ok = not _field_matches(doc, field, target)
+        elif operator == '$exists':
+            ok = (field in doc) == target
+        elif operator == '$regex':
+            ok = isinstance(value, str) and re.search(target, value) is not None
+        else:
+            raise AssertionError(f'Unsupported operator {operator}')
+        if not ok:
+            return False
+    return True
+
+
+def matches(doc, query):
+    for key, condition in (query or {}).items():
+        if key == '$and':
+            ok = all(matches(doc, part) for part in condition)
+        elif key == '$or':
+            ok = any(matches(doc, part) for part in condition)
+        else:
+            ok = _field_matches(doc, key, condition)
+        if not ok:
+            return False
+    return True
+
+
+def project(doc, projection):
+    if not projection:
+        return dict(doc)
+    if isinstance(projection, (list, tuple)):
+        projection = dict.fromkeys(projection, 1)
+    if all(not included for field, included in projection.items() if field != '_id'):
+        return {field: value for field, value in doc.items() if field not in projection}
+    fields = [field for field, included in projection.items() if included]
+    if projection.get('_id', 1):
+        fields.append('_id')
+    return {field: doc[field] for field in fields if field in doc}
+
+
+class FakeCursor:
+    def __init__(self, docs, projection):
+        self._docs = docs
+        self._projection = projection
+        self._limit = 0
+        self.max_time = None
+
+    def sort(self, key, direction=None):
+        keys = [(key, direction)] if direction is not None else ([(key, 1)] if isinstance(key, str) else key)
+        for field, order in reversed(keys):
+            self._docs.sort(key=lambda doc: sort_key(doc.get(field)), reverse=order == -1)
+        return self
+
+    def limit(self, limit):
+        self._limit = limit
+        return self
+
+    def max_time_ms(self, max_time_ms):
+        self.max_time = max_time_ms
+        return self
+
+    def batch_size(self, batch_size):
+        return self
+
+    def __iter__(self):
+        docs = self._docs[:self._limit] if self._limit else self._docs
+        return (project(doc, self._projection) for doc in docs)
+
+
+class FakeCollection:
+    def __init__(self, name='logs', docs=(), database=None):
+        self.name = name
+        self.database = database
+        self.type = 'collection'
+        self.docs = []
+        self.finds = 0
+        self.indexes = []
+        for doc in docs:
+            self.insert_one(doc)
+
+    def insert_one(self, doc):
+        doc.setdefault('_id', ObjectId())
+        self.docs.append(doc)
+        return InsertOneResult(doc['_id'], True)
+
+    def find(self, query=None, projection=None, **kwargs):
+        self.finds += 1
+        return FakeCursor([doc for doc in self.docs if matches(doc, query)], projection)
+
+    def find_one(self, query=None, projection=None):
+        return next(iter(self.find(query, projection)), None)
+
+    def count_documents(self, query, limit=None, **kwargs):
+        count = sum(1 for doc in self.docs if matches(doc, query))
+        return min(count, limit) if limit else count
+
+    def distinct(self, key, query=None):
+        return list(dict.fromkeys(doc[key] for doc in self.docs if key in doc and matches(doc, query)))
+
+    def update_one(self, query, update, upsert=False):
+        doc = next((doc for doc in self.docs if matches(doc, query)), None)
+        if doc is None:
+            if not upsert:
+                return
+            doc = {key: value for key, value in query.items() if not key.startswith('$')}
+            self.insert_one(doc)
+        for field, amount in update.get('$inc', {}).items():
+            doc[field] = doc.get(field, 0) + amount
+        for field in update.get('$currentDate', {}):
+            doc[field] = datetime.now()
+        doc.update(update.get('$set', {}))
+
+    def delete_many(self, query):
+        kept = [doc for doc in self.docs if not matches(doc, query)]
+        deleted, self.docs = len(self.docs) - len(kept), kept
+        return DeleteResult({'n': deleted}, True)
+
+    def create_indexes(self, models):
+        self.indexes.extend(models)
+
+
+class FakeDatabase:
+    def __init__(self):
+        self.collections = {}
+        self.listed = 0
+
+    def __getitem__(self, name):
+        if name not in self.collections:
+            self.collections[name] = FakeCollection(name, database=self)
+        return self.collections[name]
+
+    def create_collection(self, name, **options):
+        if name in self.collections:
+            raise CollectionInvalid(f'collection {name} already exists')
+        if 'timeseries' in options:
+            self[name].type = 'timeseries'
+        return self[name]
+
+    def list_collections(self, filter=None):
+        return [
+            {'name': name, 'type': self.collections[name].type}
+            for name in self.list_collection_names(filter)
+        ]
+
+    def list_collection_names(self, filter=None):
+        self.listed += 1
+        wanted = (filter or {}).get('name', {'$regex': ''})
+        if isinstance(wanted, str):
+            return [name for name in self.collections if name == wanted]
+        return [name for name in self.collections if re.search(wanted['$regex'], name)]
+
+    def drop_collection(self, name):
+        self.collections.pop(name, None)
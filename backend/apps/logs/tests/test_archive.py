@@ -0,0 +1,165 @@
+import io
+import os
+import shutil
+import tempfile
+import zipfile
+from datetime import date, datetime, timedelta
+from unittest import TestCase
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from bson import ObjectId
+
+from apps.logs import archive
+from apps.logs.coldstore import ColdStore
+
+from .fakes import FakeCollection, FakeCursor
+
+
+def sample_logs():
+    start = datetime(2024, 3, 1, 22)
+    logs = []
+    for i in range(12):
+        logs.append({
+            '_id': ObjectId(f'{i + 1:024x}'),
+            'TimeGenerated': start + timedelta(minutes=30 * i),
+            'timestamp': (start + timedelta(minutes=30 * i, seconds=5)).isoformat() + '+00:00',
+            'ComputerName': ['HOST-1', 'HOST/2'][i % 2],
+            'EventType': 'Information',
+            'EventID': str(4624 + i % 3),
+            'Level': str(i % 4),
+            'KeywordTags': ['Audit Success'] if i % 3 == 0 else None,
+            'SearchTokens': ['logon', f'user{i}'],
+            'Message': f'event {i}',
+            'NotArchived': i,
+        })
+    # String times, as stored by older receivers
+    logs.append({'_id': ObjectId(f'{100:024x}'), 'TimeGenerated': '2024-03-02 10:00:00 +0300', 'ComputerName': 'HOST-1'})
+    return logs
+
+
+class ArchiveTests(TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        self.logs = FakeCollection(docs=sample_logs())
+
+    def read(self, day, device):
+        directory = archive.partition_dir(self.root, day, device)
+        files = archive.partition_files(directory)
+        return pa.concat_tables(pq.read_table(os.path.join(directory, name)) for name in files)
+
+    def test_round_trip(self):
+        written = archive.archive_logs(self.logs, self.root, date(2024, 3, 1), date(2024, 3, 2), row_group_rows=2)
+        self.assertEqual(
+            [(partition['day'], partition['device'], partition['rows']) for partition in written],
+            [('2024-03-01', 'HOST-1', 2), ('2024-03-01', 'HOST_2', 2),
+             ('2024-03-02', 'HOST-1', 5), ('2024-03-02', 'HOST_2', 4)],
+        )
+        table = self.read('2024-03-02', 'HOST-1')
+        self.assertEqual(table.schema, archive.SCHEMA)
+        self.assertNotIn('NotArchived', table.column_names)
+        rows = table.to_pylist()
+        # Cursor order (string times sort before dates), with string times parsed to timestamps
+        self.assertEqual(
+            [row['TimeGenerated'] for row in rows],
+            [datetime(2024, 3, 2, 10)] + [datetime(2024, 3, 2, hour) for hour in range(4)],
+        )
+        first = rows[1]
+        self.assertEqual(first['_id'], f'{5:024x}')
+        self.assertEqual(first['timestamp'], datetime(2024, 3, 2, 0, 0, 5))
+        self.assertEqual(first['Level'], 0)
+        self.assertEqual(first['KeywordTags'], None)
+        self.assertEqual(first['SearchTokens'], ['logon', 'user4'])
+        directory = archive.partition_dir(self.root, '2024-03-02', 'HOST-1')
+        metadata = pq.ParquetFile(os.path.join(directory, archive.partition_files(directory)[0])).metadata
+        # row_group_rows logs per row group
+        self.assertEqual(metadata.num_row_groups, 3)
+
+    def test_one_device(self):
+        written = archive.archive_logs(self.logs, self.root, date(2024, 3, 1), date(2024, 3, 2), device='HOST/2')
+        self.assertEqual({partition['device'] for partition in written}, {'HOST_2'})
+        self.assertEqual(sum(partition['rows'] for partition in written), 6)
+
+    def test_rearchiving_gives_the_same_result(self):
+        archive.archive_logs(self.logs, self.root, date(2024, 3, 2), date(2024, 3, 2))
+        archive.archive_logs(self.logs, self.root, date(2024, 3, 2), date(2024, 3, 2))
+        (partition,) = [p for p in archive.list_partitions(self.root) if p['device'] == 'HOST-1']
+        self.assertEqual(len(partition['files']), 1)
+        self.assertEqual(self.read('2024-03-02', 'HOST-1').num_rows, 5)
+
+    def test_purge_deletes_only_what_was_archived(self):
+        written = archive.archive_logs(self.logs, self.root, date(2024, 3, 2), date(2024, 3, 2), keep_ids=True)
+        # Arrives after the cursor was read, before the purge
+        late = {'_id': ObjectId(), 'TimeGenerated': datetime(2024, 3, 2, 5), 'ComputerName': 'HOST-1'}
+        self.logs.insert_one(late)
+        deleted = archive.purge(self.logs, written, date(2024, 3, 2), date(2024, 3, 2), batch_size=2)
+        self.assertEqual(deleted, 9)
+        self.assertEqual(
+            {log['_id'] for log in self.logs.docs},
+            {late['_id']} | {log['_id'] for log in sample_logs()[:4]},  # the logs of March 1
+        )
+
+    def test_runs_after_a_purge_append(self):
+        written = archive.archive_logs(self.logs, self.root, date(2024, 3, 2), date(2024, 3, 2), keep_ids=True)
+        archive.purge(self.logs, written, date(2024, 3, 2), date(2024, 3, 2))
+        self.logs.insert_one({'TimeGenerated': datetime(2024, 3, 2, 5), 'ComputerName': 'HOST-1', 'Message': 'late'})
+        (appended,) = archive.archive_logs(self.logs, self.root, date(2024, 3, 2), date(2024, 3, 2))
+        self.assertEqual(appended['rows'], 1)
+        (partition,) = [p for p in archive.list_partitions(self.root) if p['device'] == 'HOST-1']
+        self.assertEqual(len(partition['files']), 2)
+        self.assertEqual(self.read('2024-03-02', 'HOST-1').num_rows, 6)
+        # Untouched partitions keep their single file
+        (other,) = [p for p in archive.list_partitions(self.root) if p['device'] == 'HOST_2']
+        self.assertEqual(len(other['files']), 1)
+
+    def test_runs_after_a_purge_do_not_archive_late_logs_twice(self):
+        day = date(2024, 3, 2)
+        written = archive.archive_logs(self.logs, self.root, day, day, keep_ids=True)
+        archive.purge(self.logs, written, day, day)
+        self.logs.insert_one({'TimeGenerated': datetime(2024, 3, 2, 5), 'ComputerName': 'HOST-1', 'Message': 'late'})
+        # Runs without --purge, e.g. POST /api/logs/archive/, replace each other's files
+        for _ in range(3):
+            archive.archive_logs(self.logs, self.root, day, day)
+        (partition,) = [p for p in archive.list_partitions(self.root) if p['device'] == 'HOST-1']
+        self.assertEqual(len(partition['files']), 2)
+        store = ColdStore(self.root)
+        ids = [log['_id'] for log in store.find({'ComputerName': 'HOST-1'}, limit=100)]
+        self.assertEqual(len(ids), 6)
+        self.assertEqual(len(set(ids)), len(ids))
+        # Purging the late log keeps both files for good
+        written = archive.archive_logs(self.logs, self.root, day, day, keep_ids=True)
+        self.assertEqual(archive.purge(self.logs, written, day, day), 1)
+        archive.archive_logs(self.logs, self.root, day, day)
+        self.assertEqual(store.count({'ComputerName': 'HOST-1'}), 6)
+
+    def test_failed_run_leaves_no_files(self):
+        class LostCursor(FakeCursor):
+            def __iter__(self):
+                yield from super().__iter__()
+                raise RuntimeError('cursor lost')
+
+        self.logs.find = lambda query=None, projection=None: LostCursor(list(self.logs.docs), projection)
+        with self.assertRaises(RuntimeError):
+            archive.archive_logs(self.logs, self.root, date(2024, 3, 1), date(2024, 3, 2))
+        self.assertEqual([name for _, _, names in os.walk(self.root) for name in names], [])
+
+    def test_list_partitions_by_day(self):
+        archive.archive_logs(self.logs, self.root, date(2024, 3, 1), date(2024, 3, 2))
+        partitions = archive.list_partitions(self.root, start=date(2024, 3, 2))
+        self.assertEqual([(p['day'], p['device']) for p in partitions], [('2024-03-02', 'HOST-1'), ('2024-03-02', 'HOST_2')])
+        self.assertTrue(all(p['bytes'] > 0 for p in partitions))
+
+    def test_zipped_partition(self):
+        archive.archive_logs(self.logs, self.root, date(2024, 3, 2), date(2024, 3, 2))
+        directory = archive.partition_dir(self.root, '2024-03-02', 'HOST-1')
+        # A second part file, as a later appending run would write
+        shutil.copy(os.path.join(directory, archive.partition_files(directory)[0]), os.path.join(directory, 'part-z.parquet'))
+        files = archive.partition_files(directory)
+        chunks = list(archive.zipped(directory, files, chunk_size=1024))
+        self.assertGreater(len(chunks), 2)
+        with zipfile.ZipFile(io.BytesIO(b''.join(chunks))) as bundle:
+            self.assertEqual(bundle.namelist(), files)
+            for name in files:
+                with open(os.path.join(directory, name), 'rb') as source:
+                    self.assertEqual(bundle.read(name), source.read())
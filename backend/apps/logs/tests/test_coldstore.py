@@ -0,0 +1,134 @@
+import os
+import shutil
+import tempfile
+from datetime import date, datetime, timedelta
+from unittest import TestCase, mock
+
+from bson import ObjectId
+
+from apps.logs import archive
+from apps.logs.coldstore import ColdStore, UnsupportedQuery, compile_filter, prune_bounds
+
+from .fakes import FakeCollection
+
+
+def archived_logs():
+    start = datetime(2024, 3, 1)
+    return [
+        {
+            '_id': ObjectId(f'{(i * 7) % 31 + 1:024x}'),
+            # Pairs of logs share a time, so pages break ties on _id
+            'TimeGenerated': start + timedelta(hours=3 * (i // 2)),
+            'ComputerName': f'HOST-{i % 3}',
+            'EventType': ['Information', 'FailureAudit', 'Error'][i % 3 if i % 5 else 0],
+            'Level': i % 16,
+            'KeywordTags': ['mimikatz'] if i % 4 == 0 else None,
+            'SearchTokens': ['failed', 'logon'] if i % 2 else ['logon'],
+            'Message': f'Event {i}',
+        }
+        for i in range(30)
+    ]
+
+
+class CompileTests(TestCase):
+    def test_prune_bounds(self):
+        query = {'$and': [
+            {'TimeGenerated': {'$gte': datetime(2024, 3, 2, 6), '$lt': datetime(2024, 3, 4)}},
+            {'ComputerName': {'$in': ['HOST-1', 'HOST-2']}},
+        ]}
+        # An exclusive midnight bound does not reach that day
+        self.assertEqual(prune_bounds(query), (date(2024, 3, 2), date(2024, 3, 3), {'HOST-1', 'HOST-2'}))
+        self.assertEqual(prune_bounds({'EventType': 'Error'}), (None, None, None))
+
+    def test_unsupported_filters(self):
+        for query in ({'NotArchived': 1}, {'$where': 'true'}, {'Level': {'$mod': [2, 0]}}, {'KeywordTags': {'$gt': 'a'}}):
+            with self.subTest(query=query):
+                with self.assertRaises(UnsupportedQuery):
+                    compile_filter(query)
+
+
+class ColdStoreTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.root = tempfile.mkdtemp()
+        cls.logs = archived_logs()
+        archive.archive_logs(FakeCollection(docs=[dict(log) for log in cls.logs]), cls.root, date(2024, 3, 1), date(2024, 3, 2))
+        cls.store = ColdStore(cls.root)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.root)
+
+    def expected(self, keep):
+        kept = [log for log in self.logs if keep(log)]
+        return [str(log['_id']) for log in sorted(kept, key=lambda log: (log['TimeGenerated'], str(log['_id'])), reverse=True)]
+
+    def test_filters_match_the_mongo_semantics(self):
+        day = datetime(2024, 3, 2)
+        cases = [
+            ({}, lambda log: True),
+            ({'ComputerName': 'HOST-1'}, lambda log: log['ComputerName'] == 'HOST-1'),
+            ({'EventType': {'$in': ['Error', 'FailureAudit']}}, lambda log: log['EventType'] in ('Error', 'FailureAudit')),
+            ({'Level': {'$gte': 12}}, lambda log: log['Level'] >= 12),
+            ({'KeywordTags': 'mimikatz'}, lambda log: log['KeywordTags'] == ['mimikatz']),
+            ({'KeywordTags': {'$ne': 'mimikatz'}}, lambda log: log['KeywordTags'] is None),
+            ({'KeywordTags': {'$exists': False}}, lambda log: log['KeywordTags'] is None),
+            ({'SearchTokens': {'$all': ['failed', 'logon']}}, lambda log: 'failed' in log['SearchTokens']),
+            ({'Message': {'$regex': 'event 1', '$options': 'i'}}, lambda log: 'event 1' in log['Message'].lower()),
+            ({'TimeGenerated': {'$gte': day}, 'ComputerName': {'$in': ['HOST-0']}},
+             lambda log: log['TimeGenerated'] >= day and log['ComputerName'] == 'HOST-0'),
+            ({'$or': [{'Level': 0}, {'ComputerName': 'HOST-2', 'EventType': 'Error'}]},
+             lambda log: log['Level'] == 0 or (log['ComputerName'] == 'HOST-2' and log['EventType'] == 'Error')),
+            ({'$nor': [{'EventType': 'Information'}]}, lambda log: log['EventType'] != 'Information'),
+        ]
+        for query, keep in cases:
+            with self.subTest(query=query):
+                expected = self.expected(keep)
+                self.assertEqual([log['_id'] for log in self.store.find(query, limit=100)], expected)
+                self.assertEqual(self.store.count(query), len(expected))
+                self.assertEqual(self.store.count(query, limit=2), min(len(expected), 2))
+
+    def test_pruned_partitions_are_not_opened(self):
+        files = self.store.files(date(2024, 3, 2), date(2024, 3, 2), {'HOST-1'})
+        self.assertEqual([os.path.basename(os.path.dirname(path)) for path in files], ['device=HOST-1'])
+        self.assertTrue(all('day=2024-03-02' in path for path in files))
+
+    def test_keyset_pages_visit_every_log_once(self):
+        expected = self.expected(lambda log: True)
+        seen, after, has_more = [], None, True
+        while has_more:
+            logs, has_more = self.store.page({}, 4, after=after)
+            seen.extend(log['_id'] for log in logs)
+            after = (logs[-1]['TimeGenerated'], logs[-1]['_id'])
+        self.assertEqual(seen, expected)
+        # And back from the oldest log
+        logs, has_more = self.store.page({}, 4, after=after, direction='p')
+        self.assertEqual([log['_id'] for log in logs], expected[-5:-1])
+        self.assertTrue(has_more)
+
+    def test_scan_streams_in_order(self):
+        self.assertEqual([log['_id'] for log in self.store.scan({}, batch_size=7)], self.expected(lambda log: True))
+        self.assertEqual([log['_id'] for log in self.store.scan({}, limit=3)], self.expected(lambda log: True)[:3])
+
+
+class CountCacheTests(TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        self.logs = FakeCollection(docs=archived_logs())
+        archive.archive_logs(self.logs, self.root, date(2024, 3, 1), date(2024, 3, 2))
+        self.store = ColdStore(self.root)
+
+    def test_counts_are_reused_until_the_archive_changes(self):
+        query = {'ComputerName': 'HOST-1'}
+        with mock.patch.object(ColdStore, '_rows', wraps=self.store._rows) as rows:
+            self.assertEqual(self.store.count(query), 10)
+            self.assertEqual(self.store.count(query), 10)
+            self.assertEqual(rows.call_count, 1)
+            # A capped count is its own entry
+            self.assertEqual(self.store.count(query, limit=3), 3)
+            self.assertEqual(rows.call_count, 2)
+            self.logs.insert_one({'TimeGenerated': datetime(2024, 3, 2, 5), 'ComputerName': 'HOST-1'})
+            archive.archive_logs(self.logs, self.root, date(2024, 3, 2), date(2024, 3, 2), device='HOST-1')
+            self.assertEqual(self.store.count(query), 11)
+            self.assertEqual(rows.call_count, 3)
@@ -0,0 +1,110 @@
+import csv
+import gzip
+import io
+import json
+from datetime import datetime, timedelta
+from unittest import TestCase
+
+from bson import ObjectId
+
+from apps.logs.export import CHUNK_BYTES, CSV, CSV_FIELDS, NDJSON, chunked, csv_rows, stream
+
+
+def sample_logs(count=5):
+    return [
+        {
+            '_id': ObjectId(f'{i:024x}'),
+            'TimeGenerated': datetime(2024, 3, 1, 12) + timedelta(minutes=i),
+            'EventID': str(4624 + i),
+            'ComputerName': 'HOST-1',
+            'KeywordTags': ['Audit Success', 'Logon'] if i % 2 else None,
+            'Message': f'line one, "quoted"\nline two {i}',
+            'Extra': {'nested': i},
+        }
+        for i in range(count)
+    ]
+
+
+class NdjsonTests(TestCase):
+    def test_one_json_document_per_line(self):
+        logs = sample_logs()
+        lines = b''.join(stream(logs, NDJSON)).decode('utf-8').splitlines()
+        self.assertEqual(len(lines), len(logs))
+        first = json.loads(lines[0])
+        self.assertEqual(first['_id'], str(logs[0]['_id']))
+        self.assertEqual(first['TimeGenerated'], '2024-03-01T12:00:00')
+        self.assertEqual(first['Extra'], {'nested': 0})
+        self.assertEqual(first['Message'], logs[0]['Message'])
+
+    def test_keeps_non_ascii_text(self):
+        (line,) = b''.join(stream([{'Message': 'Überprüfung'}], NDJSON)).decode('utf-8').splitlines()
+        self.assertIn('Überprüfung', line)
+
+    def test_empty_export_is_empty(self):
+        self.assertEqual(b''.join(stream([], NDJSON)), b'')
+
+
+class CsvTests(TestCase):
+    def read(self, data):
+        return list(csv.reader(io.StringIO(data.decode('utf-8'))))
+
+    def test_header_and_cells(self):
+        logs = sample_logs()
+        rows = self.read(b''.join(stream(logs, CSV)))
+        self.assertEqual(rows[0], list(CSV_FIELDS))
+        self.assertEqual(len(rows), len(logs) + 1)
+        first = dict(zip(CSV_FIELDS, rows[1]))
+        second = dict(zip(CSV_FIELDS, rows[2]))
+        self.assertEqual(first['TimeGenerated'], '2024-03-01T12:00:00')
+        self.assertEqual(first['KeywordTags'], '')
+        self.assertEqual(second['KeywordTags'], 'Audit Success;Logon')
+        # Quotes, commas and newlines survive the round trip
+        self.assertEqual(first['Message'], logs[0]['Message'])
+        self.assertEqual(first['SourceIP'], '')
+
+    def test_selected_fields(self):
+        rows = self.read(b''.join(stream(sample_logs(2), CSV, fields=['EventID', 'Extra'])))
+        self.assertEqual(rows, [['EventID', 'Extra'], ['4624', '{"nested": 0}'], ['4625', '{"nested": 1}']])
+
+    def test_header_only_when_nothing_matched(self):
+        self.assertEqual(list(csv_rows([], ('a', 'b'))), ['a,b\r\n'])
+
+    def test_rows_are_encoded_lazily(self):
+        consumed = []
+
+        def logs():
+            for log in sample_logs(3):
+                consumed.append(log)
+                yield log
+
+        rows = csv_rows(logs())
+        next(rows)
+        self.assertEqual(len(consumed), 1)
+
+
+class ChunkTests(TestCase):
+    def test_chunks_reach_the_size_except_the_last(self):
+        rows = [f'{i:07d}\n' for i in range(1000)]
+        chunks = list(chunked(rows, size=100))
+        self.assertEqual(b''.join(chunks), ''.join(rows).encode('utf-8'))
+        self.assertTrue(all(len(chunk) >= 100 for chunk in chunks[:-1]))
+        self.assertLessEqual(len(chunks[-1]), 100)
+
+    def test_default_chunks_are_bounded(self):
+        logs = sample_logs(1) * 2000
+        chunks = list(stream(logs, NDJSON))
+        self.assertGreater(len(chunks), 1)
+        largest_row = max(len(line) + 1 for line in b''.join(chunks).split(b'\n'))
+        self.assertTrue(all(len(chunk) < CHUNK_BYTES + largest_row for chunk in chunks))
+
+    def test_gzip_round_trip(self):
+        logs = sample_logs(500)
+        for output in (NDJSON, CSV):
+            with self.subTest(output=output):
+                plain = b''.join(stream(logs, output))
+                compressed = b''.join(stream(logs, output, compress=True))
+                self.assertEqual(gzip.decompress(compressed), plain)
+                self.assertLess(len(compressed), len(plain))
+
+    def test_gzip_of_nothing_is_a_valid_empty_stream(self):
+        self.assertEqual(gzip.decompress(b''.join(stream([], NDJSON, compress=True))), b'')
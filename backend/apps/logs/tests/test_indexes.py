@@ -0,0 +1,50 @@
+from datetime import datetime
+from unittest import TestCase
+
+from apps.logs import timeseries
+from apps.logs.indexes import INDEXES, TIMESERIES_LOG_INDEXES, ensure_indexes, log_indexes
+from apps.logs.partitions import DAY, PartitionedLogs
+
+from .fakes import FakeDatabase
+
+
+def keys(model):
+    return list(model.document['key'])
+
+
+class TimeSeriesIndexTests(TestCase):
+    def test_time_series_set_is_accepted_by_time_series_collections(self):
+        # No _id, and none of the fields that hold arrays (multikey indexes)
+        for model in TIMESERIES_LOG_INDEXES:
+            with self.subTest(keys=keys(model)):
+                self.assertFalse({'_id', 'KeywordTags', 'SearchTokens'} & set(keys(model)))
+        self.assertIn([timeseries.META_FIELD, timeseries.TIME_FIELD], [keys(model) for model in TIMESERIES_LOG_INDEXES])
+
+    def test_index_set_follows_the_storage(self):
+        self.assertIs(log_indexes('timeseries'), TIMESERIES_LOG_INDEXES)
+        self.assertIs(log_indexes('regular'), INDEXES['logs'])
+
+    def test_each_log_collection_gets_the_set_its_storage_accepts(self):
+        db = FakeDatabase()
+        db.create_collection('logs')
+        db.create_collection('logs_20240301', **timeseries.collection_options())
+        db.create_collection('logs_20240302')
+        created = ensure_indexes(db, ['logs'])
+        self.assertEqual(sorted(created), ['logs', 'logs_20240301', 'logs_20240302'])
+        self.assertEqual(db['logs_20240301'].indexes, TIMESERIES_LOG_INDEXES)
+        self.assertEqual(db['logs'].indexes, INDEXES['logs'])
+        self.assertEqual(db['logs_20240302'].indexes, INDEXES['logs'])
+
+    def test_missing_logs_collection_is_created_unless_partitioned(self):
+        db = FakeDatabase()
+        self.assertEqual(list(ensure_indexes(db, ['logs'])), ['logs'])
+        db = FakeDatabase()
+        self.assertEqual(ensure_indexes(db, ['logs'], partitioned=True), {})
+        self.assertNotIn('logs', db.collections)
+
+    def test_new_time_series_partitions_get_the_time_series_set(self):
+        db = FakeDatabase()
+        logs = PartitionedLogs(db, DAY, log_indexes('timeseries'), collection_options=timeseries.collection_options())
+        logs.insert_one({'TimeGenerated': datetime(2024, 3, 1), 'ComputerName': 'HOST-1'})
+        self.assertEqual(db['logs_20240301'].type, 'timeseries')
+        self.assertEqual(db['logs_20240301'].indexes, TIMESERIES_LOG_INDEXES)
@@ -0,0 +1,101 @@
+from datetime import datetime, timedelta
+from unittest import TestCase
+
+from bson import ObjectId
+
+from apps.logs.pagination import (
+    NEXT, PREV, InvalidCursor, decode_cursor, encode_cursor, keyset_page, seek_query,
+)
+
+from .fakes import FakeCollection, sort_key
+
+
+def mixed_logs():
+    """Logs whose TimeGenerated is a date, a string, null or missing, with ties inside each type."""
+    start = datetime(2024, 3, 1)
+    logs = []
+    for i in range(7):
+        logs.append({'TimeGenerated': start + timedelta(hours=i // 2), 'n': len(logs)})
+    for i in range(7):
+        logs.append({'TimeGenerated': f'2024-02-{10 + i // 3} 08:00:00 +0300', 'n': len(logs)})
+    for _ in range(3):
+        logs.append({'TimeGenerated': None, 'n': len(logs)})
+    for _ in range(2):
+        logs.append({'n': len(logs)})
+    for i, log in enumerate(logs):
+        log['_id'] = ObjectId(f'{(i * 7) % 19:024x}')
+    return logs
+
+
+def newest_first(logs):
+    return sorted(logs, key=lambda log: (sort_key(log.get('TimeGenerated')), log['_id']), reverse=True)
+
+
+class CursorTests(TestCase):
+    def test_round_trip_keeps_bson_types(self):
+        doc_id = ObjectId()
+        for value in (datetime(2024, 3, 1, 12, 30), '2024-03-01 12:30:00 +0300', None):
+            cursor = encode_cursor({'TimeGenerated': value, '_id': doc_id}, PREV)
+            self.assertEqual(decode_cursor(cursor), (value, doc_id, PREV))
+        self.assertNotIn('=', encode_cursor({'TimeGenerated': None, '_id': doc_id}, NEXT))
+
+    def test_rejects_tampered_cursors(self):
+        for cursor in ('not base64!', 'e30', encode_cursor({'TimeGenerated': 5, '_id': 1}, NEXT),
+                       encode_cursor({'TimeGenerated': None, '_id': 1}, 'x')):
+            with self.assertRaises(InvalidCursor):
+                decode_cursor(cursor)
+
+    def test_seek_includes_lower_types_going_forward(self):
+        clauses = seek_query('2024-02-10 08:00:00 +0300', ObjectId(), NEXT)['$or']
+        self.assertEqual(clauses[-1], {'TimeGenerated': {'$not': {'$type': ['string', 'date']}}})
+        clauses = seek_query(None, ObjectId(), PREV)['$or']
+        self.assertEqual(clauses[-1], {'TimeGenerated': {'$type': ['string', 'date']}})
+
+
+class KeysetPageTests(TestCase):
+    def setUp(self):
+        self.logs = mixed_logs()
+        self.collection = FakeCollection(docs=[dict(log) for log in self.logs])
+        self.expected = [log['n'] for log in newest_first(self.logs)]
+
+    def walk(self, page_size):
+        pages, cursor = [], None
+        while True:
+            docs, next_cursor, prev_cursor = keyset_page(self.collection, {}, page_size, cursor)
+            pages.append(([doc['n'] for doc in docs], next_cursor, prev_cursor))
+            if not next_cursor:
+                return pages
+            cursor = next_cursor
+
+    def test_forward_walk_crosses_every_type_once(self):
+        for page_size in (1, 3, 4, 19, 50):
+            with self.subTest(page_size=page_size):
+                pages = self.walk(page_size)
+                self.assertEqual([n for page, _, _ in pages for n in page], self.expected)
+                self.assertIsNone(pages[0][2])
+                self.assertTrue(all(prev for _, _, prev in pages[1:]))
+
+    def test_backward_walk_returns_the_same_pages(self):
+        pages = self.walk(4)
+        cursor = pages[-1][2]
+        for page, _, _ in reversed(pages[:-1]):
+            docs, next_cursor, prev_cursor = keyset_page(self.collection, {}, 4, cursor)
+            self.assertEqual([doc['n'] for doc in docs], page)
+            self.assertIsNotNone(next_cursor)
+            cursor = prev_cursor
+        self.assertIsNone(cursor)
+
+    def test_filtered_pages_and_projection(self):
+        query = {'n': {'$in': [0, 3, 8, 15, 18]}}
+        docs, next_cursor, _ = keyset_page(self.collection, query, 3, projection={'n': 1}, max_time_ms=50)
+        self.assertEqual([doc['n'] for doc in docs], [3, 0, 8])
+        docs, next_cursor, _ = keyset_page(self.collection, query, 3, next_cursor, projection={'n': 1})
+        self.assertEqual([doc['n'] for doc in docs], [e for e in self.expected if e in (15, 18)])
+        self.assertIsNone(next_cursor)
+
+    def test_other_sort_field(self):
+        queue = FakeCollection('analysts_queue', [{'added_at': datetime(2024, 3, day)} for day in (3, 1, 2)])
+        docs, next_cursor, _ = keyset_page(queue, {}, 2, field='added_at')
+        self.assertEqual([doc['added_at'].day for doc in docs], [3, 2])
+        docs, _, _ = keyset_page(queue, {}, 2, next_cursor, field='added_at')
+        self.assertEqual([doc['added_at'].day for doc in docs], [1])
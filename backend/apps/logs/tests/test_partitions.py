@@ -0,0 +1,156 @@
+from datetime import date, datetime, timedelta
+from unittest import TestCase, mock
+
+from bson import ObjectId
+from pymongo.errors import OperationFailure
+
+from apps.logs import partitions
+from apps.logs.indexes import INDEXES, ensure_indexes
+from apps.logs.partitions import DAY, WEEK, PartitionedLogs, partition_name, time_bounds
+
+from .fakes import FakeDatabase, sort_key
+
+
+def spread_logs():
+    """Logs over four days, several per day with tied times, and some in the legacy collection."""
+    start = datetime(2024, 3, 1)
+    logs = []
+    for i in range(40):
+        logs.append({
+            '_id': ObjectId(f'{(i * 11) % 41:024x}'),
+            'TimeGenerated': start + timedelta(hours=(i * 7) % 96 // 2 * 2),
+            'ComputerName': f'HOST-{i % 3}',
+            'Message': f'event {i}',
+        })
+    return logs
+
+
+def newest_first(logs):
+    return sorted(logs, key=lambda log: (sort_key(log.get('TimeGenerated')), log['_id']), reverse=True)
+
+
+class NamingTests(TestCase):
+    def test_partition_names(self):
+        self.assertEqual(partition_name(datetime(2024, 3, 6, 23, 59), DAY), 'logs_20240306')
+        # Weekly partitions are named after the Monday
+        self.assertEqual(partition_name(datetime(2024, 3, 6), WEEK), 'logs_20240304')
+        self.assertEqual(partitions.partition_day('logs_20240304'), date(2024, 3, 4))
+        self.assertIsNone(partitions.partition_day('logs'))
+
+    def test_time_bounds(self):
+        since, until = datetime(2024, 3, 1), datetime(2024, 3, 3)
+        self.assertEqual(time_bounds({}), (None, None))
+        self.assertEqual(time_bounds({'TimeGenerated': {'$gte': since, '$lt': until}}), (since, until))
+        self.assertEqual(time_bounds({'TimeGenerated': {'$gte': '2024-03-01 10:00:00 +0300'}}),
+                         (datetime(2024, 3, 1, 10), None))
+        self.assertEqual(time_bounds({'$and': [{'TimeGenerated': {'$gte': since}}, {'TimeGenerated': {'$lte': until}}]}),
+                         (since, until))
+        # An $or is bounded by its widest branch, and not at all if one branch is open
+        self.assertEqual(time_bounds({'$or': [
+            {'TimeGenerated': {'$gte': since, '$lt': since + timedelta(days=1)}},
+            {'TimeGenerated': {'$gte': until, '$lt': until + timedelta(days=1)}},
+        ]}), (since, until + timedelta(days=1)))
+        self.assertEqual(time_bounds({'$or': [{'TimeGenerated': {'$gte': since}}, {'ComputerName': 'HOST-1'}]}),
+                         (None, None))
+
+
+class PartitionedLogsTests(TestCase):
+    def setUp(self):
+        self.db = FakeDatabase()
+        self.logs = PartitionedLogs(self.db, DAY, INDEXES['logs'])
+        self.stored = spread_logs()
+        for log in self.stored[:30]:
+            self.logs.insert_one(dict(log))
+        # Left from before partitioning was enabled
+        for log in self.stored[30:]:
+            self.db['logs'].insert_one(dict(log))
+
+    def test_writes_go_to_their_day(self):
+        self.assertEqual(sorted(self.db.collections), ['logs', 'logs_20240301', 'logs_20240302', 'logs_20240303', 'logs_20240304'])
+        for name, collection in self.db.collections.items():
+            if name != 'logs':
+                self.assertTrue(all(partition_name(log['TimeGenerated'], DAY) == name for log in collection.docs))
+                self.assertEqual(collection.indexes, INDEXES['logs'])
+
+    def test_routing(self):
+        names = [collection.name for collection in self.logs.collections()]
+        self.assertEqual(names, ['logs_20240304', 'logs_20240303', 'logs_20240302', 'logs_20240301', 'logs'])
+        bounded = {'TimeGenerated': {'$gte': datetime(2024, 3, 2, 12), '$lt': datetime(2024, 3, 2, 18)}}
+        self.assertEqual([collection.name for collection in self.logs.collections(bounded)], ['logs_20240302', 'logs'])
+
+    def test_merge_matches_a_single_collection(self):
+        expected = newest_first(self.stored)
+        newest = [('TimeGenerated', -1), ('_id', -1)]
+        self.assertEqual(list(self.logs.find({}).sort(newest)), expected)
+        for skip, limit in ((0, 7), (5, 10), (35, 10)):
+            with self.subTest(skip=skip, limit=limit):
+                self.assertEqual(list(self.logs.find({}).sort(newest).skip(skip).limit(limit)), expected[skip:skip + limit])
+        ascending = list(self.logs.find({}).sort([('TimeGenerated', 1), ('_id', 1)]))
+        self.assertEqual(ascending, expected[::-1])
+
+    def test_merge_with_projection_leaving_out_the_sort_fields(self):
+        newest = [('TimeGenerated', -1), ('_id', -1)]
+        expected = [{'Message': log['Message']} for log in newest_first(self.stored)]
+        for projection in ({'Message': 1, '_id': 0}, ['Message'], {'TimeGenerated': 0, '_id': 0, 'ComputerName': 0}):
+            with self.subTest(projection=projection):
+                found = list(self.logs.find({}, projection).sort(newest).limit(12))
+                if isinstance(projection, list):
+                    # A list keeps _id, like a PyMongo projection
+                    self.assertTrue(all(set(log) == {'Message', '_id'} for log in found))
+                    found = [{'Message': log['Message']} for log in found]
+                self.assertEqual(found, expected[:12])
+
+    def test_mixed_directions_are_refused(self):
+        with self.assertRaises(ValueError):
+            list(self.logs.find({}).sort([('TimeGenerated', -1), ('_id', 1)]))
+
+    def test_counts_and_lookups(self):
+        self.assertEqual(self.logs.count_documents({}), 40)
+        self.assertEqual(self.logs.count_documents({'ComputerName': 'HOST-1'}, limit=5), 5)
+        self.assertEqual(sorted(self.logs.distinct('ComputerName')), ['HOST-0', 'HOST-1', 'HOST-2'])
+        target = self.stored[33]
+        self.assertEqual(self.logs.find_one({'_id': target['_id']}), target)
+        self.assertEqual(self.logs.delete_many({'ComputerName': 'HOST-0'}).deleted_count, 14)
+        self.assertEqual(self.logs.count_documents({}), 26)
+
+    def test_partition_listing_is_cached(self):
+        listed = self.db.listed
+        for _ in range(5):
+            self.logs.count_documents({})
+        self.assertEqual(self.db.listed, listed + 1)
+        # Creating a partition lists again, so its logs are read at once
+        log = {'TimeGenerated': datetime(2024, 3, 9), 'ComputerName': 'HOST-9'}
+        self.logs.insert_one(log)
+        self.assertEqual(self.logs.find_one({'ComputerName': 'HOST-9'}), log)
+        self.logs.drop(['logs_20240309'])
+        self.assertIsNone(self.logs.find_one({'ComputerName': 'HOST-9'}))
+        # Partitions created by other processes show up once the listing expires
+        self.db['logs_20240310'].insert_one({'TimeGenerated': datetime(2024, 3, 10), 'ComputerName': 'HOST-10'})
+        self.assertIsNone(self.logs.find_one({'ComputerName': 'HOST-10'}))
+        with mock.patch.object(partitions, 'NAMES_TTL', -1):
+            self.assertIsNotNone(self.logs.find_one({'ComputerName': 'HOST-10'}))
+
+    def test_refused_indexes_do_not_refuse_logs(self):
+        def refuse(models):
+            raise OperationFailure('Index build failed')
+
+        self.db['logs_20240309'].create_indexes = refuse
+        log = {'TimeGenerated': datetime(2024, 3, 9), 'ComputerName': 'HOST-9'}
+        with self.assertLogs('apps.logs.partitions', 'WARNING'):
+            self.logs.insert_one(log)
+        self.assertEqual(self.db['logs_20240309'].docs, [log])
+
+    def test_expired_partitions(self):
+        self.assertEqual(self.logs.expired(date(2024, 3, 3)), ['logs_20240301', 'logs_20240302'])
+
+
+class EnsureIndexesTests(TestCase):
+    def test_partitioned_logs_do_not_create_the_legacy_collection(self):
+        db = FakeDatabase()
+        PartitionedLogs(db, DAY, INDEXES['logs']).insert_one({'TimeGenerated': datetime(2024, 3, 1)})
+        created = ensure_indexes(db, ['logs'], partitioned=True)
+        self.assertEqual(list(created), ['logs_20240301'])
+        self.assertNotIn('logs', db.collections)
+        # A legacy collection left from before partitioning is still indexed
+        db['logs'].insert_one({'TimeGenerated': datetime(2024, 2, 1)})
+        self.assertEqual(sorted(ensure_indexes(db, ['logs'], partitioned=True)), ['logs', 'logs_20240301'])
@@ -0,0 +1,81 @@
+"""
+View tests. Unlike the rest of the suite these need the Django stack from
+requirements.txt, and are skipped where it is not installed.
+"""
+import os
+from types import SimpleNamespace
+from unittest import SkipTest, mock
+
+try:
+    import django
+except ImportError:
+    raise SkipTest('Django is not installed')
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'siem_backend.settings')
+django.setup()
+
+from django.test import SimpleTestCase, override_settings  # noqa: E402
+from rest_framework.test import APIRequestFactory, force_authenticate  # noqa: E402
+
+from apps.logs import repository, views  # noqa: E402
+
+from .fakes import FakeDatabase  # noqa: E402
+
+USER = SimpleNamespace(is_authenticated=True, is_active=True, is_staff=False)
+
+
+def call(view, method, path, data=None, **headers):
+    factory = APIRequestFactory()
+    request = getattr(factory, method)(path, data, format='json' if data is not None else None, **headers)
+    force_authenticate(request, user=USER)
+    return view(request)
+
+
+class ViewTests(SimpleTestCase):
+    def setUp(self):
+        self.db = FakeDatabase()
+        patches = [
+            mock.patch.object(repository, 'get_db', return_value=self.db),
+            mock.patch.object(views.tiers, 'count_logs', return_value=(0, False)),
+            mock.patch.object(views.tiers, 'find_logs', return_value=[]),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+
+class CreateLogTests(ViewTests):
+    def test_conditional_get_sees_a_created_log(self):
+        first = call(views.get_logs, 'get', '/api/logs/')
+        self.assertEqual(first.status_code, 200)
+        etag = first['ETag']
+        self.assertEqual(call(views.get_logs, 'get', '/api/logs/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        serializer = mock.Mock(data={'Message': 'created'})
+        serializer.is_valid.return_value = True
+        with mock.patch.object(views, 'SecurityLogSerializer', return_value=serializer), \
+                mock.patch.object(views, 'broadcast_new_log'):
+            self.assertEqual(call(views.create_log, 'post', '/api/logs/create/', {'Message': 'created'}).status_code, 201)
+
+        after = call(views.get_logs, 'get', '/api/logs/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(after.status_code, 200)
+        self.assertNotEqual(after['ETag'], etag)
+
+
+@override_settings(LOG_STORAGE='timeseries')
+class TimeSeriesStorageTests(ViewTests):
+    def test_unindexed_modes_are_refused(self):
+        for params in ({'cursor': ''}, {'tag': 'mimikatz'}, {'search': 'failed logon'}):
+            with self.subTest(params=params):
+                response = call(views.get_logs, 'get', '/api/logs/', params)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('LOG_STORAGE=timeseries', response.data['error'])
+
+    def test_indexed_modes_still_work(self):
+        for params in ({}, {'page': 2, 'EventType': 'Error'}, {'search': 'mimi', 'search_mode': 'regex'}):
+            with self.subTest(params=params):
+                self.assertEqual(call(views.get_logs, 'get', '/api/logs/', params).status_code, 200)
+
+    def test_export_refuses_tag_filters(self):
+        response = call(views.export_logs, 'get', '/api/logs/export/', {'tag': 'mimikatz'})
+        self.assertEqual(response.status_code, 400)
@@ -0,0 +1,163 @@
+"""
+Routes log-list queries across the hot tier (MongoDB) and the cold tier (the
+Parquet archive, read with DuckDB by apps.logs.coldstore).
+
+With LOG_HOT_RETENTION_DAYS set, logs from before the cutoff (midnight that many
+days ago) are read from the archive only and newer ones from MongoDB only, so a
+log is returned once whether or not it has been purged from MongoDB yet. Results
+keep one newest-first order in which every hot log comes before every cold one:
+pages are filled from MongoDB first and topped up from the archive, and cursors
+carry a string _id when they point into the archive.
+"""
+import os
+from datetime import datetime, timedelta
+
+from bson import ObjectId
+from django.conf import settings
+
+from . import repository, rollups
+from .coldstore import ColdStore, prune_bounds
+from .pagination import NEXT, PREV, InvalidCursor, decode_cursor, encode_cursor, keyset_page
+
+# A PREV cursor below every log, to read the hot tier from its oldest end
+_HOT_BOTTOM = {'TimeGenerated': None, '_id': ObjectId('0' * 24)}
+
+
+def cutoff(now=None):
+    """Start of the hot tier, or None when every log is served from MongoDB."""
+    days = settings.LOG_HOT_RETENTION_DAYS
+    if days is None:
+        return None
+    return rollups.truncate((now or datetime.now()) - timedelta(days=days), rollups.DAY)
+
+
+def cold_store():
+    """The archive reader, or None when nothing has been archived."""
+    if not os.path.isdir(settings.LOG_ARCHIVE_DIR):
+        return None
+    return ColdStore(settings.LOG_ARCHIVE_DIR)
+
+
+def hot_query(query, edge):
+    # TimeGenerated is a date or a 'YYYY-MM-DD HH:MM:SS +0300' string
+    recent = {'$or': [
+        {'TimeGenerated': {'$gte': edge}},
+        {'TimeGenerated': {'$gte': edge.strftime('%Y-%m-%d %H:%M:%S')}},
+    ]}
+    return {'$and': [query, recent]} if query else recent
+
+
+def _split(query):
+    """(hot query, cold store, cutoff), with no cold store when `query` cannot reach the archive."""
+    edge = cutoff()
+    if edge is None:
+        return query, None, None
+    first, _, _ = prune_bounds(query)
+    store = cold_store() if first is None or first < edge.date() else None
+    return hot_query(query, edge), store, edge
+
+
+def find_logs(query, skip=0, limit=10, max_time_ms=None):
+    hot, store, edge = _split(query)
+    logs = repository.find_logs(hot, skip=skip, limit=limit, max_time_ms=max_time_ms)
+    if store is None or len(logs) == limit:
+        return logs
+    # The page reaches past the hot tier; skip what the hot tier already covered
+    cold_skip = max(skip - repository.count_logs_cached(hot)[0], 0) if skip else 0
+    return logs + store.find(query, until=edge, skip=cold_skip, limit=limit - len(logs))
+
+
+def count_logs(query, limit=None, max_time_ms=None):
+    """(total, capped) over both tiers, as repository.count_logs_cached."""
+    hot, store, edge = _split(query)
+    total, capped = repository.count_logs_cached(hot, limit=limit, max_time_ms=max_time_ms)
+    if store is None or capped:
+        return total, capped
+    remaining = limit - total + 1 if limit else None
+    cold = store.count(query, until=edge, limit=remaining)
+    if limit and total + cold > limit:
+        return limit, True
+    return total + cold, False
+
+
+def _project(log, projection):
+    if any(projection.values()):
+        return {field: value for field, value in log.items() if field == '_id' or projection.get(field)}
+    return {field: value for field, value in log.items() if field not in projection}
+
+
+def _then_cold(hot_docs, store, query, edge, after, projection, batch_size, limit):
+    sent = 0
+    for doc in hot_docs:
+        sent += 1
+        yield doc
+    if limit and sent >= limit:
+        return
+    for log in store.scan(query, until=edge, after=after, limit=limit - sent if limit else 0,
+                          batch_size=batch_size or 5000):
+        yield _project(log, projection)
+
+
+def iter_logs(query, cursor=None, projection=repository.LOG_PROJECTION, batch_size=None, limit=0, max_time_ms=None):
+    """Every log matching `query` over both tiers, newest first, for exports (see repository.iter_logs)."""
+    hot, store, edge = _split(query)
+    after = None
+    if cursor:
+        value, doc_id, direction = decode_cursor(cursor)
+        if direction != NEXT:
+            raise InvalidCursor('Exports resume from a next cursor')
+        if isinstance(doc_id, str):
+            after = (value, doc_id)
+    if after is None:
+        hot_docs = repository.iter_logs(hot, cursor, projection, batch_size, limit, max_time_ms)
+    else:
+        # The cursor already points into the archive
+        hot_docs = iter(())
+    if store is None:
+        return hot_docs
+    return _then_cold(hot_docs, store, query, edge, after, projection, batch_size, limit)
+
+
+def find_logs_page(query, page_size, cursor=None, max_time_ms=None):
+    """Keyset page over both tiers, newest first; returns (logs, next_cursor, prev_cursor)."""
+    hot, store, edge = _split(query)
+    if store is None:
+        return repository.find_logs_page(hot, page_size, cursor, max_time_ms=max_time_ms)
+
+    value, doc_id, direction = decode_cursor(cursor) if cursor else (None, None, NEXT)
+    collection = repository.logs_collection()
+    projection = repository.LOG_PROJECTION
+
+    if not isinstance(doc_id, str):
+        logs, next_cursor, prev_cursor = keyset_page(collection, hot, page_size, cursor, projection, max_time_ms)
+        cold = []
+        if direction == NEXT and next_cursor is None:
+            # The hot tier ends on this page; continue with the newest archived logs
+            if len(logs) == page_size:
+                if store.count(query, until=edge, limit=1):
+                    next_cursor = encode_cursor(logs[-1], NEXT)
+            else:
+                cold, has_more = store.page(query, page_size - len(logs), until=edge)
+                if cold and not logs and cursor:
+                    prev_cursor = encode_cursor(cold[0], PREV)
+                if cold and has_more:
+                    next_cursor = encode_cursor(cold[-1], NEXT)
+        return [repository.stringify_id(log) for log in logs] + cold, next_cursor, prev_cursor
+
+    logs, has_more = store.page(query, page_size, after=(value, doc_id), direction=direction, until=edge)
+    if direction == NEXT:
+        next_cursor = encode_cursor(logs[-1], NEXT) if logs and has_more else None
+        prev_cursor = encode_cursor(logs[0], PREV) if logs else None
+        return logs, next_cursor, prev_cursor
+
+    # Reading back from the archive into the oldest hot logs
+    prev_cursor = None
+    if len(logs) < page_size:
+        tail, _, prev_cursor = keyset_page(
+            collection, hot, page_size - len(logs), encode_cursor(_HOT_BOTTOM, PREV), projection, max_time_ms
+        )
+        logs = [repository.stringify_id(log) for log in tail] + logs
+    elif has_more or repository.count_logs_cached(hot, limit=1)[0]:
+        prev_cursor = encode_cursor(logs[0], PREV)
+    next_cursor = encode_cursor(logs[-1], NEXT) if logs else None
+    return logs, next_cursor, prev_cursor
@@ -0,0 +1,85 @@
+"""
+MongoDB time-series storage for the logs (LOG_STORAGE=timeseries).
+
+Logs are append-only and arrive roughly in time order, which is what time-series
+collections are built for: MongoDB groups the logs of one ComputerName (the
+meta field) and time span into compressed buckets, which shrinks storage and
+lets time-range scans read whole buckets. The time field must be a native
+date, so TimeGenerated strings ('YYYY-MM-DD HH:MM:SS +0300') are stored as the
+same naive wall-clock datetime the rollups use, and logs without a usable time
+get the time they were stored, keeping the original value in TimeGeneratedRaw.
+
+Queries are unchanged: the API already matches and groups TimeGenerated as a
+date or a string. The indexes are not (see indexes.TIMESERIES_LOG_INDEXES): with
+no (TimeGenerated, _id), KeywordTags or SearchTokens index, the log list refuses
+cursor pages, tag filters and token search with a 400 rather than scanning every
+bucket. Updating or deleting individual logs by _id (backfill_geoip,
+index_search_tokens, archive_logs --purge) needs MongoDB 7.0 or later on a
+time-series collection.
+
+Kept free of Django imports so the Fluent Bit receiver can write time-series logs.
+"""
+from datetime import datetime
+
+from pymongo.errors import CollectionInvalid
+
+from .rollups import log_time
+
+TIME_FIELD = 'TimeGenerated'
+META_FIELD = 'ComputerName'
+RAW_TIME_FIELD = 'TimeGeneratedRaw'
+# Logs of one host arrive seconds apart
+GRANULARITY = 'seconds'
+
+
+def collection_options(granularity=GRANULARITY, expire_after_seconds=None):
+    """Keyword arguments for Database.create_collection that make a time-series log collection."""
+    options = {'timeseries': {'timeField': TIME_FIELD, 'metaField': META_FIELD, 'granularity': granularity}}
+    if expire_after_seconds:
+        options['expireAfterSeconds'] = expire_after_seconds
+    return options
+
+
+def collection_type(db, name):
+    """'timeseries', 'collection', or None when `name` does not exist."""
+    info = next(iter(db.list_collections(filter={'name': name})), None)
+    return info['type'] if info else None
+
+
+def ensure_collection(db, name, **options):
+    """Create `name` as a time-series collection unless it exists; returns its type."""
+    try:
+        db.create_collection(name, **collection_options(**options))
+    except CollectionInvalid:
+        pass
+    return collection_type(db, name)
+
+
+def native_time(log, now=None):
+    """Store TimeGenerated as a date, in place; returns the log."""
+    moment = log_time(log, None)
+    if moment is None:
+        if log.get(TIME_FIELD) is not None:
+            log[RAW_TIME_FIELD] = log[TIME_FIELD]
+        moment = now or datetime.now()
+    log[TIME_FIELD] = moment
+    return log
+
+
+class TimeSeriesLogs:
+    """
+    Wraps the logs collection (or PartitionedLogs) for the receiver: inserts store
+    a copy of the log with a native TimeGenerated, leaving the caller's log as it
+    was apart from its new _id. Everything else goes to the wrapped collection.
+    """
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def insert_one(self, log):
+        result = self.collection.insert_one(native_time(dict(log)))
+        log['_id'] = result.inserted_id
+        return result
+
+    def __getattr__(self, name):
+        return getattr(self.collection, name)
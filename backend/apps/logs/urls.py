@@ -3,11 +3,16 @@ from . import views
 
 urlpatterns = [
     path('', views.get_logs, name='logs_list'),
+    path('export/', views.export_logs, name='logs_export'),
+    path('archive/', views.log_archive, name='logs_archive'),
+    path('archive/<str:day>/<str:device>/', views.download_log_archive, name='logs_archive_download'),
+    path('dashboard/', views.dashboard_widgets, name='dashboard'),
     path('dashboard/stats/', views.get_log_stats, name='dashboard_stats'),
     path('alerts/', views.get_alerts, name='alerts_list'),
     path('alerts/<str:alert_id>/', views.update_alert, name='update_alert'),
     path('alert-rules/', views.get_alert_rules, name='alert_rules_list'),
     path('alert-rules/create/', views.create_alert_rule, name='create_alert_rule'),
+    path('alert-rules/<str:rule_id>/hunt/', views.hunt_alert_rule, name='hunt_alert_rule'),
     path('test-db/', views.test_db_connection, name='test-db-connection'),
     path('analytics/alerts-by-agent/', views.alerts_by_agent, name='alerts-by-agent'),
     path('analytics/alerts-evolution/', views.alerts_evolution, name='alerts-evolution'),
@@ -17,13 +22,20 @@ urlpatterns = [
     path('analytics/os-severity-distribution/', views.os_severity_distribution, name='os-severity-distribution'),
     path('analytics/critical-alerts/', views.critical_alerts, name='critical-alerts'),
     path('analytics/ip-location/<str:ip>/', views.get_ip_location, name='ip-location'),
+    path('analytics/ip-locations/', views.get_ip_locations, name='ip-locations'),
     
     # Analyst Queue endpoints - moved before the log detail view to prevent conflicts
     path('analyst-queue/', views.get_analyst_queue, name='get-analyst-queue'),
     path('analyst-queue/add/', views.add_to_analyst_queue, name='add-to-analyst-queue'),
+    path('analyst-queue/claim/', views.claim_analyst_queue_item, name='claim-analyst-queue-item'),
+    path('analyst-queue/<str:queue_id>/renew/', views.renew_analyst_queue_claim, name='renew-analyst-queue-claim'),
     path('analyst-queue/<str:queue_id>/', views.update_analyst_queue_item, name='update-analyst-queue-item'),
     path('analyst-queue/<str:queue_id>/delete/', views.delete_analyst_queue_item, name='delete-analyst-queue-item'),
     
+    # Keyword tags applied to Message at ingest
+    path('keyword-tags/', views.keyword_tags, name='keyword-tags'),
+    path('keyword-tags/<str:keyword_id>/delete/', views.delete_keyword_tag, name='delete-keyword-tag'),
+    
     # Log detail view - moved to the end to prevent conflicts
     path('<str:log_id>/', views.get_log_detail, name='log_detail'),
 ]
\ No newline at end of file
@@ -7,54 +7,133 @@ from django.utils import timezone
 from datetime import datetime, timedelta
 from drf_yasg.utils import swagger_auto_schema
 from drf_yasg import openapi
-from pymongo import MongoClient
 from django.conf import settings
+from django.http import FileResponse, StreamingHttpResponse
+from pymongo.errors import ExecutionTimeout
+import ipaddress
 import json
 from django.db import connection
 from channels.layers import get_channel_layer
 from asgiref.sync import async_to_sync
-from bson import ObjectId
 from dateutil.parser import parse as parse_date
 import time
 import random
-import geoip2.database
 import os
 
+from . import archive, dashboard, export, repository, rollups, tiers
+from .cache import cached_view, ingest_etag
+from .coldstore import UnsupportedQuery
+from .dashboard import format_critical_alerts, format_evolution, format_os_severity, health_score
 from .models import SecurityLog, AlertRule, Alert
+from .pagination import InvalidCursor
+from .search import build_query as build_search_query, regex_query as search_query_regex, relevance_stages
 from .serializers import (
     SecurityLogSerializer, SecurityLogListSerializer, SecurityLogStatsSerializer,
     AlertRuleSerializer, AlertSerializer, AlertUpdateSerializer, LogFilterSerializer,
-    AnalystQueueSerializer, AnalystQueueUpdateSerializer
+    AnalystQueueSerializer, AnalystQueueUpdateSerializer, KeywordTagSerializer
 )
+from apps.detection import geoip
+from apps.detection.sigma import SIGMA_CONDITION_TYPE, SigmaError, default_cache as sigma_cache
 
-# In-memory cache for dashboard stats
-_dashboard_stats_cache = None
-_dashboard_stats_cache_time = 0
+# Dashboard and analytics responses are shared across workers for this long (see cache.cached_view)
+DASHBOARD_CACHE_SECONDS = 10
+# Cap on addresses per bulk IP location request
+MAX_BULK_IPS = 1000
+# Archiving runs inside the request; longer ranges go through the archive_logs command
+MAX_ARCHIVE_DAYS_PER_REQUEST = 7
+# Why a log-list mode is refused with LOG_STORAGE=timeseries (see indexes.TIMESERIES_LOG_INDEXES)
+TIMESERIES_UNINDEXED = 'Time-series log storage (LOG_STORAGE=timeseries) has no index for {}; {}'
 
-# MongoDB connection for complex queries
-def get_mongo_client():
-    db_config = settings.DATABASES['default']['CLIENT']
-    client = MongoClient(db_config['host'])
-    db = client[settings.DATABASES['default']['NAME']]
-    return db
+
+def _log_query(params):
+    """
+    Build the Mongo filter for the log-list filters in `params` (get_logs and
+    export_logs). Returns (query, max_time_ms); raises ValueError for bad filters.
+    """
+    search = params.get('search')
+    search_mode = params.get('search_mode', 'tokens')
+    if search_mode not in ('tokens', 'regex'):
+        raise ValueError('search_mode must be tokens or regex')
+
+    query = {}
+    max_time_ms = None
+    if search and search_mode == 'regex':
+        # Unanchored regex scans every document, so it only runs on request and under a time cap
+        query.update(search_query_regex(search))
+        max_time_ms = settings.LOG_REGEX_SEARCH_MAX_TIME_MS
+    elif search:
+        if settings.LOG_STORAGE == 'timeseries':
+            raise ValueError(TIMESERIES_UNINDEXED.format('token search', 'use search_mode=regex'))
+        search_query = build_search_query(search)
+        if search_query is None:
+            raise ValueError('Search needs at least one term of two or more characters')
+        query.update(search_query)
+    if params.get('source_ip'):
+        query['SourceIP'] = params['source_ip']
+    if params.get('isp'):
+        isps = params.getlist('isp')
+        if len(isps) > 1:
+            query['SourceISP'] = {'$in': isps}
+        else:
+            query['SourceISP'] = isps[0]
+    if params.get('EventType'):
+        # Handle multiple EventType values
+        event_types = params.getlist('EventType')
+        if len(event_types) > 1:
+            query['EventType'] = {'$in': event_types}
+        else:
+            query['EventType'] = event_types[0]
+    if params.get('tag'):
+        if settings.LOG_STORAGE == 'timeseries':
+            raise ValueError(TIMESERIES_UNINDEXED.format('tag filters', 'use regular storage to filter by tag'))
+        # Tags are set at ingest by the keyword tagger; KeywordTags is a multikey index
+        tags = params.getlist('tag')
+        if len(tags) > 1:
+            query['KeywordTags'] = {'$in': tags}
+        else:
+            query['KeywordTags'] = tags[0]
+    if params.get('Level__gte'):
+        query['Level'] = query.get('Level', {})
+        query['Level']['$gte'] = int(params['Level__gte'])
+    if params.get('Level__lte'):
+        query['Level'] = query.get('Level', {})
+        query['Level']['$lte'] = int(params['Level__lte'])
+
+    # Date filtering
+    time_filter = {}
+    if params.get('start_date'):
+        time_filter['$gte'] = parse_date(params['start_date'])
+    if params.get('end_date'):
+        time_filter['$lte'] = parse_date(params['end_date'])
+    if time_filter:
+        query['TimeGenerated'] = time_filter
+    return query, max_time_ms
 
 @swagger_auto_schema(
     method='get',
     manual_parameters=[
         openapi.Parameter('page', openapi.IN_QUERY, description="Page number", type=openapi.TYPE_INTEGER),
         openapi.Parameter('page_size', openapi.IN_QUERY, description="Page size", type=openapi.TYPE_INTEGER),
+        openapi.Parameter('include_total', openapi.IN_QUERY, description="Count matching logs (default true, false in cursor mode)", type=openapi.TYPE_BOOLEAN),
+        openapi.Parameter('count_limit', openapi.IN_QUERY, description="Stop counting at this many matches and report total_capped", type=openapi.TYPE_INTEGER),
+        openapi.Parameter('cursor', openapi.IN_QUERY, description="Opaque cursor from a previous response's next/prev; pass it empty for the first page. Replaces page", type=openapi.TYPE_STRING),
         openapi.Parameter('start_date', openapi.IN_QUERY, description="Start date (YYYY-MM-DD)", type=openapi.TYPE_STRING),
         openapi.Parameter('end_date', openapi.IN_QUERY, description="End date (YYYY-MM-DD)", type=openapi.TYPE_STRING),
         openapi.Parameter('source_ip', openapi.IN_QUERY, description="Source IP address", type=openapi.TYPE_STRING),
+        openapi.Parameter('isp', openapi.IN_QUERY, description="Source ISP, as set at ingest from the ASN table (repeat for any of several)", type=openapi.TYPE_STRING),
         openapi.Parameter('log_type', openapi.IN_QUERY, description="Log type", type=openapi.TYPE_STRING),
         openapi.Parameter('Level__gte', openapi.IN_QUERY, description="Level greater than or equal to", type=openapi.TYPE_INTEGER),
         openapi.Parameter('Level__lte', openapi.IN_QUERY, description="Level less than or equal to", type=openapi.TYPE_INTEGER),
-        openapi.Parameter('search', openapi.IN_QUERY, description="Search term", type=openapi.TYPE_STRING),
+        openapi.Parameter('search', openapi.IN_QUERY, description='Search terms: word, prefix*, "phrase", -excluded', type=openapi.TYPE_STRING),
+        openapi.Parameter('search_mode', openapi.IN_QUERY, description="tokens (default, indexed) or regex (unindexed, time-capped)", type=openapi.TYPE_STRING),
+        openapi.Parameter('sort', openapi.IN_QUERY, description="time (default) or relevance (token search with page numbers only)", type=openapi.TYPE_STRING),
+        openapi.Parameter('tag', openapi.IN_QUERY, description="Keyword tag id (repeat for any of several)", type=openapi.TYPE_STRING),
     ],
     responses={200: SecurityLogListSerializer(many=True)}
 )
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
+@ingest_etag
 def get_logs(request):
     """
     Get security logs with filtering and pagination using PyMongo directly.
@@ -64,68 +143,192 @@ def get_logs(request):
         page_size = int(request.GET.get('page_size', 10))
         skip = (page - 1) * page_size
 
-        # Connect to MongoDB
-        client = MongoClient(settings.DATABASES['logs']['CLIENT']['host'])
-        db = client[settings.DATABASES['logs']['NAME']]
-        logs_collection = db['logs']
+        cursor_mode = 'cursor' in request.GET
+        if cursor_mode and settings.LOG_STORAGE == 'timeseries':
+            return Response({'error': TIMESERIES_UNINDEXED.format('cursor pages', 'use page numbers')}, status=400)
+        search = request.GET.get('search')
+        by_relevance = request.GET.get('sort') == 'relevance'
+        if by_relevance and (not search or request.GET.get('search_mode', 'tokens') != 'tokens' or cursor_mode):
+            return Response({'error': 'sort=relevance needs a token search and page numbers'}, status=400)
 
-        # Build filter
-        query = {}
-        if request.GET.get('search'):
-            query['$or'] = [
-                {'Message': {'$regex': request.GET['search'], '$options': 'i'}},
-                {'ComputerName': {'$regex': request.GET['search'], '$options': 'i'}},
-                {'SourceIP': {'$regex': request.GET['search'], '$options': 'i'}},
-            ]
-        if request.GET.get('source_ip'):
-            query['SourceIP'] = request.GET['source_ip']
-        if request.GET.get('EventType'):
-            # Handle multiple EventType values
-            event_types = request.GET.getlist('EventType')
-            if len(event_types) > 1:
-                query['EventType'] = {'$in': event_types}
-            else:
-                query['EventType'] = event_types[0]
-        if request.GET.get('Level__gte'):
-            query['Level'] = query.get('Level', {})
-            query['Level']['$gte'] = int(request.GET['Level__gte'])
-        if request.GET.get('Level__lte'):
-            query['Level'] = query.get('Level', {})
-            query['Level']['$lte'] = int(request.GET['Level__lte'])
-
-        # Date filtering
-        time_filter = {}
-        if request.GET.get('start_date'):
-            time_filter['$gte'] = parse_date(request.GET['start_date'])
-        if request.GET.get('end_date'):
-            time_filter['$lte'] = parse_date(request.GET['end_date'])
-        if time_filter:
-            query['TimeGenerated'] = time_filter
-
-        total = logs_collection.count_documents(query)
-        logs = list(
-            logs_collection.find(query)
-            .sort('TimeGenerated', -1)
-            .skip(skip)
-            .limit(page_size)
-        )
+        try:
+            query, max_time_ms = _log_query(request.GET)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=400)
+
+        # The total is often costlier than the page itself, so it can be skipped or capped
+        include_total = request.GET.get('include_total', 'false' if cursor_mode else 'true').lower() not in ('false', '0', 'no')
+        count_limit = int(request.GET['count_limit']) if request.GET.get('count_limit') else None
+        total, total_capped = None, False
+        if include_total:
+            total, total_capped = tiers.count_logs(query, limit=count_limit, max_time_ms=max_time_ms)
+
+        if cursor_mode:
+            # Keyset pagination: each page seeks on (TimeGenerated, _id) instead of skipping
+            try:
+                logs, next_cursor, prev_cursor = tiers.find_logs_page(
+                    query, page_size, request.GET['cursor'], max_time_ms=max_time_ms
+                )
+            except InvalidCursor as e:
+                return Response({'error': str(e)}, status=400)
+            return Response({
+                'logs': logs,
+                'total': total,
+                'total_capped': total_capped,
+                'next': next_cursor,
+                'prev': prev_cursor,
+                'page_size': page_size
+            })
 
-        # Convert ObjectId to string
-        for log in logs:
-            log['_id'] = str(log['_id'])
+        if by_relevance:
+            logs = repository.rank_logs(query, relevance_stages(search), skip=skip, limit=page_size)
+        else:
+            logs = tiers.find_logs(query, skip=skip, limit=page_size, max_time_ms=max_time_ms)
 
         return Response({
             'logs': logs,
             'total': total,
+            'total_capped': total_capped,
             'page': page,
             'page_size': page_size
         })
+    except ExecutionTimeout:
+        return Response({'error': 'Regex search timed out; narrow the filters or use token search'}, status=400)
+    except UnsupportedQuery as e:
+        return Response({'error': str(e)}, status=400)
     except Exception as e:
         import traceback
         print('ERROR in get_logs:', e)
         traceback.print_exc()
         return Response({'error': str(e)}, status=500)
 
+@swagger_auto_schema(
+    method='get',
+    manual_parameters=[
+        openapi.Parameter('output', openapi.IN_QUERY, description="ndjson (default) or csv", type=openapi.TYPE_STRING),
+        openapi.Parameter('gzip', openapi.IN_QUERY, description="Gzip the file", type=openapi.TYPE_BOOLEAN),
+        openapi.Parameter('fields', openapi.IN_QUERY, description="Comma-separated fields to export (default: all for ndjson, the usual columns for csv)", type=openapi.TYPE_STRING),
+        openapi.Parameter('limit', openapi.IN_QUERY, description="Stop after this many logs", type=openapi.TYPE_INTEGER),
+        openapi.Parameter('after', openapi.IN_QUERY, description="Resume after the log with this _id (the last row received)", type=openapi.TYPE_STRING),
+        openapi.Parameter('cursor', openapi.IN_QUERY, description="Resume from a next cursor of the log list", type=openapi.TYPE_STRING),
+    ],
+    responses={200: "NDJSON or CSV file of the logs matching the log-list filters, newest first"}
+)
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def export_logs(request):
+    """
+    Stream every log matching the get_logs filters as a file, newest first.
+    """
+    output = request.GET.get('output', export.NDJSON)
+    if output not in export.CONTENT_TYPES:
+        return Response({'error': 'output must be ndjson or csv'}, status=400)
+    compress = request.GET.get('gzip', 'false').lower() in ('true', '1', 'yes')
+    fields = [field.strip() for field in request.GET.get('fields', '').split(',') if field.strip()]
+    try:
+        query, max_time_ms = _log_query(request.GET)
+        limit = int(request.GET.get('limit', 0))
+    except ValueError as e:
+        return Response({'error': str(e)}, status=400)
+
+    cursor = request.GET.get('cursor')
+    if request.GET.get('after'):
+        cursor = repository.log_cursor_after(request.GET['after'])
+        if cursor is None:
+            return Response({'error': 'No log with that _id to resume after'}, status=400)
+    projection = dict.fromkeys(fields, 1) if fields else repository.LOG_PROJECTION
+    try:
+        # Rows stream straight off the cursor; nothing is read until the response is iterated
+        docs = tiers.iter_logs(
+            query, cursor, projection, batch_size=export.BATCH_SIZE, limit=limit, max_time_ms=max_time_ms
+        )
+    except InvalidCursor as e:
+        return Response({'error': str(e)}, status=400)
+
+    filename = f"logs-{datetime.now():%Y%m%d-%H%M%S}.{output}" + ('.gz' if compress else '')
+    response = StreamingHttpResponse(
+        export.stream(docs, output, fields, compress),
+        content_type='application/gzip' if compress else f'{export.CONTENT_TYPES[output]}; charset=utf-8',
+    )
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+@swagger_auto_schema(
+    method='get',
+    manual_parameters=[
+        openapi.Parameter('start_date', openapi.IN_QUERY, description="First day (YYYY-MM-DD)", type=openapi.TYPE_STRING),
+        openapi.Parameter('end_date', openapi.IN_QUERY, description="Last day (YYYY-MM-DD)", type=openapi.TYPE_STRING),
+    ],
+    responses={200: "Archived partitions: [{day, device, files, bytes}]"}
+)
+@swagger_auto_schema(
+    method='post',
+    request_body=openapi.Schema(
+        type=openapi.TYPE_OBJECT,
+        properties={
+            'start': openapi.Schema(type=openapi.TYPE_STRING, description="First day (YYYY-MM-DD)"),
+            'end': openapi.Schema(type=openapi.TYPE_STRING, description="Last day, inclusive (default: start)"),
+            'device': openapi.Schema(type=openapi.TYPE_STRING, description="Only archive this ComputerName"),
+        },
+        required=['start'],
+    ),
+    responses={201: "Partitions written: [{day, device, rows}]"}
+)
+@api_view(['GET', 'POST'])
+@permission_classes([permissions.IsAuthenticated])
+def log_archive(request):
+    """
+    List the Parquet archive partitions, or (staff only) archive a range of days.
+    Longer ranges are archived with the archive_logs command.
+    """
+    try:
+        if request.method == 'GET':
+            start = parse_date(request.GET['start_date']).date() if request.GET.get('start_date') else None
+            end = parse_date(request.GET['end_date']).date() if request.GET.get('end_date') else None
+            return Response(archive.list_partitions(settings.LOG_ARCHIVE_DIR, start, end))
+
+        if not request.user.is_staff:
+            return Response({'error': 'Only staff can write the archive'}, status=403)
+        start = datetime.strptime(request.data['start'], archive.DAY_FORMAT).date()
+        end = datetime.strptime(request.data['end'], archive.DAY_FORMAT).date() if request.data.get('end') else start
+        if not timedelta(0) <= end - start < timedelta(days=MAX_ARCHIVE_DAYS_PER_REQUEST):
+            return Response({'error': f'end must be on or after start, at most {MAX_ARCHIVE_DAYS_PER_REQUEST} days in all'}, status=400)
+    except (KeyError, ValueError) as e:
+        return Response({'error': f'Invalid dates: {e}'}, status=400)
+
+    written = archive.archive_logs(
+        repository.logs_collection(), settings.LOG_ARCHIVE_DIR, start, end, device=request.data.get('device')
+    )
+    return Response([{key: partition[key] for key in ('day', 'device', 'rows')} for partition in written], status=201)
+
+@swagger_auto_schema(
+    method='get',
+    responses={
+        200: "Parquet file of one archived day and device, or a zip of its part files when it has several",
+        404: "No such partition",
+    }
+)
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def download_log_archive(request, day, device):
+    """
+    Download one archived partition: its Parquet file, or a zip of every part file
+    once later runs have appended to it.
+    """
+    directory = archive.partition_dir(settings.LOG_ARCHIVE_DIR, archive.partition_value(day), device)
+    files = archive.partition_files(directory)
+    if not files:
+        return Response({'error': 'No archive for that day and device'}, status=404)
+    filename = f'logs-{archive.partition_value(day)}-{archive.partition_value(device)}'
+    if len(files) == 1:
+        return FileResponse(
+            open(os.path.join(directory, files[0]), 'rb'), as_attachment=True,
+            filename=f'{filename}.parquet', content_type='application/vnd.apache.parquet',
+        )
+    response = StreamingHttpResponse(archive.zipped(directory, files), content_type='application/zip')
+    response['Content-Disposition'] = f'attachment; filename="{filename}.zip"'
+    return response
+
 @swagger_auto_schema(
     method='get',
     responses={200: SecurityLogSerializer}
@@ -137,15 +340,9 @@ def get_log_detail(request, log_id):
     Get detailed information about a specific log using PyMongo directly.
     """
     try:
-        # Connect to MongoDB
-        client = MongoClient(settings.DATABASES['logs']['CLIENT']['host'])
-        db = client[settings.DATABASES['logs']['NAME']]
-        logs_collection = db['logs']
-
-        log = logs_collection.find_one({'_id': ObjectId(log_id)})
+        log = repository.get_log(log_id)
         if not log:
             return Response({'error': 'Log not found'}, status=404)
-        log['_id'] = str(log['_id'])
         return Response(log)
     except Exception as e:
         import traceback
@@ -159,29 +356,20 @@ def get_log_detail(request, log_id):
 )
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
+@ingest_etag
+@cached_view(DASHBOARD_CACHE_SECONDS)
 def get_log_stats(request):
     """
     Get log statistics for dashboard cards (cached for 10 seconds)
     """
-    global _dashboard_stats_cache, _dashboard_stats_cache_time
     try:
-        now = time.time()
-        # Serve from cache if not expired
-        if _dashboard_stats_cache and now - _dashboard_stats_cache_time < 10:
-            return Response(_dashboard_stats_cache)
-
-        # Connect to MongoDB
-        client = MongoClient(settings.DATABASES['logs']['CLIENT']['host'])
-        db = client[settings.DATABASES['logs']['NAME']]
-        logs_collection = db['logs'] if 'logs' in db.list_collection_names() else None
-
         # Total Security Events
-        total_events = logs_collection.count_documents({}) if logs_collection is not None else 0
+        total_events = repository.count_logs()
 
         # Critical Alerts (logs with EventType 'FailureAudit' or Level >= 13)
         critical_alerts = 0
-        if logs_collection is not None:
-            critical_alerts = logs_collection.count_documents({
+        if total_events > 0:
+            critical_alerts = repository.count_logs({
                 '$or': [
                     {'EventType': 'FailureAudit'},
                     {'Level': {'$gte': 13}}
@@ -190,9 +378,9 @@ def get_log_stats(request):
 
         # Active Threats (critical records from the last hour)
         active_threats = 0
-        if logs_collection is not None:
+        if total_events > 0:
             one_hour_ago = datetime.now() - timedelta(hours=1)
-            active_threats = logs_collection.count_documents({
+            active_threats = repository.count_logs({
                 '$and': [
                     {
                         '$or': [
@@ -211,9 +399,9 @@ def get_log_stats(request):
 
         # System Health: Weighted calculation based on event types
         system_health = 0
-        if logs_collection is not None and total_events > 0:
+        if total_events > 0:
             # Count events by type
-            event_counts = logs_collection.aggregate([
+            event_counts = repository.aggregate_logs([
                 {
                     '$group': {
                         '_id': '$EventType',
@@ -222,32 +410,7 @@ def get_log_stats(request):
                 }
             ])
             
-            # Convert to dictionary for easier access
-            event_type_counts = {doc['_id']: doc['count'] for doc in event_counts}
-            
-            # Calculate weighted health score
-            # SuccessAudit and Information are positive indicators
-            # Error and Warning are negative indicators
-            # FailureAudit is a strong negative indicator
-            positive_events = (
-                event_type_counts.get('SuccessAudit', 0) +
-                event_type_counts.get('Information', 0) +
-                event_type_counts.get('Success', 0)
-            )
-            
-            negative_events = (
-                event_type_counts.get('Error', 0) * 1.5 +  # Weight errors more heavily
-                event_type_counts.get('Warning', 0) * 2 +  # Weight warnings even more
-                event_type_counts.get('FailureAudit', 0) * 3  # Weight failures most heavily
-            )
-            
-            # Calculate health percentage
-            if (positive_events + negative_events) > 0:
-                system_health = round(
-                    (positive_events / (positive_events + negative_events)) * 100
-                )
-            else:
-                system_health = 100  # If no events, system is considered healthy
+            system_health = health_score({doc['_id']: doc['count'] for doc in event_counts})
 
         stats = {
             'total_events': total_events,
@@ -255,9 +418,6 @@ def get_log_stats(request):
             'active_threats': active_threats,
             'system_health': system_health
         }
-        # Update cache
-        _dashboard_stats_cache = stats
-        _dashboard_stats_cache_time = now
         return Response(stats)
     except Exception as e:
         import traceback
@@ -366,6 +526,54 @@ def create_alert_rule(request):
         return Response(serializer.data, status=status.HTTP_201_CREATED)
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+@swagger_auto_schema(
+    method='get',
+    manual_parameters=[
+        openapi.Parameter('page', openapi.IN_QUERY, description="Page number", type=openapi.TYPE_INTEGER),
+        openapi.Parameter('page_size', openapi.IN_QUERY, description="Page size", type=openapi.TYPE_INTEGER),
+    ],
+    responses={200: SecurityLogListSerializer(many=True)}
+)
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def hunt_alert_rule(request, rule_id):
+    """
+    Run an imported Sigma rule over historical logs
+    """
+    try:
+        page = int(request.GET.get('page', 1))
+        page_size = int(request.GET.get('page_size', 10))
+        skip = (page - 1) * page_size
+
+        rule_doc = repository.get_alert_rule(rule_id)
+        if not rule_doc:
+            return Response({'error': 'Alert rule not found'}, status=404)
+        conditions = rule_doc.get('conditions') or {}
+        if conditions.get('type') != SIGMA_CONDITION_TYPE:
+            return Response({'error': 'Only Sigma rules can be hunted'}, status=400)
+
+        try:
+            # Compiled rules are cached by hash, so repeated hunts skip YAML parsing
+            query = sigma_cache.compile(conditions['yaml']).mongo_query()
+        except SigmaError as e:
+            return Response({'error': str(e)}, status=400)
+
+        total = repository.count_logs(query)
+        logs = repository.find_logs(query, skip=skip, limit=page_size)
+
+        return Response({
+            'rule': rule_doc.get('name'),
+            'logs': logs,
+            'total': total,
+            'page': page,
+            'page_size': page_size
+        })
+    except Exception as e:
+        import traceback
+        print('ERROR in hunt_alert_rule:', e)
+        traceback.print_exc()
+        return Response({'error': str(e)}, status=500)
+
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def test_db_connection(request):
@@ -416,29 +624,58 @@ def create_log(request):
     serializer = SecurityLogSerializer(data=request.data)
     if serializer.is_valid():
         log = serializer.save()
+        # ETags derive from the watermark; without a bump, clients keep getting 304 for the old lists
+        repository.bump_ingest_watermark()
         broadcast_new_log(log)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+@swagger_auto_schema(
+    method='get',
+    manual_parameters=[
+        openapi.Parameter('widgets', openapi.IN_QUERY, description="Comma-separated widgets to compute (default: all of " + ', '.join(dashboard.WIDGETS) + ")", type=openapi.TYPE_STRING),
+        openapi.Parameter('days', openapi.IN_QUERY, description=f"Window in days (default {dashboard.DEFAULT_DAYS}, max {dashboard.MAX_DAYS}, or {dashboard.ARCHIVE_MAX_DAYS} with a log archive)", type=openapi.TYPE_INTEGER),
+    ],
+    responses={200: openapi.Response(description="Dashboard widgets keyed by name")}
+)
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@ingest_etag
+@cached_view(DASHBOARD_CACHE_SECONDS)
+def dashboard_widgets(request):
+    """
+    Return every dashboard widget from a single $facet over the hour rollups (cached for 10 seconds)
+    """
+    try:
+        widgets = request.GET.get('widgets')
+        widgets = tuple(w.strip() for w in widgets.split(',') if w.strip()) if widgets else dashboard.WIDGETS
+        unknown = [w for w in widgets if w not in dashboard.WIDGETS]
+        if unknown:
+            return Response({'error': f"Unknown widgets: {', '.join(unknown)}"}, status=400)
+        days = min(max(int(request.GET.get('days', dashboard.DEFAULT_DAYS)), 1), dashboard.max_days())
+
+        return Response(dashboard.build(widgets, days=days))
+    except Exception as e:
+        import traceback
+        print('ERROR in dashboard_widgets:', e)
+        traceback.print_exc()
+        return Response({'error': str(e)}, status=500)
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+@ingest_etag
+@cached_view(DASHBOARD_CACHE_SECONDS)
 def alerts_by_agent(request):
     """
     Return a list of agents (devices) and their log counts, grouped by ComputerName in logs.
     """
     try:
-        # Connect to MongoDB
-        client = MongoClient(settings.DATABASES['logs']['CLIENT']['host'])
-        db = client[settings.DATABASES['logs']['NAME']]
-        logs_collection = db['logs'] if 'logs' in db.list_collection_names() else None
-        if logs_collection is None:
-            return Response([])
         pipeline = [
-            {"$group": {"_id": "$ComputerName", "count": {"$sum": 1}}},
+            {"$group": {"_id": "$ComputerName", "count": {"$sum": "$count"}}},
             {"$project": {"agent": {"$ifNull": ["$_id", "Unknown"]}, "count": 1, "_id": 0}},
             {"$sort": {"count": -1}}
         ]
-        results = list(logs_collection.aggregate(pipeline))
+        results = repository.aggregate_rollups(rollups.DAY, pipeline)
         return Response(results)
     except Exception as e:
         import traceback
@@ -452,18 +689,14 @@ def alerts_by_agent(request):
 )
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
+@ingest_etag
 def get_computer_names(request):
     """
     Get list of unique computer names from logs
     """
     try:
-        # Connect to MongoDB
-        client = MongoClient(settings.DATABASES['logs']['CLIENT']['host'])
-        db = client[settings.DATABASES['logs']['NAME']]
-        logs_collection = db['logs']
-
         # Get unique computer names
-        computer_names = logs_collection.distinct('ComputerName')
+        computer_names = repository.computer_names()
         
         # Filter out None/empty values and sort
         computer_names = sorted([name for name in computer_names if name])
@@ -481,63 +714,27 @@ def get_computer_names(request):
 )
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@ingest_etag
+@cached_view(DASHBOARD_CACHE_SECONDS)
 def get_critical_logs_by_device(request):
     """
     Get count of critical logs by device for the last 24 hours
     """
     try:
-        # Connect to MongoDB
-        client = MongoClient(settings.DATABASES['logs']['CLIENT']['host'])
-        db = client[settings.DATABASES['logs']['NAME']]
-        logs_collection = db['logs']
+        # Hour rollups since the start of the hour 24 hours ago
+        since = rollups.truncate(datetime.now() - timedelta(hours=24), rollups.HOUR)
 
-        # Calculate timestamp for 24 hours ago
-        twenty_four_hours_ago = datetime.now() - timedelta(hours=24)
-        twenty_four_hours_ago_str = twenty_four_hours_ago.strftime('%Y-%m-%d %H:%M:%S +0300')
-
-        # Pipeline to get critical logs count by device
         pipeline = [
-            # First convert string dates to proper date objects
-            {
-                "$addFields": {
-                    "parsedTime": {
-                        "$dateFromString": {
-                            "dateString": "$TimeGenerated",
-                            "onError": "$TimeGenerated"  # Keep original if parsing fails
-                        }
-                    }
-                }
-            },
-            # Match logs from the last 24 hours
-            {
-                "$match": {
-                    "$or": [
-                        {"parsedTime": {"$gte": twenty_four_hours_ago}},
-                        {"TimeGenerated": {"$gte": twenty_four_hours_ago_str}}
-                    ]
-                }
-            },
+            {"$match": {"bucket": {"$gte": since}}},
             # Group by ComputerName and count critical/high events
             {
                 "$group": {
                     "_id": "$ComputerName",
                     "critical": {
-                        "$sum": {
-                            "$cond": [
-                                {"$eq": ["$EventType", "FailureAudit"]},
-                                1,
-                                0
-                            ]
-                        }
+                        "$sum": {"$cond": [{"$eq": ["$EventType", "FailureAudit"]}, "$count", 0]}
                     },
                     "high": {
-                        "$sum": {
-                            "$cond": [
-                                {"$eq": ["$EventType", "Warning"]},
-                                1,
-                                0
-                            ]
-                        }
+                        "$sum": {"$cond": [{"$eq": ["$EventType", "Warning"]}, "$count", 0]}
                     }
                 }
             },
@@ -552,7 +749,7 @@ def get_critical_logs_by_device(request):
             }
         ]
 
-        results = list(logs_collection.aggregate(pipeline))
+        results = repository.aggregate_rollups(rollups.HOUR, pipeline)
         
         # Convert to dictionary format for easier frontend consumption
         formatted_results = {}
@@ -575,6 +772,8 @@ def get_critical_logs_by_device(request):
 )
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@ingest_etag
+@cached_view(DASHBOARD_CACHE_SECONDS)
 def alerts_evolution(request):
     """
     Return daily counts of logs grouped by severity for the Area Chart for the last 7 days.
@@ -585,60 +784,19 @@ def alerts_evolution(request):
     - SuccessAudit, Information, Success -> low
     """
     try:
-        # Connect to MongoDB
-        client = MongoClient(settings.DATABASES['logs']['CLIENT']['host'])
-        db = client[settings.DATABASES['logs']['NAME']]
-        logs_collection = db['logs'] if 'logs' in db.list_collection_names() else None
-        if logs_collection is None:
-            return Response([])
 
-        # Calculate timestamp for 7 days ago
-        seven_days_ago = datetime.now() - timedelta(days=7)
+        # Day rollups from the day 7 days ago; severity is derived from EventType at ingest:
+        # FailureAudit -> critical, Warning -> high, Error -> moderate, anything else -> low
+        since = rollups.truncate(datetime.now() - timedelta(days=7), rollups.DAY)
 
-        # Aggregate logs by day and severity
         pipeline = [
-            # First convert string dates to proper date objects
-            {"$addFields": {
-                "parsedTime": {
-                    "$dateFromString": {
-                        "dateString": "$TimeGenerated",
-                        "onError": "$TimeGenerated"  # Keep original if parsing fails
-                    }
-                }
-            }},
-            # Match only logs from the last 7 days
-            {"$match": {
-                "$or": [
-                    {"parsedTime": {"$gte": seven_days_ago}},
-                    {"TimeGenerated": {"$gte": seven_days_ago.isoformat()}}
-                ]
-            }},
-            # Map EventType to severity
-            {"$addFields": {
-                "severity": {
-                    "$switch": {
-                        "branches": [
-                            {"case": {"$eq": ["$EventType", "FailureAudit"]}, "then": "critical"},
-                            {"case": {"$eq": ["$EventType", "Warning"]}, "then": "high"},
-                            {"case": {"$eq": ["$EventType", "Error"]}, "then": "moderate"}
-                        ],
-                        "default": "low"  # SuccessAudit, Information, Success -> low
-                    }
-                },
-                "date": {
-                    "$cond": {
-                        "if": {"$eq": [{"$type": "$parsedTime"}, "date"]},
-                        "then": {"$dateToString": {"format": "%Y-%m-%d", "date": "$parsedTime"}},
-                        "else": {"$substr": ["$TimeGenerated", 0, 10]}  # Extract YYYY-MM-DD from string
-                    }
-                }
-            }},
+            {"$match": {"bucket": {"$gte": since}}},
             {"$group": {
                 "_id": {
-                    "date": "$date",
+                    "date": {"$dateToString": {"format": "%Y-%m-%d", "date": "$bucket"}},
                     "severity": "$severity"
                 },
-                "count": {"$sum": 1}
+                "count": {"$sum": "$count"}
             }},
             {"$group": {
                 "_id": "$_id.date",
@@ -646,15 +804,10 @@ def alerts_evolution(request):
             }},
             {"$sort": {"_id": 1}}
         ]
-        results = list(logs_collection.aggregate(pipeline))
+        results = repository.aggregate_rollups(rollups.DAY, pipeline)
         
         # Format results as [{date, critical, high, moderate, low}]
-        formatted = []
-        for entry in results:
-            row = {"date": entry["_id"], "critical": 0, "high": 0, "moderate": 0, "low": 0}
-            for c in entry["counts"]:
-                    row[c["severity"]] = c["count"]
-            formatted.append(row)
+        formatted = format_evolution(results)
         return Response(formatted)
     except Exception as e:
         import traceback
@@ -668,37 +821,27 @@ def alerts_evolution(request):
 )
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@ingest_etag
+@cached_view(DASHBOARD_CACHE_SECONDS)
 def mitre_attack(request):
     """
     Return MITRE ATT&CK distribution data based on Technique field.
     """
     try:
-        # Connect to MongoDB
-        client = MongoClient(settings.DATABASES['logs']['CLIENT']['host'])
-        db = client[settings.DATABASES['logs']['NAME']]
-        logs_collection = db['logs'] if 'logs' in db.list_collection_names() else None
-        if logs_collection is None:
-            return Response([])
 
         # Pipeline to get MITRE ATT&CK distribution
         pipeline = [
-            # Match only logs with valid Technique values
+            # Rollups only keep Technique values in MITRE format (e.g., T1098 or T1110.001)
             {
                 "$match": {
-                    "Technique": {
-                        "$ne": None,
-                        "$ne": "",
-                        "$ne": "null",
-                        "$exists": True,
-                        "$regex": "^T\\d+(\\.\\d+)?$"  # Match MITRE technique format (e.g., T1098 or T1110.001)
-                    }
+                    "Technique": {"$ne": None}
                 }
             },
             # Group by Technique and count
             {
                 "$group": {
                     "_id": "$Technique",
-                    "value": {"$sum": 1}
+                    "value": {"$sum": "$count"}
                 }
             },
             # Format the output
@@ -716,7 +859,7 @@ def mitre_attack(request):
         ]
 
         try:
-            results = list(logs_collection.aggregate(pipeline))
+            results = repository.aggregate_rollups(rollups.DAY, pipeline)
             return Response(results)
         except Exception as e:
             print(f"Error in MongoDB aggregation: {str(e)}")
@@ -734,29 +877,17 @@ def mitre_attack(request):
 )
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@ingest_etag
+@cached_view(DASHBOARD_CACHE_SECONDS)
 def os_severity_distribution(request):
     """
     Return severity distribution by operating system.
     Records without an OperatingSystem field are considered as Windows 11 Home.
     """
     try:
-        # Connect to MongoDB
-        client = MongoClient(settings.DATABASES['logs']['CLIENT']['host'])
-        db = client[settings.DATABASES['logs']['NAME']]
-        logs_collection = db['logs'] if 'logs' in db.list_collection_names() else None
-        if logs_collection is None:
-            return Response([])
-
-        # Pipeline to get OS severity distribution
+
+        # Pipeline to get OS severity distribution; rollups already default a missing OS
         pipeline = [
-            # Add a field for OS, defaulting to Windows 11 Home if not present
-            {
-                "$addFields": {
-                    "OperatingSystem": {
-                        "$ifNull": ["$OperatingSystem", "Windows 11 Home"]
-                    }
-                }
-            },
             # Group by OS and EventType
             {
                 "$group": {
@@ -764,7 +895,7 @@ def os_severity_distribution(request):
                         "os": "$OperatingSystem",
                         "level": "$EventType"
                     },
-                    "count": {"$sum": 1}
+                    "count": {"$sum": "$count"}
                 }
             },
             # Sort by OS and count
@@ -777,42 +908,10 @@ def os_severity_distribution(request):
         ]
 
         try:
-            results = list(logs_collection.aggregate(pipeline))
+            results = repository.aggregate_rollups(rollups.DAY, pipeline)
             
-            # Format results for frontend
-            formatted_results = {}
-            for result in results:
-                os_name = result['_id']['os']
-                if os_name not in formatted_results:
-                    formatted_results[os_name] = {
-                        'critical': 0,
-                        'high': 0,
-                        'moderate': 0,
-                        'low': 0
-                    }
-                
-                # Map EventType to severity
-                event_type = result['_id']['level']
-                if event_type == 'FailureAudit':
-                    formatted_results[os_name]['critical'] += result['count']
-                elif event_type == 'Warning':
-                    formatted_results[os_name]['high'] += result['count']
-                elif event_type == 'Error':
-                    formatted_results[os_name]['moderate'] += result['count']
-                elif event_type in ['SuccessAudit', 'Information', 'Success']:
-                    formatted_results[os_name]['low'] += result['count']
-
-            # Convert to array format
-            final_results = [
-                {
-                    'os': os_name,
-                    'critical': data['critical'],
-                    'high': data['high'],
-                    'moderate': data['moderate'],
-                    'low': data['low']
-                }
-                for os_name, data in formatted_results.items()
-            ]
+            # Map EventType to severity per OS
+            final_results = format_os_severity(results)
 
             return Response(final_results)
         except Exception as e:
@@ -831,17 +930,13 @@ def os_severity_distribution(request):
 )
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
+@ingest_etag
+@cached_view(DASHBOARD_CACHE_SECONDS)
 def critical_alerts(request):
     """
     Return latest 3-5 critical alerts.
     """
     try:
-        # Connect to MongoDB
-        client = MongoClient(settings.DATABASES['logs']['CLIENT']['host'])
-        db = client[settings.DATABASES['logs']['NAME']]
-        logs_collection = db['logs'] if 'logs' in db.list_collection_names() else None
-        if logs_collection is None:
-            return Response([])
 
         # Pipeline to get latest critical alerts
         pipeline = [
@@ -879,20 +974,11 @@ def critical_alerts(request):
 
         try:
             # Execute the pipeline
-            results = list(logs_collection.aggregate(pipeline))
+            results = repository.aggregate_logs(pipeline)
             print(f"Debug - Found {len(results)} latest critical alerts")
             
             # Format results for frontend
-            formatted_results = []
-            for result in results:
-                formatted_result = {
-                    'id': str(result.get('_id')),
-                    'timestamp': result.get('TimeGenerated'),
-                    'source': result.get('ComputerName', 'Unknown'),
-                    'type': result.get('OperatingSystem', 'Windows 11 Home'),
-                    'source_ip': result.get('SourceIP', '')
-                }
-                formatted_results.append(formatted_result)
+            formatted_results = format_critical_alerts(results)
 
             return Response(formatted_results)
         except Exception as e:
@@ -908,103 +994,95 @@ def critical_alerts(request):
 @api_view(['GET'])
 @swagger_auto_schema(
     operation_description="Get location information for an IP address",
-    responses={200: "Location information for the IP address"}
+    responses={
+        200: "Location information for the IP address",
+        400: "Not a valid IP address",
+        404: "Address not in the GeoIP database (including private and reserved addresses)",
+    }
 )
 def get_ip_location(request, ip):
     try:
-        # Initialize the reader with the database path
-        db_path = os.path.join(settings.GEOIP_PATH, 'GeoLite2-City.mmdb')
-        print(f"Using GeoIP database at: {db_path}")  # Debug print
-        reader = geoip2.database.Reader(db_path)
-        
-        # Look up the IP
-        response = reader.city(ip)
-        
-        # Return the location data
-        return Response({
-            'ip': ip,
-            'country': response.country.name,
-            'city': response.city.name,
-            'latitude': response.location.latitude,
-            'longitude': response.location.longitude
-        })
-    except geoip2.errors.AddressNotFoundError:
-        return Response({'error': f'IP address {ip} not found in database'}, status=404)
+        ipaddress.ip_address(ip)
+    except ValueError:
+        return Response({'error': f'{ip} is not a valid IP address'}, status=400)
+    try:
+        # Shared memory-mapped reader with an LRU of recent results (apps.detection.geoip);
+        # private and reserved addresses are not in the database either
+        location = geoip.lookup(ip)
+        if location is None:
+            return Response({'error': f'IP address {ip} not found in database'}, status=404)
+        return Response({'ip': ip, **location._asdict()})
     except Exception as e:
         print(f"Error looking up IP {ip}: {str(e)}")
         return Response({'error': str(e)}, status=400)
-    finally:
-        if 'reader' in locals():
-            reader.close()
+
+@swagger_auto_schema(
+    method='post',
+    operation_description="Get location information for several IP addresses",
+    request_body=openapi.Schema(
+        type=openapi.TYPE_OBJECT,
+        properties={'ips': openapi.Schema(type=openapi.TYPE_ARRAY, items=openapi.Schema(type=openapi.TYPE_STRING))},
+        required=['ips'],
+    ),
+    responses={200: "Location per IP address, null where it is unknown, private or invalid"}
+)
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def get_ip_locations(request):
+    ips = request.data.get('ips')
+    if not isinstance(ips, list) or not all(isinstance(ip, str) for ip in ips):
+        return Response({'error': 'ips must be a list of IP address strings'}, status=400)
+    if len(ips) > MAX_BULK_IPS:
+        return Response({'error': f'At most {MAX_BULK_IPS} IP addresses per request'}, status=400)
+    try:
+        locations = geoip.lookup_many(ips)
+    except Exception as e:
+        print(f"Error looking up IPs: {str(e)}")
+        return Response({'error': str(e)}, status=400)
+    return Response({ip: location._asdict() if location else None for ip, location in locations.items()})
 
 @swagger_auto_schema(
     method='get',
+    manual_parameters=[
+        openapi.Parameter('status', openapi.IN_QUERY, description="Status (repeat for any of several)", type=openapi.TYPE_STRING),
+        openapi.Parameter('priority', openapi.IN_QUERY, description="Priority (repeat for any of several)", type=openapi.TYPE_STRING),
+        openapi.Parameter('cursor', openapi.IN_QUERY, description="Opaque cursor from a previous response's next/prev; pass it empty for the first page. Without it every matching item is returned as a list", type=openapi.TYPE_STRING),
+        openapi.Parameter('page_size', openapi.IN_QUERY, description="Page size in cursor mode (default 50)", type=openapi.TYPE_INTEGER),
+    ],
     responses={200: AnalystQueueSerializer(many=True)}
 )
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
 def get_analyst_queue(request):
     """
-    Get all items in the analyst queue
+    Get items in the analyst queue, newest first, with their logs attached
     """
     try:
-        print("Starting get_analyst_queue view")
-        # Connect to MongoDB
-        client = MongoClient(settings.DATABASES['logs']['CLIENT']['host'])
-        print(f"Connected to MongoDB at {settings.DATABASES['logs']['CLIENT']['host']}")
-        db = client[settings.DATABASES['logs']['NAME']]
-        print(f"Using database: {settings.DATABASES['logs']['NAME']}")
-        
-        # Create collection if it doesn't exist
-        if 'analysts_queue' not in db.list_collection_names():
-            print("Creating analysts_queue collection")
-            db.create_collection('analysts_queue')
-        
-        queue_collection = db['analysts_queue']
-        print("Got queue collection")
-
-        # Get queue items
-        queue_items = list(queue_collection.find().sort('added_at', -1))
-        print(f"Found {len(queue_items)} queue items")
-        
-        # Convert ObjectId to string and get log details
-        formatted_items = []
-        for item in queue_items:
+        query = {}
+        for field in ('status', 'priority'):
+            values = request.GET.getlist(field)
+            if len(values) > 1:
+                query[field] = {'$in': values}
+            elif values:
+                query[field] = values[0]
+
+        if 'cursor' in request.GET:
+            page_size = int(request.GET.get('page_size', 50))
             try:
-                # Convert ObjectId to string for _id and log_id
-                item['_id'] = str(item['_id'])
-                if 'log_id' in item:
-                    item['log_id'] = str(item['log_id'])
-                
-                # Get user details from the users collection
-                try:
-                    user = db['users'].find_one({'username': item['added_by']})
-                    if user:
-                        item['added_by'] = f"{user.get('first_name', '')} {user.get('last_name', '')}".strip() or item['added_by']
-                except Exception as e:
-                    print(f"Error getting user details for {item['added_by']}: {str(e)}")
-                
-                # Get the original log details if log_id exists
-                if 'log_id' in item:
-                    try:
-                        log = db['logs'].find_one({'_id': ObjectId(item['log_id'])})
-                        if log:
-                            log['_id'] = str(log['_id'])
-                            item['log_details'] = log
-                    except Exception as e:
-                        print(f"Error getting log details for item {item['_id']}: {str(e)}")
-                        item['log_details'] = None
-                
-                formatted_items.append(item)
-            except Exception as e:
-                print(f"Error formatting queue item {item.get('_id')}: {str(e)}")
-                continue
-
-        return Response(formatted_items)
+                items, next_cursor, prev_cursor = repository.find_queue_page(query, page_size, request.GET['cursor'])
+            except InvalidCursor as e:
+                return Response({'error': str(e)}, status=400)
+            return Response({
+                'items': repository.with_queue_details(items),
+                'next': next_cursor,
+                'prev': prev_cursor,
+                'page_size': page_size
+            })
+
+        return Response(repository.with_queue_details(repository.list_queue_items(query)))
     except Exception as e:
         import traceback
         print('ERROR in get_analyst_queue:', e)
-        print('Full traceback:')
         traceback.print_exc()
         return Response({'error': str(e)}, status=500)
 
@@ -1020,19 +1098,9 @@ def add_to_analyst_queue(request):
     Add a log to the analyst queue
     """
     try:
-        # Connect to MongoDB
-        client = MongoClient(settings.DATABASES['logs']['CLIENT']['host'])
-        db = client[settings.DATABASES['logs']['NAME']]
-        
-        # Create collection if it doesn't exist
-        if 'analysts_queue' not in db.list_collection_names():
-            db.create_collection('analysts_queue')
-            
-        queue_collection = db['analysts_queue']
-
         # Get user details
-        user = db['users'].find_one({'username': request.user.username})
-        added_by = f"{user.get('first_name', '')} {user.get('last_name', '')}".strip() if user else request.user.username
+        user = repository.find_user(request.user.username)
+        added_by = repository.display_name(user, request.user.username)
 
         # Create queue item
         queue_item = {
@@ -1045,8 +1113,7 @@ def add_to_analyst_queue(request):
         }
 
         # Insert into queue
-        result = queue_collection.insert_one(queue_item)
-        queue_item['_id'] = str(result.inserted_id)
+        queue_item['_id'] = str(repository.insert_queue_item(queue_item))
 
         return Response(queue_item, status=201)
     except Exception as e:
@@ -1067,29 +1134,17 @@ def update_analyst_queue_item(request, queue_id):
     Update an item in the analyst queue
     """
     try:
-        # Connect to MongoDB
-        client = MongoClient(settings.DATABASES['logs']['CLIENT']['host'])
-        db = client[settings.DATABASES['logs']['NAME']]
-        queue_collection = db['analysts_queue']
-
         # Update queue item
         update_data = request.data.copy()
         if update_data.get('status') == 'resolved':
             update_data['resolved_at'] = datetime.now()
             update_data['resolved_by'] = request.user.username
 
-        result = queue_collection.update_one(
-            {'_id': ObjectId(queue_id)},
-            {'$set': update_data}
-        )
-
-        if result.modified_count == 0:
+        # One round trip, and the item returned is the one this update produced
+        updated_item = repository.update_queue_item(queue_id, update_data)
+        if updated_item is None:
             return Response({'error': 'Queue item not found'}, status=404)
 
-        # Get updated item
-        updated_item = queue_collection.find_one({'_id': ObjectId(queue_id)})
-        updated_item['_id'] = str(updated_item['_id'])
-
         return Response(updated_item)
     except Exception as e:
         import traceback
@@ -1097,6 +1152,51 @@ def update_analyst_queue_item(request, queue_id):
         traceback.print_exc()
         return Response({'error': str(e)}, status=500)
 
+@swagger_auto_schema(
+    method='post',
+    manual_parameters=[
+        openapi.Parameter('priority', openapi.IN_QUERY, description="Only claim items of this priority (repeat for any of several)", type=openapi.TYPE_STRING),
+    ],
+    responses={200: AnalystQueueSerializer, 204: None}
+)
+@api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated])
+def claim_analyst_queue_item(request):
+    """
+    Claim the highest-priority, oldest pending item for the current user
+    """
+    try:
+        item = repository.claim_next_queue_item(request.user.username, request.GET.getlist('priority'))
+        if item is None:
+            return Response(status=204)
+        return Response(repository.with_queue_details([item])[0])
+    except Exception as e:
+        import traceback
+        print('ERROR in claim_analyst_queue_item:', e)
+        traceback.print_exc()
+        return Response({'error': str(e)}, status=500)
+
+@swagger_auto_schema(
+    method='post',
+    responses={200: AnalystQueueSerializer, 409: 'Claim expired or held by someone else'}
+)
+@api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated])
+def renew_analyst_queue_claim(request, queue_id):
+    """
+    Extend the lease on a claimed item so it is not returned to the queue
+    """
+    try:
+        item = repository.renew_queue_claim(queue_id, request.user.username)
+        if item is None:
+            return Response({'error': 'Claim expired or held by someone else'}, status=409)
+        return Response(item)
+    except Exception as e:
+        import traceback
+        print('ERROR in renew_analyst_queue_claim:', e)
+        traceback.print_exc()
+        return Response({'error': str(e)}, status=500)
+
 @swagger_auto_schema(
     method='delete',
     responses={204: None}
@@ -1108,15 +1208,8 @@ def delete_analyst_queue_item(request, queue_id):
     Delete an item from the analyst queue
     """
     try:
-        # Connect to MongoDB
-        client = MongoClient(settings.DATABASES['logs']['CLIENT']['host'])
-        db = client[settings.DATABASES['logs']['NAME']]
-        queue_collection = db['analysts_queue']
-
         # Delete the queue item
-        result = queue_collection.delete_one({'_id': ObjectId(queue_id)})
-
-        if result.deleted_count == 0:
+        if not repository.delete_queue_item(queue_id):
             return Response({'error': 'Queue item not found'}, status=404)
 
         return Response(status=204)
@@ -1124,4 +1217,62 @@ def delete_analyst_queue_item(request, queue_id):
         import traceback
         print('ERROR in delete_analyst_queue_item:', e)
         traceback.print_exc()
+        return Response({'error': str(e)}, status=500)
+
+@swagger_auto_schema(
+    method='get',
+    responses={200: KeywordTagSerializer(many=True)}
+)
+@swagger_auto_schema(
+    method='post',
+    request_body=KeywordTagSerializer,
+    responses={201: KeywordTagSerializer}
+)
+@api_view(['GET', 'POST'])
+@permission_classes([permissions.IsAuthenticated])
+def keyword_tags(request):
+    """
+    List or add keywords that the log receiver tags in Message at ingest
+    """
+    try:
+        if request.method == 'GET':
+            return Response(repository.list_keywords())
+
+        serializer = KeywordTagSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        keyword = dict(serializer.validated_data)
+        if repository.keyword_exists(keyword['keyword'], keyword['tag']):
+            return Response({'error': 'Keyword already exists for this tag'}, status=status.HTTP_400_BAD_REQUEST)
+        keyword['created_by'] = request.user.username
+        keyword['created_at'] = datetime.now()
+
+        keyword['_id'] = str(repository.insert_keyword(keyword))
+        return Response(keyword, status=status.HTTP_201_CREATED)
+    except Exception as e:
+        import traceback
+        print('ERROR in keyword_tags:', e)
+        traceback.print_exc()
+        return Response({'error': str(e)}, status=500)
+
+@swagger_auto_schema(
+    method='delete',
+    responses={204: None}
+)
+@api_view(['DELETE'])
+@permission_classes([permissions.IsAuthenticated])
+def delete_keyword_tag(request, keyword_id):
+    """
+    Remove a keyword from the ingest tagger
+    """
+    try:
+        if not repository.delete_keyword(keyword_id):
+            return Response({'error': 'Keyword not found'}, status=404)
+
+        return Response(status=204)
+    except Exception as e:
+        import traceback
+        print('ERROR in delete_keyword_tag:', e)
+        traceback.print_exc()
         return Response({'error': str(e)}, status=500)
\ No newline at end of file
@@ -0,0 +1,22 @@
+"""
+Ingest watermark: a counter bumped whenever logs or their rollups are written.
+
+Responses computed from the logs only change when the watermark does, so the
+API derives ETags from it and answers conditional GETs without touching the logs.
+Kept free of Django imports so the Fluent Bit receiver can bump it.
+"""
+STATE_COLLECTION = 'ingest_state'
+WATERMARK_ID = 'logs'
+
+
+def bump(db):
+    db[STATE_COLLECTION].update_one(
+        {'_id': WATERMARK_ID},
+        {'$inc': {'seq': 1}, '$currentDate': {'updated_at': True}},
+        upsert=True,
+    )
+
+
+def read(db):
+    doc = db[STATE_COLLECTION].find_one({'_id': WATERMARK_ID}, {'seq': 1})
+    return doc['seq'] if doc else 0
@@ -1,4 +1,5 @@
 import os
+from corsheaders.defaults import default_headers
 from datetime import timedelta
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -22,6 +23,7 @@ INSTALLED_APPS = [
     'apps.authentication.apps.AuthenticationConfig',
     'apps.logs',
     'apps.analytics',
+    'apps.detection',
     'channels',
 ]
 
@@ -84,6 +86,64 @@ DATABASES = {
 
 DATABASE_ROUTERS = ['apps.logs.db_router.LogsRouter']
 
+# Shared PyMongo client used by the logs views (see apps/logs/mongo.py)
+MONGO_CLIENT_OPTIONS = {
+    'maxPoolSize': int(os.getenv('MONGO_MAX_POOL_SIZE', '50')),
+    'serverSelectionTimeoutMS': int(os.getenv('MONGO_SERVER_SELECTION_TIMEOUT_MS', '5000')),
+    'socketTimeoutMS': int(os.getenv('MONGO_SOCKET_TIMEOUT_MS', '30000')),
+    'compressors': os.getenv('MONGO_COMPRESSORS', 'zlib'),
+}
+
+# Shared cache for dashboard and analytics views (apps/logs/cache.py). Use Redis when
+# several worker processes serve the API so they share entries and recomputation locks
+if os.getenv('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_URL'),
+        }
+    }
+elif os.getenv('DJANGO_CACHE_DIR'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.getenv('DJANGO_CACHE_DIR'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Parquet archive of the logs, partitioned by day and device (apps/logs/archive.py)
+LOG_ARCHIVE_DIR = os.getenv('LOG_ARCHIVE_DIR', os.path.join(BASE_DIR, 'archive'))
+# Days of logs served from MongoDB; older logs are read from the archive with DuckDB
+# (apps/logs/tiers.py). Unset keeps every query in MongoDB. Archive each day before it
+# leaves this window (archive_logs --purge), or its logs drop out of the log list.
+LOG_HOT_RETENTION_DAYS = int(os.getenv('LOG_HOT_RETENTION_DAYS')) if os.getenv('LOG_HOT_RETENTION_DAYS') else None
+
+# 'day' or 'week' stores logs in one collection per period (apps/logs/partitions.py);
+# must match the receiver's LOG_PARTITIONING. Unset keeps the single logs collection.
+LOG_PARTITIONING = os.getenv('LOG_PARTITIONING') or None
+# Threads querying log partitions concurrently
+LOG_PARTITION_WORKERS = int(os.getenv('LOG_PARTITION_WORKERS', '8'))
+# 'timeseries' when logs live in MongoDB time-series collections (apps/logs/timeseries.py,
+# migrate_logs_timeseries); must match the receiver's LOG_STORAGE. Time-series collections
+# cannot hold the (TimeGenerated, _id), KeywordTags and SearchTokens indexes, so the log list
+# then answers 400 to cursor pages, tag= filters and token search (search_mode=regex still works)
+LOG_STORAGE = os.getenv('LOG_STORAGE', 'regular')
+
+# Cap on server time for the unindexed search_mode=regex log search
+LOG_REGEX_SEARCH_MAX_TIME_MS = int(os.getenv('LOG_REGEX_SEARCH_MAX_TIME_MS', '5000'))
+
+# Parsed Sigma rules, written by import_sigma_rules and read by the Fluent Bit receiver
+SIGMA_CACHE_PATH = os.getenv('SIGMA_CACHE_PATH', os.path.join(
+    os.getenv('DETECTION_STATE_DIR', os.path.join(os.path.dirname(BASE_DIR), 'fluentbit', 'state')),
+    'sigma-cache.pkl',
+))
+
 # REST Framework Configuration
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
@@ -124,6 +184,9 @@ CORS_ALLOWED_ORIGINS = [
 # Add CORS settings for development
 CORS_ALLOW_ALL_ORIGINS = True  # Only for development
 CORS_ALLOW_CREDENTIALS = True
+# Conditional GETs on the logs and analytics endpoints (apps.logs.cache.ingest_etag)
+CORS_ALLOW_HEADERS = list(default_headers) + ['if-none-match']
+CORS_EXPOSE_HEADERS = ['ETag']
 
 # Swagger Configuration
 SWAGGER_SETTINGS = {
@@ -181,6 +244,7 @@ AUTHENTICATION_BACKENDS = [
 CONTENT_TYPES = False
 
 # GeoIP2 settings
-GEOIP_PATH = os.path.join(BASE_DIR, 'GeoLite2-City_20250528')
+# Directory holding GeoLite2-City.mmdb; GEOIP_CITY_DB, when set, points at the file itself
+GEOIP_PATH = os.getenv('GEOIP_PATH', os.path.join(BASE_DIR, 'GeoLite2-City_20250528'))
 MAXMIND_ACCOUNT_ID = '1175967'
 MAXMIND_LICENSE_KEY = os.getenv('MAXMIND_LICENSE_KEY', '')  # Get from environment variable
\ No newline at end of file
@@ -9,8 +9,37 @@ from datetime import datetime
 import asyncio
 from collections import deque
 import traceback
+import os
+import sys
 from bson import ObjectId
 
+# Detection and enrichment modules live in the Django backend and have no Django dependency
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend'))
+from apps.detection.asn import ASNEnricher
+from apps.detection.geoip import GeoIPEnricher
+from apps.detection.intel import ThreatIntelMatcher
+from apps.detection.keywords import KEYWORDS_COLLECTION, KeywordTagger
+from apps.detection.rarity import RarityDetector
+from apps.detection.sigma import SigmaCache, SigmaDetector
+from apps.detection.travel import ImpossibleTravelDetector
+from apps.logs.indexes import ensure_indexes, log_indexes
+from apps.logs import timeseries
+from apps.logs.partitions import PartitionedLogs
+from apps.logs.rollups import COLLECTIONS as ROLLUP_COLLECTIONS, RollupWriter
+from apps.logs.search import SearchTokenizer
+from apps.logs.watermark import bump as bump_watermark
+
+# Where detectors persist their state between restarts
+STATE_DIR = os.getenv('DETECTION_STATE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'state'))
+# Directory of CSV/STIX threat intel feeds, reloaded when the files change
+THREAT_INTEL_DIR = os.getenv('THREAT_INTEL_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'intel'))
+# ASN/ISP range table: a GeoLite2-ASN .mmdb or a CSV of networks, reloaded when the file changes
+ASN_DB = os.getenv('ASN_DB', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'asn', 'GeoLite2-ASN.mmdb'))
+# 'day' or 'week' writes logs to one collection per period (logs_YYYYMMDD); same setting as the API
+LOG_PARTITIONING = os.getenv('LOG_PARTITIONING') or None
+# 'timeseries' stores logs in MongoDB time-series collections with native TimeGenerated dates
+LOG_STORAGE = os.getenv('LOG_STORAGE', 'regular')
+
 # Configure logging with more detailed format
 logging.basicConfig(
     level=logging.INFO,
@@ -35,21 +64,112 @@ try:
     logger.info("Attempting to connect to MongoDB...")
     client = MongoClient("mongodb://localhost:27017/")
     db = client["log_anomaly"]
-    logs_collection = db["logs"]
+    storage_options = timeseries.collection_options() if LOG_STORAGE == "timeseries" else None
+    if LOG_PARTITIONING:
+        logs_collection = PartitionedLogs(
+            db, LOG_PARTITIONING, log_indexes(LOG_STORAGE), collection_options=storage_options
+        )
+    else:
+        logs_collection = db["logs"]
+        if storage_options and timeseries.ensure_collection(db, "logs") != "timeseries":
+            logger.warning("LOG_STORAGE=timeseries but logs is a regular collection; run migrate_logs_timeseries")
+    if storage_options:
+        logs_collection = timeseries.TimeSeriesLogs(logs_collection)
+    alerts_collection = db["alerts"]
+    keywords_collection = db[KEYWORDS_COLLECTION]
+    alert_rules_collection = db["alert_rules"]
     # Test the connection
     client.admin.command('ping')
     logger.info("Connected to MongoDB successfully.")
 except Exception as e:
     logs_collection = None
+    alerts_collection = None
+    keywords_collection = None
+    alert_rules_collection = None
     logger.error(f"MongoDB connection failed: {e}")
     logger.error("Please ensure MongoDB is running on localhost:27017")
 
+# Indexes behind /api/logs/ filters, keyword tags and keyset pagination, and the rollup upsert keys.
+# Best effort, one collection at a time: logs are stored whether or not their indexes could be built
+if logs_collection is not None:
+    for index_collection in ["logs", *ROLLUP_COLLECTIONS.values()]:
+        try:
+            ensure_indexes(db, [index_collection], partitioned=bool(LOG_PARTITIONING))
+        except Exception as e:
+            logger.warning(f"Could not create the {index_collection} indexes: {e}")
+
 # Store recent logs in memory (last 1000 logs)
 recent_logs = deque(maxlen=1000)
 
 # Queue for new logs
 log_queue = asyncio.Queue()
 
+threat_intel = ThreatIntelMatcher(THREAT_INTEL_DIR)
+keyword_tagger = KeywordTagger()
+# Parsed Sigma rules are cached on disk by rule hash, shared with import_sigma_rules, so loads skip YAML parsing
+sigma_detector = SigmaDetector(SigmaCache(os.getenv('SIGMA_CACHE_PATH', os.path.join(STATE_DIR, 'sigma-cache.pkl'))))
+
+# Enrichers add fields to each log before it is stored
+enrichers = [
+    threat_intel,
+    keyword_tagger,
+    GeoIPEnricher(),
+    SearchTokenizer(),
+]
+# Batch enrichers resolve a whole request's logs in one call, before the per-log enrichers
+asn_enricher = ASNEnricher(ASN_DB)
+batch_enrichers = [
+    asn_enricher,
+]
+
+# Dashboard counts per minute/hour/day, flushed to the rollup collections in batches
+rollup_writer = RollupWriter()
+ROLLUP_FLUSH_SECONDS = 5
+
+# Streaming detectors run on every ingested log
+detectors = [
+    ImpossibleTravelDetector(),
+    threat_intel,
+    sigma_detector,
+    RarityDetector(state_path=os.path.join(STATE_DIR, 'rarity.pkl')),
+]
+
+def run_enrichers(log):
+    """Run each enricher on a log before it is stored"""
+    for enricher in enrichers:
+        try:
+            enricher.enrich(log)
+        except Exception as e:
+            logger.error(f"Enricher {type(enricher).__name__} failed: {e}")
+
+def run_batch_enrichers(logs):
+    """Run each batch enricher over all the logs of a request before they are stored"""
+    for enricher in batch_enrichers:
+        try:
+            enricher.enrich_many(logs)
+        except Exception as e:
+            logger.error(f"Enricher {type(enricher).__name__} failed: {e}")
+
+def run_detectors(log):
+    """Run each streaming detector on a log and store any alerts raised"""
+    alerts = []
+    for detector in detectors:
+        try:
+            alerts.extend(detector.observe(log))
+        except Exception as e:
+            logger.error(f"Detector {detector.rule_name} failed: {e}")
+    if not alerts:
+        return
+    if alerts_collection is None:
+        for alert in alerts:
+            logger.warning(f"Alert raised: {alert['title']}")
+    else:
+        try:
+            alerts_collection.insert_many(alerts)
+            logger.info(f"Inserted {len(alerts)} alerts into MongoDB")
+        except Exception as e:
+            logger.error(f"Failed to store {len(alerts)} alerts: {e}")
+
 async def log_generator():
     """Generator function to yield new logs as they arrive"""
     try:
@@ -67,6 +187,89 @@ async def log_generator():
         logger.error(f"Traceback: {traceback.format_exc()}")
         yield f"data: {json.dumps({'error': str(e)})}\n\n"
 
+def persist_detectors(force=False):
+    """Save detector state for detectors that keep any"""
+    for detector in detectors:
+        if hasattr(detector, 'persist'):
+            try:
+                detector.persist(force=force)
+            except Exception as e:
+                logger.error(f"Failed to persist {detector.rule_name} state: {e}")
+
+def flush_rollups():
+    if logs_collection is None:
+        return
+    try:
+        if rollup_writer.flush(logs_collection.database):
+            # Dashboards read the rollups, so their cached ETags are now stale
+            bump_watermark(logs_collection.database)
+    except Exception as e:
+        logger.error(f"Rollup flush failed: {e}")
+
+async def flush_rollups_periodically():
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(ROLLUP_FLUSH_SECONDS)
+        await loop.run_in_executor(None, flush_rollups)
+
+async def persist_detectors_periodically():
+    # Pickling the filters takes a while once they grow, so it runs off the event loop
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(60)
+        await loop.run_in_executor(None, persist_detectors)
+
+async def reload_threat_intel_periodically():
+    # Feeds are parsed on a worker thread; ingest keeps using the old index until the swap
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(60)
+        try:
+            await loop.run_in_executor(None, threat_intel.reload_if_changed)
+        except Exception as e:
+            logger.error(f"Threat intel reload failed: {e}")
+        try:
+            await loop.run_in_executor(None, asn_enricher.reload_if_changed)
+        except Exception as e:
+            logger.error(f"ASN table reload failed: {e}")
+
+async def reload_keywords_periodically():
+    # Keywords are managed through the Django API; recompile when the list changes
+    if keywords_collection is None:
+        return
+    loop = asyncio.get_running_loop()
+    while True:
+        try:
+            await loop.run_in_executor(None, keyword_tagger.load_from_collection, keywords_collection)
+        except Exception as e:
+            logger.error(f"Keyword reload failed: {e}")
+        await asyncio.sleep(60)
+
+async def reload_sigma_rules_periodically():
+    # Sigma rules are imported into alert_rules by the import_sigma_rules command
+    if alert_rules_collection is None:
+        return
+    loop = asyncio.get_running_loop()
+    while True:
+        try:
+            await loop.run_in_executor(None, sigma_detector.load_from_collection, alert_rules_collection)
+        except Exception as e:
+            logger.error(f"Sigma rule reload failed: {e}")
+        await asyncio.sleep(60)
+
+@app.on_event("startup")
+async def start_background_tasks():
+    asyncio.create_task(persist_detectors_periodically())
+    asyncio.create_task(reload_threat_intel_periodically())
+    asyncio.create_task(reload_keywords_periodically())
+    asyncio.create_task(reload_sigma_rules_periodically())
+    asyncio.create_task(flush_rollups_periodically())
+
+@app.on_event("shutdown")
+async def save_detector_state():
+    persist_detectors(force=True)
+    flush_rollups()
+
 @app.get("/")
 async def root():
     """Health check endpoint"""
@@ -142,7 +345,8 @@ async def receive_logs(request: Request):
             # Single log object
             logs_to_process = [data] if isinstance(data, dict) else [{"raw_message": str(data)}]
 
-        # Process each log
+        # Format every log first, so batch enrichers see the whole request at once
+        formatted_logs = []
         for log_data in logs_to_process:
             # Format the log data for display
             formatted_log = {
@@ -151,6 +355,8 @@ async def receive_logs(request: Request):
                 'EventType': log_data.get('EventType', 'N/A'),
                 'SourceName': log_data.get('SourceName', 'N/A'),
                 'ComputerName': log_data.get('ComputerName', 'N/A'),
+                'AccountName': log_data.get('AccountName', 'N/A'),
+                'SourceIP': log_data.get('SourceIP', 'N/A'),
                 'Channel': log_data.get('Channel', 'N/A'),
                 'Message': log_data.get('Message', 'N/A'),
                 'timestamp': log_data.get('timestamp', datetime.utcnow().isoformat()),
@@ -161,6 +367,13 @@ async def receive_logs(request: Request):
             # Clean up the message by removing extra newlines and spaces
             if formatted_log['Message']:
                 formatted_log['Message'] = formatted_log['Message'].replace('\r\n', ' ').strip()
+            formatted_logs.append(formatted_log)
+
+        run_batch_enrichers(formatted_logs)
+
+        # Process each log
+        for formatted_log in formatted_logs:
+            run_enrichers(formatted_log)
 
             if logs_collection is None:
                 logger.warning("MongoDB not available, logs will be printed to console")
@@ -169,10 +382,17 @@ async def receive_logs(request: Request):
                 # Store in MongoDB
                 result = logs_collection.insert_one(formatted_log)
                 logger.info(f"Inserted {result.inserted_id} into MongoDB")
+                rollup_writer.add(formatted_log)
+
+            run_detectors(formatted_log)
             
             # Add to queue for SSE
             await log_queue.put(formatted_log)
             logger.info(f"Added log to queue: {formatted_log}")
+
+        if logs_collection is not None and logs_to_process:
+            # One bump per batch invalidates the API's ETags for the logs just stored
+            bump_watermark(logs_collection.database)
         
         return JSONResponse(status_code=200, content={"message": f"Processed {len(logs_to_process)} logs successfully"})
         
@@ -184,6 +404,13 @@ async def receive_logs(request: Request):
         logger.error(f"Traceback: {traceback.format_exc()}")
         raise HTTPException(status_code=500, detail=f"Error processing log: {str(e)}")
 
+@app.post("/intel/reload")
+async def reload_threat_intel():
+    """Reload threat intel feeds now instead of waiting for the periodic check"""
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(None, threat_intel.reload)
+    return {"indicators": len(threat_intel.index)}
+
 @app.get("/logs/count")
 async def get_log_count():
     """Get the count of logs in the database"""